@@ -0,0 +1,73 @@
+"""Compare two benchmark result files written by `python -m benchmarks.run`.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.1]
+
+Exits with status 1 if any stage got slower, or used more peak memory in this
+process or in its worker processes, by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def _key(result: dict) -> tuple:
+    return result["stage"], json.dumps(result["spec"], sort_keys=True)
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list[str]:
+    """Print a comparison table and return descriptions of regressions"""
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"{baseline['commit'][:10]} -> {candidate['commit'][:10]}")
+    for result in candidate["results"]:
+        previous = base.get(_key(result))
+        if previous is None:
+            continue
+        spec = result["spec"]
+        label = (
+            f"{result['stage']:<16} {spec['particles']}x{spec['days']} "
+            f"{spec['dtype']} chunks={spec['chunks']}"
+        )
+        time_ratio = result["seconds_min"] / max(previous["seconds_min"], 1e-9)
+        memory_ratio = result["peak_mb"] / max(previous["peak_mb"], 1e-9)
+        line = f"{label:<60} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}"
+        if time_ratio > 1 + threshold:
+            regressions.append(f"{label} is {time_ratio:.2f}x slower")
+        if memory_ratio > 1 + threshold:
+            regressions.append(f"{label} uses {memory_ratio:.2f}x more memory")
+        # Results of stages without workers, or of older runs, have no worker peak
+        workers, previous_workers = (
+            result.get("workers_peak_mb"),
+            previous.get("workers_peak_mb"),
+        )
+        if workers and previous_workers:
+            workers_ratio = workers / previous_workers
+            line += f"  workers memory x{workers_ratio:.2f}"
+            if workers_ratio > 1 + threshold:
+                regressions.append(
+                    f"{label} workers use {workers_ratio:.2f}x more memory"
+                )
+        print(line)
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = compare(baseline, candidate, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+"""Check the import time of model-viz modules against the start-up budget.
+
+Usage:
+    python -m benchmarks.imports [--repeats 5]
+
+Every module is imported in a fresh interpreter with `-X importtime` and its
+cumulative import time, the median over the repeats, is compared to its budget.
+The third-party packages every module needs are imported beforehand, so budgets
+cover the import time of model-viz itself, which their import time would drown.
+Importing a module must also leave the heavy plotting libraries unimported, they
+are only loaded once a plot is created. Exits with status 1 if a budget is exceeded.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Imported before the module timed, their import time is not budgeted
+BASELINE_MODULES = ("numpy", "h5py", "plotly.graph_objects")
+# Import time budget of every module in ms, including everything it imports but the
+# baseline modules, about twice the time it takes
+IMPORT_BUDGET_MS = {
+    "model_viz": 10,
+    "model_viz.config": 30,
+    "model_viz.aggregation": 40,
+    "model_viz.hdf_ops": 75,
+    "model_viz.cache": 125,
+    "model_viz.convert": 100,
+    "model_viz.plotting": 200,
+}
+# Loaded by the plotters on first use only
+DEFERRED_MODULES = ("pandas", "xarray", "plotly.express", "datashader")
+
+
+def import_time_ms(module: str) -> tuple[float, list[str]]:
+    """Import `module` in a fresh interpreter, after the baseline modules.
+
+    Returns:
+        tuple: Cumulative import time of `module` in ms and the deferred modules
+        the import loaded
+    """
+    check = (
+        f"import {', '.join(BASELINE_MODULES)}; import sys, {module}; "
+        f"print(*[m for m in {DEFERRED_MODULES} if m in sys.modules])"
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines read "import time: self [us] | cumulative | imported package"
+    for line in process.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000, process.stdout.split()
+    raise RuntimeError(f"{module} was not imported, it may have been imported already")
+
+
+def check_budgets(repeats: int) -> list[str]:
+    """Print the import time of every module and return descriptions of overruns"""
+    overruns = []
+    for module, budget_ms in IMPORT_BUDGET_MS.items():
+        runs = [import_time_ms(module) for _ in range(repeats)]
+        median_ms = statistics.median(ms for ms, _ in runs)
+        loaded = sorted({name for _, names in runs for name in names})
+        print(f"{module:<24} {median_ms:8.1f}ms  budget {budget_ms}ms")
+        if median_ms > budget_ms:
+            overruns.append(f"{module} takes {median_ms:.1f}ms, over {budget_ms}ms")
+        if loaded:
+            overruns.append(f"{module} imports {', '.join(loaded)}")
+    return overruns
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.imports",
+        description="Check the import time of model-viz modules",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+    overruns = check_budgets(args.repeats)
+    for overrun in overruns:
+        print(f"Over budget: {overrun}", file=sys.stderr)
+    sys.exit(1 if overruns else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
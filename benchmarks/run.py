@@ -0,0 +1,281 @@
+"""Benchmark the plotting and I/O hot paths on synthetic model output.
+
+Usage:
+    python -m benchmarks.run --particles 10000 100000 --days 365 -o results.json
+
+Every combination of the given particle counts, time horizons, group counts,
+dtypes and chunkings is written to a temporary file and every stage is timed on
+it. Peak memory is measured in a separate, traced run so that tracing does not
+skew the timings: the peak traced by tracemalloc in this process, and the peak
+resident memory of the worker processes, which are started afresh for the run.
+Workers read the same configuration as this process, with the statistics cache
+switched off. Results are written as JSON and can be compared between commits
+with `python -m benchmarks.compare`.
+"""
+import argparse
+import configparser
+import gc
+import glob
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import model_viz.cache as cache
+import model_viz.config as config
+import model_viz.export as export
+import model_viz.hdf_ops as hdf_ops
+import model_viz.plotting as plotting
+from benchmarks.synthetic import SyntheticSpec, write_synthetic_file
+from typing import Callable
+
+# Number of hover positions swept over by the drilldown stage
+HOVER_SWEEP = 50
+# Interval between two samples of the memory of the worker processes
+WORKER_SAMPLE_S = 0.01
+
+
+def _first_group(reader: hdf_ops.HDFReader):
+    root = next(iter(reader.get_group_index()))
+    return reader.get_groups(root)[0]
+
+
+def _stage_get_all_groups(reader, output_dir):
+    reader.get_all_groups()
+
+
+def _stage_get_group_index(reader, output_dir):
+    cache.stats_cache.invalidate(reader.data_path)  # Force a cold scan
+    reader.get_group_index()
+
+
+def _stage_histogram2d(reader, output_dir):
+    plotting.create_group_plot(_first_group(reader), plotting.Histogram2D)
+
+
+def _stage_boxplot_stats(reader, output_dir):
+    plotting.BoxPlotOverTime(_first_group(reader)["data"])._pre_compute_boxplot_stats()
+
+
+def _stage_update_graph2(reader, output_dir):
+    """Same work as the hover callback, swept across the time axis"""
+    cache.drilldown_cache.clear()
+    group = _first_group(reader)
+    days = group["data"].shape[1]
+    for x in range(0, days, max(1, days // HOVER_SWEEP)):
+        counts, edges = cache.column_histogram(group["data"], x, config.Histogram.bins)
+        plotting.Histogram(data=counts, bin_edges=edges).create_plot()
+
+
+def _stage_export(reader, output_dir):
+    groups = [g for root in reader.get_group_index() for g in reader.get_groups(root)]
+    export.export_groups(
+        groups, plotting.BoxPlotOverTime, os.path.join(output_dir, "export.pdf")
+    )
+
+
+STAGES: dict[str, Callable] = {
+    "get_all_groups": _stage_get_all_groups,
+    "get_group_index": _stage_get_group_index,
+    "histogram2d": _stage_histogram2d,
+    "boxplot_stats": _stage_boxplot_stats,
+    "update_graph2": _stage_update_graph2,
+    "export": _stage_export,
+}
+
+
+def _descendants(pid: int) -> list[int]:
+    """Pids of the processes started by `pid` and by their own children"""
+    children = []
+    for path in glob.glob(f"/proc/{pid}/task/*/children"):
+        try:
+            with open(path) as f:
+                children += [int(child) for child in f.read().split()]
+        except OSError:  # The thread has exited
+            pass
+    return children + [pid for child in children for pid in _descendants(child)]
+
+
+def _resident_bytes(pids: list[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1])
+        except OSError:  # The process has exited
+            pass
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+
+class WorkerMemory:
+    """Peak resident memory of all worker processes, summed, sampled while in use.
+
+    Only available where `/proc` lists the children of processes (Linux), `peak` is
+    None elsewhere.
+    """
+
+    def __init__(self):
+        self.peak = None if not os.path.exists("/proc/self/task") else 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._done.wait(WORKER_SAMPLE_S):
+            pids = _descendants(os.getpid())
+            self.peak = max(self.peak, _resident_bytes(pids))
+
+    def __enter__(self) -> "WorkerMemory":
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self.peak is not None:
+            self._thread.join()
+
+
+def measure(stage: Callable, reader, output_dir: str, repeats: int) -> dict:
+    """Time `repeats` runs of a stage, then trace one more run for peak memory"""
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        stage(reader, output_dir)
+        timings.append(time.perf_counter() - start)
+
+    # Workers left from earlier runs would add their memory to the peak of this one
+    export.shutdown()
+    gc.collect()
+    tracemalloc.start()
+    with WorkerMemory() as workers:
+        stage(reader, output_dir)
+        # Workers are still alive, and their memory still resident, until shut down
+        time.sleep(2 * WORKER_SAMPLE_S)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    export.shutdown()
+    return {
+        "seconds_min": min(timings),
+        "seconds_mean": sum(timings) / len(timings),
+        "seconds_all": timings,
+        "peak_mb": peak / 1024**2,
+        "workers_peak_mb": None if workers.peak is None else workers.peak / 1024**2,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=config.MODEL_VIZ_BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _parse_chunks(value: str):
+    if value == "none":
+        return None
+    rows, cols = value.lower().split("x")
+    return int(rows), int(cols)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmark model-viz hot paths on synthetic HDF5 files",
+    )
+    parser.add_argument("--particles", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--days", type=int, nargs="+", default=[365])
+    parser.add_argument("--groups", type=int, nargs="+", default=[4])
+    parser.add_argument("--root-groups", type=int, default=2)
+    parser.add_argument("--dtype", nargs="+", default=["float64"])
+    parser.add_argument(
+        "--chunks",
+        type=_parse_chunks,
+        nargs="+",
+        default=[None],
+        help='Chunk shapes as ROWSxCOLS, or "none" for contiguous datasets',
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def _load_benchmark_config(tmp: str) -> None:
+    """Load the configuration with the statistics cache switched off and moved into
+    `tmp`, in this process and in the worker processes it starts"""
+    configuration = configparser.ConfigParser()
+    configuration.read(config.config_file)
+    # Benchmarks must measure the computation, not the statistics cache
+    configuration["CACHE"]["enabled"] = "False"
+    configuration["CACHE"]["cache_dir"] = os.path.join(tmp, "c")
+    path = os.path.join(tmp, "config.ini")
+    with open(path, "w") as f:
+        configuration.write(f)
+    config.load(path)
+
+
+def run(args: argparse.Namespace) -> dict:
+    results = []
+    default_config = config.config_file
+    with tempfile.TemporaryDirectory() as tmp:
+        _load_benchmark_config(tmp)
+
+        combinations = itertools.product(
+            args.particles, args.days, args.groups, args.dtype, args.chunks
+        )
+        for i, (particles, days, groups, dtype, chunks) in enumerate(combinations):
+            spec = SyntheticSpec(
+                particles=particles,
+                days=days,
+                root_groups=args.root_groups,
+                groups=groups,
+                dtype=dtype,
+                chunks=chunks,
+            )
+            path = write_synthetic_file(os.path.join(tmp, f"synthetic_{i}.h5"), spec)
+            reader = hdf_ops.HDFReader("benchmark", path, prefer_optimized=False)
+            for name in args.stages:
+                result = measure(STAGES[name], reader, tmp, args.repeats)
+                workers_peak = result["workers_peak_mb"]
+                print(
+                    f"{name:<16} {spec}: {result['seconds_min']:.3f}s "
+                    f"peak {result['peak_mb']:.1f}MB"
+                    + (f" workers {workers_peak:.1f}MB" if workers_peak else ""),
+                    file=sys.stderr,
+                )
+                results.append({"stage": name, "spec": vars(spec), **result})
+            del reader
+    config.load(default_config)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+
+
+def main(argv):
+    args = parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
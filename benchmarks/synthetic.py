@@ -0,0 +1,64 @@
+import h5py
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass
+class SyntheticSpec:
+    """Shape of a synthetic PF/PMCMC output file"""
+
+    particles: int = 10_000
+    days: int = 365
+    root_groups: int = 2
+    groups: int = 4  # Plotting groups per root group
+    dtype: str = "float64"
+    chunks: Optional[Tuple[int, int]] = None  # None writes contiguous datasets
+    compression: Optional[str] = None
+    overlay: bool = True
+    seed: int = 0
+
+    def __str__(self):
+        return (
+            f"{self.particles}x{self.days} {self.dtype} "
+            f"groups={self.root_groups}x{self.groups} chunks={self.chunks}"
+        )
+
+
+def write_synthetic_file(path: str, spec: SyntheticSpec) -> str:
+    """Write an HDF5 file in the layout `main.py` expects.
+
+    Every root group holds `spec.groups` plotting groups, each with a `data` dataset
+    of particle trajectories (particles x days) and an optional `overlay_data`
+    dataset of shape (1, days). Trajectories are random walks so that values spread
+    out over time like epidemic model output.
+
+    Args:
+        path: Output path
+        spec: Shape of the file
+
+    Returns:
+        str: `path`
+    """
+    rng = np.random.default_rng(spec.seed)
+    rows = max(1, min(spec.particles, 4 * 1024**2 // (8 * spec.days)))
+    with h5py.File(path, "w") as f:
+        for root in range(spec.root_groups):
+            for group in range(spec.groups):
+                name = f"root_{root}/group_{group}"
+                data = f.create_dataset(
+                    f"{name}/data",
+                    shape=(spec.particles, spec.days),
+                    dtype=spec.dtype,
+                    chunks=spec.chunks,
+                    compression=spec.compression,
+                )
+                # Written in row blocks to keep memory flat for large specs
+                for start in range(0, spec.particles, rows):
+                    stop = min(start + rows, spec.particles)
+                    steps = rng.normal(size=(stop - start, spec.days))
+                    data[start:stop] = np.cumsum(steps, axis=1).astype(spec.dtype)
+                if spec.overlay:
+                    overlay = np.cumsum(rng.normal(size=(1, spec.days)), axis=1)
+                    f.create_dataset(f"{name}/overlay_data", data=overlay)
+    return path
@@ -1,26 +1,54 @@
+import argparse
+import importlib.util
+import os
 import sys
+import uuid
+import warnings
 import h5py
 import model_viz.config as config
-import model_viz.utils as utils
 import model_viz.hdf_ops as hdf_ops
 import model_viz.plotting as plotting
+import model_viz.export as export
+import model_viz.jobs as jobs
+import model_viz.live as live
+import model_viz.metrics as metrics
+import model_viz.parallel as parallel
+import model_viz.cache as cache
+import model_viz.payload as payload
+import model_viz.preview as preview
 import model_viz.component_factory as component_factory
 import dash
-from dash import html, dcc, Input, Output, State, MATCH
+from dash import html, dcc, Input, Output, State, MATCH, ALL
 import plotly.graph_objects as go
 import plotly.io as pio
-import functools
 import dash_bootstrap_components as dbc
 from typing import List
 
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.PULSE])
+
+def compress_responses() -> bool:
+    """Whether to compress responses, see `config.Payload.compress`. Compression
+    needs the flask-compress package, without which responses are sent as they are."""
+    if not config.Payload.compress:
+        return False
+    if importlib.util.find_spec("flask_compress") is None:
+        warnings.warn(
+            "Responses are not compressed, install flask-compress to compress them "
+            "or set compress = False in the [PAYLOAD] section of the configuration",
+            RuntimeWarning,
+        )
+        return False
+    return True
+
+
+app = dash.Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.PULSE],
+    compress=compress_responses(),
+)
 app.title = "Model Viz"
 pio.templates.default = config.Plotter.theme
 
-GRAPH_TYPES = {
-    "Histogram 2D": plotting.Histogram2D,
-    "Boxplot over Time": plotting.BoxPlotOverTime,
-}
+GRAPH_TYPES = plotting.GRAPH_TYPES
 
 
 def generate_plots(
@@ -41,29 +69,320 @@ def generate_plots(
     if graph_type not in GRAPH_TYPES:
         raise NotImplementedError(f"Graph type {graph_type} not implemented")
 
-    plots = []
     plotter = GRAPH_TYPES[graph_type]
-    for plot_item in groups:
-        title = plot_item.name.split("/")[-1]
-        data = plot_item["data"][:]
-        overlay_data = (
-            plot_item["overlay_data"][:].flatten()
-            if "overlay_data" in plot_item
-            else None
+    # Groups are aggregated in parallel, figures are assembled here
+    stats = parallel.compute_stats(groups, plotter)
+    return [
+        plotting.create_group_plot(plot_item, plotter, plot_stats)
+        for plot_item, plot_stats in zip(groups, stats)
+    ]
+
+
+def render_figures(
+    readers: dict[str, hdf_ops.HDFReader],
+    root_group: str,
+    titles: List[str],
+    graph_type: str,
+    session: live.LiveSession = None,
+    progressive: bool = False,
+) -> tuple[dict[str, dict], List[str]]:
+    """Render the named plotting groups of a root group into compact figures,
+    reusing figures from `cache.figure_cache`
+
+    With several readers every figure compares the group across the runs that have
+    it.
+
+    Args:
+        readers: Reader of every HDF5 file, by run label
+        root_group: Root group holding the plotting groups
+        titles: Names of the plotting groups to render
+        graph_type (str): Type of graph to generate
+        session: Live session of a file being written, whose figures are built
+            from its live aggregates instead of the caches
+        progressive: Draw previews of the groups of a single file whose statistics
+            are not cached yet, see `model_viz.preview`
+
+    Returns:
+        tuple: Compact figure of every title, and the titles of the previews among
+        them, which are not cached
+    """
+    if graph_type not in GRAPH_TYPES:
+        raise NotImplementedError(f"Graph type {graph_type} not implemented")
+
+    if session is not None:
+        reader = next(iter(readers.values()))
+        return {
+            title: payload.compact_figure(
+                session.create_plot(
+                    reader.get_group(root_group, [title]), GRAPH_TYPES[graph_type]
+                ).fig
+            )
+            for title in titles
+        }, []
+
+    paths = [reader.data_path for reader in readers.values()]
+    keys = {
+        title: cache.figure_key(paths, f"/{root_group}/{title}", graph_type)
+        for title in titles
+    }
+    figures = {title: cache.figure_cache.get(key) for title, key in keys.items()}
+    missing = [title for title, figure in figures.items() if figure is None]
+
+    previews = []
+    if len(readers) == 1:
+        reader = next(iter(readers.values()))
+        groups = [reader.get_group(root_group, [title]) for title in missing]
+        for group in groups if progressive else []:
+            plot = preview.preview_plot(group, GRAPH_TYPES[graph_type])
+            if plot is not None:
+                figures[plot.title] = payload.compact_figure(plot.fig)
+                previews.append(plot.title)
+        plots = generate_plots(
+            [group for group in groups if group.name.split("/")[-1] not in previews],
+            graph_type,
+        )
+    else:
+        plots = [
+            plotting.create_comparison_plot(
+                hdf_ops.run_groups(readers, root_group, title), GRAPH_TYPES[graph_type]
+            )
+            for title in missing
+        ]
+    for plot in plots:
+        figures[plot.title] = payload.compact_figure(plot.fig)
+        cache.figure_cache.put(keys[plot.title], figures[plot.title])
+    return figures, previews
+
+
+def live_figures(
+    session: live.LiveSession,
+    reader: hdf_ops.HDFReader,
+    root_group: str,
+    titles: List[str],
+    graph_type: str,
+    ids: List[dict],
+):
+    """Compact figures of the named plotting groups whose data grew since the last
+    poll of the live session
+
+    Args:
+        session: Live session of the file being written, None outside live mode
+        reader: Reader of the file, opened SWMR-read
+        root_group: Root group holding the plotting groups
+        titles: Names of the plotting groups shown
+        graph_type (str): Type of graph shown
+        ids: Ids of all plot graphs of the tab
+
+    Returns:
+        list: Figure of every plot graph, `dash.no_update` for those that did not grow
+    """
+    if session is None or graph_type is None:
+        return dash.no_update
+    grown = [
+        title
+        for title in titles or []
+        if session.update(
+            reader.get_group(root_group, [title]), GRAPH_TYPES[graph_type]
         )
-        plot = plotter(data=data, overlay_data=overlay_data)
-        plot.create_plot(title=title)
-        plots.append(plot)
+    ]
+    if not grown:
+        return dash.no_update
+    figures, _ = render_figures(
+        {reader.name: reader}, root_group, grown, graph_type, session
+    )
+    return [figures.get(id["index"], dash.no_update) for id in ids]
 
-    return plots
+
+def refined_figures(
+    readers: dict[str, hdf_ops.HDFReader],
+    root_group: str,
+    previews: List[str],
+    graph_type: str,
+    ids: List[dict],
+):
+    """Exact figures of the previews whose statistics are ready
+
+    Args:
+        readers: Reader of every HDF5 file, by run label
+        root_group: Root group holding the plotting groups
+        previews: Names of the plotting groups shown as previews
+        graph_type (str): Type of graph shown
+        ids: Ids of all plot graphs of the tab
+
+    Returns:
+        tuple: Figure of every plot graph, `dash.no_update` for those not ready, the
+        previews left, and whether to stop polling
+    """
+    reader = next(iter(readers.values()))
+    titles = {id["index"] for id in ids}
+    previews = [title for title in previews or [] if title in titles]
+    ready = [
+        title
+        for title in previews
+        if preview.is_refined(
+            reader.get_group(root_group, [title]), GRAPH_TYPES[graph_type]
+        )
+    ]
+    if not ready:
+        return [dash.no_update] * len(ids), previews, not previews
+    figures, _ = render_figures(readers, root_group, ready, graph_type)
+    left = [title for title in previews if title not in ready]
+    return [figures.get(id["index"], dash.no_update) for id in ids], left, not left
+
+
+def cache_metrics() -> str:
+    """Figure cache counters of this process in the Prometheus text format"""
+    return metrics.render_gauges(
+        "model_viz_figure_cache",
+        "Figure cache hits, misses, evictions, entries and bytes",
+        "stat",
+        cache.figure_cache.metrics(),
+    )
+
+
+def export_progress(job: dict) -> tuple:
+    """Progress bar value and label, download, job id and interval state of an
+    export job as returned by `jobs.JobQueue.status`"""
+    if job is None:
+        return 0, "", None, None, True
+    if job["status"] == jobs.DONE:
+        return 100, "Done", dcc.send_file(job["result"]), None, True
+    if job["status"] == jobs.FAILED:
+        return 0, "Export failed", None, None, True
+
+    progress = 100 * job["done"] / job["total"] if job["total"] else 0
+    label = f"{job['done']}/{job['total']}" if job["total"] else job["status"]
+    return progress, label, None, dash.no_update, False
+
+
+def tab_graphs(titles: List[str], figures: dict[str, dict]):
+    """Create the graphs of a tab, empty placeholders for figures not rendered yet
+
+    Args:
+        titles: Names of the plotting groups of the tab
+        figures: Figures rendered so far, by title
+
+    Returns:
+        tuple: Lists of plot graphs and of their drilldown graphs
+    """
+    dash_graphs_1 = []
+    dash_graphs_2 = []
+    for title in titles:
+        dash_graphs_1.append(
+            dcc.Graph(
+                id={"type": "dcc_go_1", "index": title},
+                figure=figures.get(title, go.Figure()),
+                style=config.Plotter.graph_div_style,
+            )
+        )
+        dash_graphs_2.append(
+            dcc.Graph(
+                id={"type": "dcc_go_2", "index": title},
+                figure=go.Figure(),
+                style=config.Plotter.graph_div_style,
+            )
+        )
+    return dash_graphs_1, dash_graphs_2
+
+
+# Reports the titles of placeholder graphs near the viewport that are not rendered yet
+VISIBLE_PLOTS_JS = """
+function(n_intervals, rendered, previous) {
+    const margin = window.innerHeight * %f;
+    const visible = [];
+    document.querySelectorAll('[id*="dcc_go_1"]').forEach(function (element) {
+        let id;
+        try {
+            id = JSON.parse(element.id);
+        } catch (e) {
+            return;
+        }
+        if (id.type !== "dcc_go_1" || (rendered || []).includes(id.index)) {
+            return;
+        }
+        const rect = element.getBoundingClientRect();
+        if (rect.bottom > -margin && rect.top < window.innerHeight + margin) {
+            visible.push(id.index);
+        }
+    });
+    if (!visible.length || JSON.stringify(visible) === JSON.stringify(previous)) {
+        return window.dash_clientside.no_update;
+    }
+    return visible;
+}
+"""
+
+
+def relayout_ranges(relayout_data: dict) -> dict[str, tuple]:
+    """Axis ranges set by a zoom or reset in a figure's `relayoutData`
+
+    Args:
+        relayout_data: `relayoutData` of a `dcc.Graph`
+
+    Returns:
+        dict: Maps "xaxis" and "yaxis" to the new (min, max), or None on a reset.
+            Axes left unchanged are missing.
+    """
+    ranges = {}
+    for axis in ("xaxis", "yaxis"):
+        if f"{axis}.range[0]" in relayout_data:
+            ranges[axis] = tuple(
+                sorted(
+                    (
+                        relayout_data[f"{axis}.range[0]"],
+                        relayout_data[f"{axis}.range[1]"],
+                    )
+                )
+            )
+        elif f"{axis}.autorange" in relayout_data:
+            ranges[axis] = None
+    return ranges
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python main.py", description="Browse the output of model runs"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="HDF5 files, several files are compared run by run"
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Tail a file still being written by a running model (SWMR)",
+    )
+    args = parser.parse_args(argv)
+    if args.live and len(args.paths) > 1:
+        parser.error("--live takes a single file")
+    return args
+
+
+def open_readers(args: argparse.Namespace):
+    """Open the files given on the command line.
+
+    Returns:
+        tuple: Reader of every file by run label, and the live session in live mode
+    """
+    # Several files are compared run against run, labelled by their file names
+    readers = {
+        label: hdf_ops.HDFReader(label, path, swmr=args.live)
+        for label, path in zip(hdf_ops.run_labels(args.paths), args.paths)
+    }
+    # Figures of a live file are updated from aggregates of the appended data only
+    return readers, live.LiveSession() if args.live else None
 
 
 def main(argv):
-    reader = hdf_ops.HDFReader("reader", argv[0])
-    groups_to_plot = reader.get_all_groups()
+    readers, session = open_readers(parse_args(argv))
+    reader = next(iter(readers.values()))
+    job_queue = jobs.JobQueue()
+    # Groups are only opened once their tab is activated
+    group_index = hdf_ops.align_group_indexes(
+        [run.get_group_index() for run in readers.values()]
+    )
     group_tabs = {
         group: component_factory.DashTab(label=group, component_id=group)
-        for group in groups_to_plot.keys()
+        for group in group_index.keys()
     }
     dash_tabs = component_factory.DashTabs(
         component_id="dash_tabs", tabs=list(group_tabs.values())
@@ -91,8 +410,30 @@ def main(argv):
                         )
                     ),
                     dcc.Download(id="download"),
+                    dcc.Store(id="export_job"),
+                    dbc.Progress(id="export_progress", value=0, class_name="mt-2"),
+                    dcc.Interval(
+                        id="export_progress_interval", interval=1000, disabled=True
+                    ),
                     html.Br(),
                     html.Div(dash_tabs),
+                    dcc.Store(id="rendered_plots", data=[]),
+                    dcc.Store(id="visible_plots"),
+                    dcc.Interval(
+                        id="viewport_poll", interval=config.Plotter.viewport_poll_ms
+                    ),
+                    # Plots drawn as previews, polled until their exact figures are ready
+                    dcc.Store(id="preview_plots", data=[]),
+                    dcc.Interval(
+                        id="preview_poll",
+                        interval=config.Preview.poll_ms,
+                        disabled=True,
+                    ),
+                    dcc.Interval(
+                        id="live_poll",
+                        interval=config.Live.poll_ms,
+                        disabled=session is None,
+                    ),
                     html.Div(
                         id="tab_content_1",
                         style={"width": "75%", "display": "inline-block"},
@@ -110,37 +451,133 @@ def main(argv):
     @app.callback(
         Output("tab_content_1", "children"),
         Output("tab_content_2", "children"),
+        Output("rendered_plots", "data"),
+        Output("preview_plots", "data"),
+        Output("preview_poll", "disabled"),
+        # Plots of the new tab in view are reported even if their titles are the same
+        Output("visible_plots", "data", allow_duplicate=True),
         Input("graph_type", "value"),
         Input("dash_tabs", "active_tab"),
         prevent_initial_call=True,
     )
-    @functools.lru_cache(maxsize=32)
     def update_graph1(graph_type, active_tab):
         if graph_type is not None:
             if active_tab in group_tabs:
-                dash_graphs_1 = []
-                dash_graphs_2 = []
-                for plot in generate_plots(groups_to_plot[active_tab], graph_type):
-                    dash_graphs_1.append(
-                        dcc.Graph(
-                            id={"type": "dcc_go_1", "index": plot.title},
-                            figure=plot.fig,
-                            style=config.Plotter.graph_div_style,
-                        )
-                    )
-                    dash_graphs_2.append(
-                        dcc.Graph(
-                            id={"type": "dcc_go_2", "index": plot.title},
-                            figure=go.Figure(),
-                            style=config.Plotter.graph_div_style,
-                        )
-                    )
-                return dash_graphs_1, dash_graphs_2
+                # Only the first plots are rendered now, the others once scrolled to
+                titles = [info.title for info in group_index[active_tab]]
+                eager = titles[: config.Plotter.eager_plots]
+                figures, previews = render_figures(
+                    readers, active_tab, eager, graph_type, session, progressive=True
+                )
+                return (
+                    *tab_graphs(titles, figures),
+                    eager,
+                    previews,
+                    not previews,
+                    None,
+                )
             else:
                 raise NotImplementedError(f"Active tab {active_tab} not implemented")
 
         return dash.no_update
 
+    app.clientside_callback(
+        VISIBLE_PLOTS_JS % config.Plotter.viewport_margin,
+        Output("visible_plots", "data"),
+        Input("viewport_poll", "n_intervals"),
+        State("rendered_plots", "data"),
+        State("visible_plots", "data"),
+    )
+
+    @app.callback(
+        Output({"type": "dcc_go_1", "index": ALL}, "figure", allow_duplicate=True),
+        Output("rendered_plots", "data", allow_duplicate=True),
+        Output("preview_plots", "data", allow_duplicate=True),
+        Output("preview_poll", "disabled", allow_duplicate=True),
+        Input("visible_plots", "data"),
+        State("rendered_plots", "data"),
+        State("preview_plots", "data"),
+        State({"type": "dcc_go_1", "index": ALL}, "id"),
+        State("graph_type", "value"),
+        State("dash_tabs", "active_tab"),
+        prevent_initial_call=True,
+    )
+    def render_visible_plots(visible, rendered, shown, ids, graph_type, active_tab):
+        titles = {id["index"] for id in ids}
+        # Stale reports of another tab are ignored
+        to_render = [t for t in visible or [] if t in titles and t not in rendered]
+        if graph_type is None or not to_render:
+            return dash.no_update
+
+        figures, previews = render_figures(
+            readers, active_tab, to_render, graph_type, session, progressive=True
+        )
+        previews = (shown or []) + previews
+        return (
+            [figures.get(id["index"], dash.no_update) for id in ids],
+            rendered + to_render,
+            previews,
+            not previews,
+        )
+
+    @app.callback(
+        Output({"type": "dcc_go_1", "index": ALL}, "figure", allow_duplicate=True),
+        Output("preview_plots", "data", allow_duplicate=True),
+        Output("preview_poll", "disabled", allow_duplicate=True),
+        Input("preview_poll", "n_intervals"),
+        State("preview_plots", "data"),
+        State({"type": "dcc_go_1", "index": ALL}, "id"),
+        State("graph_type", "value"),
+        State("dash_tabs", "active_tab"),
+        prevent_initial_call=True,
+    )
+    def refine_previews(n_intervals, previews, ids, graph_type, active_tab):
+        return refined_figures(readers, active_tab, previews, graph_type, ids)
+
+    @app.callback(
+        Output({"type": "dcc_go_1", "index": ALL}, "figure", allow_duplicate=True),
+        Input("live_poll", "n_intervals"),
+        State("rendered_plots", "data"),
+        State({"type": "dcc_go_1", "index": ALL}, "id"),
+        State("graph_type", "value"),
+        State("dash_tabs", "active_tab"),
+        prevent_initial_call=True,
+    )
+    def update_live_plots(n_intervals, rendered, ids, graph_type, active_tab):
+        return live_figures(session, reader, active_tab, rendered, graph_type, ids)
+
+    @app.callback(
+        Output({"type": "dcc_go_1", "index": MATCH}, "figure"),
+        Input({"type": "dcc_go_1", "index": MATCH}, "relayoutData"),
+        State({"type": "dcc_go_1", "index": MATCH}, "id"),
+        State("dash_tabs", "active_tab"),
+        State("graph_type", "value"),
+        prevent_initial_call=True,
+    )
+    def zoom_graph1(relayout_data, id, active_tab, graph_type):
+        # Faceted comparisons and live figures are zoomed client side only
+        if (
+            relayout_data is None
+            or len(readers) > 1
+            or session is not None
+            or GRAPH_TYPES.get(graph_type) is not plotting.Histogram2D
+        ):
+            return dash.no_update
+
+        ranges = relayout_ranges(relayout_data)
+        if not ranges:  # Neither a zoom nor a reset, e.g. a change of drag mode
+            return dash.no_update
+
+        group = reader.get_group(active_tab, [id["index"]])
+        heatmap = plotting.Histogram2D(
+            group["data"], weights=hdf_ops.group_weights(group)
+        ).zoom(ranges.get("xaxis"), ranges.get("yaxis"))
+        # Only the heatmap is replaced, the overlay and layout stay untouched
+        fig = dash.Patch()
+        for key, values in heatmap.items():
+            fig["data"][0][key] = payload.encode_array(values)
+        return fig
+
     @app.callback(
         Output({"type": "dcc_go_2", "index": MATCH}, "figure"),
         Input({"type": "dcc_go_1", "index": MATCH}, "hoverData"),
@@ -152,38 +589,66 @@ def main(argv):
         if hover_data is not None:
             graph_title = id["index"]
             x = int(hover_data["points"][0]["x"])
-            group = reader.get_group(active_tab, [graph_title])
-            data = group["data"]
+            # Comparisons drill down into the first run that has the group
+            group = next(
+                iter(hdf_ops.run_groups(readers, active_tab, graph_title).values())
+            )
+            hdf_ops.refresh(group)
             overlay_data = (
-                int(group["overlay_data"][:, x]) if "overlay_data" in group else None
+                int(group["overlay_data"][0, x]) if "overlay_data" in group else None
+            )
+            counts, edges = cache.column_histogram(
+                group["data"], x, config.Histogram.bins, hdf_ops.group_weights(group)
             )
             fig = plotting.Histogram(
-                data=data[:, x], overlay_data=overlay_data
+                data=counts, overlay_data=overlay_data, bin_edges=edges
             ).create_plot()
-            return fig
+            return payload.compact_figure(fig)
 
         return dash.no_update
 
     @app.callback(
         Output("export", "n_clicks"),
-        Output("download", "data"),
+        Output("export_job", "data"),
+        Output("export_progress_interval", "disabled"),
         Input("graph_type", "value"),
         Input("export", "n_clicks"),
         prevent_initial_call=True,
     )
     def export_plots(graph_type, n_clicks):
         if graph_type is not None and n_clicks is not None:
-            files = []
-            for group in groups_to_plot.values():
-                files += [
-                    plot.export_plot() for plot in generate_plots(group, graph_type)
-                ]
-            utils.merge_pdf_files(files, config.output_filename)
-            utils.delete_files(files, delete_dir=True)
-            return None, dcc.send_file(config.output_filename)
+            if graph_type not in GRAPH_TYPES:
+                raise NotImplementedError(f"Graph type {graph_type} not implemented")
+
+            groups = hdf_ops.plotting_groups(readers, group_index)
+            paths = ":".join(os.path.abspath(run.path) for run in readers.values())
+            base, ext = os.path.splitext(config.output_filename)
+            # Concurrent requests for the same files and graph type share one job
+            job_id = job_queue.submit(
+                f"export:{paths}:{graph_type}",
+                export.export_groups,
+                groups,
+                GRAPH_TYPES[graph_type],
+                f"{base}_{uuid.uuid4().hex[:8]}{ext}",
+            )
+            return None, job_id, False
 
         return dash.no_update
 
+    @app.callback(
+        Output("export_progress", "value"),
+        Output("export_progress", "label"),
+        Output("download", "data"),
+        Output("export_job", "data", allow_duplicate=True),
+        Output("export_progress_interval", "disabled", allow_duplicate=True),
+        Input("export_progress_interval", "n_intervals"),
+        State("export_job", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_export(n_intervals, job_id):
+        return export_progress(job_queue.status(job_id) if job_id else None)
+
+    metrics.install(app.server, extra_metrics=cache_metrics)
     app.run_server(debug=True)
 
 
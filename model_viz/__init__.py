@@ -1,2 +1,15 @@
-from .hdf_ops import *
-from .plotting import *
+import importlib
+
+# Public names of these modules are available from the package itself. The modules
+# are imported on first access, so that importing a single module of the package
+# does not pull in h5py and the plotting libraries.
+_REEXPORTED_MODULES = ("hdf_ops", "plotting")
+
+
+def __getattr__(name: str):
+    if not name.startswith("_"):
+        for module_name in _REEXPORTED_MODULES:
+            module = importlib.import_module(f"{__name__}.{module_name}")
+            if hasattr(module, name):
+                return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
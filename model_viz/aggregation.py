@@ -0,0 +1,756 @@
+import numpy as np
+from typing import Optional, Sequence, Union
+
+# Backends binning the samples of a `CountGrid`
+BINNING_BACKENDS = ("numpy", "datashader")
+AXIS_SCALES = ("linear", "log")
+# Number of samples binned at a time by the numpy backend
+_SLAB_SAMPLES = 2**16
+
+
+def _columns(data: np.ndarray, dtype=None) -> np.ndarray:
+    """Contiguous columns of `data` in `dtype`, or in float64 for integer samples so
+    that quantiles between two samples are interpolated rather than truncated"""
+    data = np.asarray(data)
+    if dtype is None and not np.issubdtype(data.dtype, np.inexact):
+        dtype = np.float64
+    return np.ascontiguousarray(data.T, dtype=dtype)
+
+
+def quantiles(data: np.ndarray, qs: Sequence[float], dtype=None) -> np.ndarray:
+    """Compute several quantiles of every column with a single partition per column.
+
+    Equivalent to `np.percentile(data, 100 * qs, axis=0)` with linear interpolation,
+    but all order statistics are selected in one `np.partition` call instead of one
+    sort per quantile.
+
+    Args:
+        data: Samples of shape (particles, time)
+        qs: Quantiles in [0, 1]. 0 and 1 give the column min and max.
+        dtype: Optional dtype to compute in, e.g. `np.float32` to halve memory
+            traffic. Integer samples are computed in float64 by default.
+
+    Returns:
+        np.ndarray: Array of shape (len(qs), time)
+    """
+    qs = np.asarray(qs, dtype=np.float64)
+    # Columns are partitioned as contiguous rows, which is considerably faster
+    columns = _columns(data, dtype)
+    positions = qs * (columns.shape[1] - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    columns.partition(np.unique(np.concatenate([lower, upper])), axis=1)
+
+    lower_values = columns[:, lower]
+    upper_values = columns[:, upper]
+    weights = (positions - lower).astype(columns.dtype)
+    return (lower_values + (upper_values - lower_values) * weights).T
+
+
+def weighted_quantiles(
+    data: np.ndarray, weights: np.ndarray, qs: Sequence[float], dtype=None
+) -> np.ndarray:
+    """Compute several quantiles of every column of weighted samples.
+
+    Every sample sits at the middle of its share of the cumulative weight of its
+    column and quantiles are interpolated linearly in between, so equal weights give
+    `np.percentile(data, 100 * qs, axis=0, method="hazen")`.
+
+    Args:
+        data: Samples of shape (particles, time)
+        weights: Non-negative weight of every particle
+        qs: Quantiles in [0, 1]
+        dtype: Optional dtype to compute in, float64 for integer samples by default
+
+    Returns:
+        np.ndarray: Array of shape (len(qs), time)
+    """
+    qs = np.asarray(qs, dtype=np.float64)
+    columns = _columns(data, dtype)
+    order = np.argsort(columns, axis=1)
+    values = np.take_along_axis(columns, order, axis=1)
+    column_weights = np.asarray(weights, dtype=np.float64)[order]
+    cumulative = np.cumsum(column_weights, axis=1)
+    positions = (cumulative - column_weights / 2) / cumulative[:, -1:]
+    result = np.empty((len(qs), columns.shape[0]), dtype=values.dtype)
+    for column in range(columns.shape[0]):
+        result[:, column] = np.interp(qs, positions[column], values[column])
+    return result
+
+
+def systematic_counts(weights: np.ndarray, n: int = None, seed: int = 0) -> np.ndarray:
+    """Number of times systematic resampling draws every sample.
+
+    `n` draws are spread evenly over the cumulative weights with a single random
+    offset, so a sample of weight `w` is drawn `floor(n * w / W)` or one more times,
+    where `W` is the total weight.
+
+    Args:
+        weights: Non-negative weight of every sample
+        n: Number of draws, defaults to the number of samples
+        seed: Seed of the random offset, fixed so that results are reproducible
+
+    Returns:
+        np.ndarray: Number of draws of every sample, adding up to `n`
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights) if n is None else n
+    cumulative = np.concatenate([[0.0], np.cumsum(weights)]) * (n / weights.sum())
+    offset = np.random.default_rng(seed).random()
+    counts = np.diff(np.floor(cumulative - offset)).astype(np.intp)
+    # Rounding may leave the last draw past the end
+    counts[-1] += n - counts.sum()
+    return counts
+
+
+def stratified_rows(
+    n_rows: int, n_samples: int, weights: np.ndarray = None, seed: int = 0
+) -> np.ndarray:
+    """Stratified sample of rows: one row drawn from each of `n_samples` equal strata.
+
+    Without weights the strata split the rows, so that every part of the matrix is
+    represented. With weights they split the cumulative weight instead, which is
+    stratified resampling: rows are drawn in proportion to their weight, heavy rows
+    possibly several times, and the sample is equally weighted.
+
+    Args:
+        n_rows: Number of rows to sample from
+        n_samples: Number of strata, at most `n_rows` without weights
+        weights: Optional non-negative weight of every row
+        seed: Seed of the draws within the strata
+
+    Returns:
+        np.ndarray: Sampled rows in increasing order
+    """
+    rng = np.random.default_rng(seed)
+    targets = (np.arange(n_samples) + rng.random(n_samples)) / n_samples
+    if weights is None:
+        return np.minimum((targets * n_rows).astype(np.intp), n_rows - 1)
+    cumulative = np.cumsum(np.asarray(weights, dtype=np.float64))
+    rows = np.searchsorted(cumulative, targets * cumulative[-1], side="right")
+    return np.minimum(rows, n_rows - 1)
+
+
+def column_histograms(
+    block: np.ndarray, bins: int, weights: np.ndarray = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Histogram every column of a block independently in a single vectorised pass.
+
+    Each column gets `bins` equal-width bins spanning its own range, matching
+    `np.histogram(column, bins)`.
+
+    Args:
+        block: Samples of shape (particles, columns)
+        bins: Number of bins per column
+        weights: Optional weight of every particle, counted instead of one
+
+    Returns:
+        tuple: Counts of shape (columns, bins) and edges of shape (columns, bins + 1)
+    """
+    block = np.asarray(block, dtype=np.float64)
+    lower, upper = block.min(axis=0), block.max(axis=0)
+    # Same convention as np.histogram for columns holding a single value
+    flat = lower == upper
+    lower, upper = np.where(flat, lower - 0.5, lower), np.where(
+        flat, upper + 0.5, upper
+    )
+
+    edges = np.linspace(lower, upper, bins + 1, axis=1)
+    index = ((block - lower) * (bins / (upper - lower))).astype(np.intp)
+    np.clip(index, 0, bins - 1, out=index)  # The last bin is closed on the right
+    index += np.arange(block.shape[1]) * bins
+    if weights is not None:
+        weights = np.repeat(np.asarray(weights, dtype=np.float64), block.shape[1])
+    counts = np.bincount(index.ravel(), weights, minlength=block.shape[1] * bins)
+    return counts.reshape(block.shape[1], bins), edges
+
+
+def binned_column_counts(
+    block: np.ndarray, y_range: tuple[float, float], bins: int, y_scale="linear"
+) -> np.ndarray:
+    """Histogram every column of a block onto the same bins.
+
+    Unlike `column_histograms` the bins are shared by all columns, so counts of
+    separate blocks of samples can be added up. Samples are binned as by
+    `CountGrid`, bin for bin.
+
+    Args:
+        block: Samples of shape (particles, columns)
+        y_range: (min, max) spanned by the bins. Samples outside, and NaNs, are
+            not counted.
+        bins: Number of bins
+        y_scale: "linear" for equal bins, "log" for bins of equal width in log10
+            space. Non-positive samples are not counted then.
+
+    Returns:
+        np.ndarray: Counts of shape (bins, columns)
+    """
+    block = np.asarray(block, dtype=np.float64)
+    inside, index = _bin_index(block, y_range, bins, y_scale)
+    index *= block.shape[1]
+    index += np.broadcast_to(np.arange(block.shape[1]), block.shape)[inside]
+    counts = np.bincount(index, minlength=bins * block.shape[1])
+    return counts.reshape(bins, block.shape[1])
+
+
+def _scale_and_translate(extent: tuple, bins: int, scale: str) -> tuple[float, float]:
+    """Map from (log) data space onto bin space, computed as datashader does"""
+    start, end = np.log10(extent) if scale == "log" else extent
+    factor = bins / (end - start)
+    return factor, -start * factor
+
+
+def _bin_index(
+    values: np.ndarray, extent: tuple, bins: int, scale: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """Bin of every value inside `extent`, the upper edge belonging to the last bin.
+
+    Values are truncated onto bins and clamped at the upper edge like datashader
+    points, so that both binning backends agree on values at bin edges.
+
+    Returns:
+        tuple: Mask of the values inside `extent` (NaNs are outside) and the bin of
+        each of them
+    """
+    inside = (values >= extent[0]) & (values <= extent[1])
+    kept = values[inside]
+    factor, offset = _scale_and_translate(extent, bins, scale)
+    mapped = np.log10(kept) if scale == "log" else kept
+    index = (mapped * factor + offset).astype(np.intp)
+    return inside, np.minimum(index, bins - 1, out=index)
+
+
+class CountGrid:
+    """Mergeable count grid of a 2D histogram over (time step, value) with fixed bins.
+
+    Samples are binned onto `width` x `height` bins spanning `x_range` and
+    `y_range`, so grids of any split of the samples, by rows, columns, files or
+    processes, add up exactly to the grid of all of them. Both binning backends
+    give identical counts; "numpy" bins straight from the (particles, time) matrix,
+    "datashader" goes through `datashader.Canvas.points`.
+    """
+
+    def __init__(
+        self,
+        x_range: tuple,
+        y_range: tuple,
+        width: int,
+        height: int,
+        y_scale: str = "linear",
+        backend: str = "numpy",
+    ):
+        """
+        Args:
+            x_range: (min, max) time step covered by the grid
+            y_range: (min, max) value covered by the grid
+            width: Number of bins along x
+            height: Number of bins along y
+            y_scale: "linear" for equal bins along y, "log" for bins of equal
+                width in log10 space. Non-positive values are not counted then.
+            backend: Binning backend, one of `BINNING_BACKENDS`
+        """
+        if y_scale not in AXIS_SCALES:
+            raise NotImplementedError(f"Axis scale {y_scale} not implemented")
+        if backend not in BINNING_BACKENDS:
+            raise NotImplementedError(f"Binning backend {backend} not implemented")
+        self.x_range = tuple(float(v) for v in x_range)
+        self.y_range = tuple(float(v) for v in y_range)
+        self.y_scale = y_scale
+        self.backend = backend
+        self.counts = np.zeros((height, width), dtype=np.int64)
+
+    @property
+    def x(self) -> np.ndarray:
+        """Bin centres along x"""
+        return self._centres(self.x_range, self.counts.shape[1], "linear")
+
+    @property
+    def y(self) -> np.ndarray:
+        """Bin centres along y, geometric centres for a log scale"""
+        return self._centres(self.y_range, self.counts.shape[0], self.y_scale)
+
+    @staticmethod
+    def _centres(extent: tuple, bins: int, scale: str) -> np.ndarray:
+        start, end = np.log10(extent) if scale == "log" else extent
+        centres = start + (end - start) / bins * (np.arange(bins) + 0.5)
+        return 10**centres if scale == "log" else centres
+
+    def _bin_numpy(
+        self, chunk: np.ndarray, column: int, weights: np.ndarray = None
+    ) -> np.ndarray:
+        """Counts of a chunk, binning all columns at once as x is the time step.
+
+        Rows are binned in slabs that fit in the CPU caches. Samples outside the y
+        range, NaNs included, are counted in an extra row of bins that is dropped.
+        """
+        height, width = self.counts.shape
+        steps = np.arange(column, column + chunk.shape[1], dtype=np.float64)
+        x_inside, x_index = _bin_index(steps, self.x_range, width, "linear")
+        if not x_inside.all():
+            chunk = chunk[:, x_inside]
+        factor, offset = _scale_and_translate(self.y_range, height, self.y_scale)
+        y_min, y_max = self.y_range
+        log = self.y_scale == "log"
+
+        counts = np.zeros(
+            (height + 1) * width, dtype=np.int64 if weights is None else np.float64
+        )
+        slab_rows = max(1, _SLAB_SAMPLES // max(1, chunk.shape[1]))
+        for start in range(0, chunk.shape[0], slab_rows):
+            slab = np.asarray(chunk[start : start + slab_rows], dtype=np.float64)
+            outside = ~((slab >= y_min) & (slab <= y_max))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mapped = np.log10(slab) if log else slab * 1.0
+            mapped *= factor
+            mapped += offset
+            # The upper edge belongs to the last bin, as in datashader
+            np.minimum(mapped, height - 1, out=mapped)
+            mapped[outside] = height
+            index = mapped.astype(np.intp)
+            index *= width
+            index += x_index
+            slab_weights = (
+                None
+                if weights is None
+                else np.repeat(weights[start : start + slab_rows], index.shape[1])
+            )
+            counts += np.bincount(
+                index.ravel(), weights=slab_weights, minlength=counts.size
+            )
+        return counts[: height * width].reshape(height, width)
+
+    def _bin_datashader(
+        self, chunk: np.ndarray, column: int, weights: np.ndarray = None
+    ) -> np.ndarray:
+        try:
+            import datashader as ds
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError(
+                "The datashader binning backend requires the datashader package"
+            ) from e
+        height, width = self.counts.shape
+        cvs = ds.Canvas(
+            plot_height=height,
+            plot_width=width,
+            x_range=self.x_range,
+            y_range=self.y_range,
+            y_axis_type=self.y_scale,
+        )
+        x = np.tile(np.arange(column, column + chunk.shape[1]), chunk.shape[0])
+        df = pd.DataFrame({"x": x, "y": chunk.ravel()})
+        if weights is None:
+            return cvs.points(df, "x", "y", ds.count()).values
+        df["weight"] = np.repeat(weights, chunk.shape[1])
+        return np.nan_to_num(cvs.points(df, "x", "y", ds.sum("weight")).values)
+
+    def update(
+        self, chunk: np.ndarray, column: int = 0, weights: np.ndarray = None
+    ) -> "CountGrid":
+        """Add a chunk of samples of shape (particles, time).
+
+        Args:
+            chunk: Samples, column `i` holding time step `column + i`
+            column: Time step of the first column of `chunk`
+            weights: Optional weight of every particle of `chunk`. Samples then add
+                their weight to their bin rather than one, and counts become floats.
+        """
+        chunk = np.asarray(chunk)
+        if chunk.size == 0:
+            return self
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+        if self.backend == "numpy":
+            counts = self._bin_numpy(chunk, column, weights)
+        else:
+            counts = self._bin_datashader(chunk, column, weights)
+        self._add(counts)
+        return self
+
+    def _add(self, counts: np.ndarray) -> None:
+        if np.can_cast(counts.dtype, self.counts.dtype, casting="same_kind"):
+            self.counts += counts
+        else:  # Counts of weighted samples are floats
+            self.counts = self.counts + counts
+
+    def merge(self, other: "CountGrid") -> "CountGrid":
+        """Add the counts of a grid with the same bins"""
+        if (
+            other.x_range != self.x_range
+            or other.y_range != self.y_range
+            or other.y_scale != self.y_scale
+            or other.counts.shape != self.counts.shape
+        ):
+            raise ValueError("Cannot merge count grids with different bins")
+        self._add(other.counts)
+        return self
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Counts of shape (height, width) with the "x" and "y" bin centres"""
+        return {"counts": self.counts, "x": self.x, "y": self.y}
+
+
+def _block_centres(centres: np.ndarray, block: int, scale: str) -> np.ndarray:
+    """Centres of blocks of `block` consecutive equally wide bins, the last block
+    padded with bins past the end"""
+    centres = np.log10(centres) if scale == "log" else np.asarray(centres, float)
+    step = centres[1] - centres[0] if len(centres) > 1 else 0.0
+    n_blocks = -(-len(centres) // block)
+    merged = centres[0] + step * (block * np.arange(n_blocks) + (block - 1) / 2)
+    return 10**merged if scale == "log" else merged
+
+
+def downsample_grid(
+    grid: dict[str, np.ndarray], max_width: int, max_height: int, y_scale="linear"
+) -> dict[str, np.ndarray]:
+    """Sum blocks of bins of a count grid so that it is at most `max_width` x
+    `max_height` bins, padding the last blocks with empty bins.
+
+    Args:
+        grid: Count grid as returned by `CountGrid.to_arrays`
+        max_width: Maximum number of bins along x
+        max_height: Maximum number of bins along y
+        y_scale: Scale of the y bins, one of `AXIS_SCALES`
+
+    Returns:
+        dict: Downsampled count grid, `grid` itself if already small enough
+    """
+    counts = np.asarray(grid["counts"])
+    height, width = counts.shape
+    block_y, block_x = -(-height // max_height), -(-width // max_width)
+    if block_y == block_x == 1:
+        return grid
+    padded = np.zeros(
+        (-(-height // block_y) * block_y, -(-width // block_x) * block_x),
+        dtype=counts.dtype,
+    )
+    padded[:height, :width] = counts
+    shape = (padded.shape[0] // block_y, block_y, padded.shape[1] // block_x, block_x)
+    return {
+        "counts": padded.reshape(shape).sum((1, 3)),
+        "x": _block_centres(grid["x"], block_x, "linear"),
+        "y": _block_centres(grid["y"], block_y, y_scale),
+    }
+
+
+class TilePyramid:
+    """Count grid of a 2D histogram stored at successively halved resolutions.
+
+    Level 0 is the finest grid; every next level sums 2x2 blocks of the previous
+    one. Zoomed views are served from the coarsest level that still resolves the
+    visible range at the requested resolution.
+    """
+
+    def __init__(self, counts: np.ndarray, x_range: tuple, y_range: tuple):
+        """
+        Args:
+            counts: Finest count grid of shape (height, width)
+            x_range: (min, max) covered by the columns of `counts`
+            y_range: (min, max) covered by the rows of `counts`
+        """
+        self.x_range = tuple(float(v) for v in x_range)
+        self.y_range = tuple(float(v) for v in y_range)
+        self.levels = [np.asarray(counts)]
+        while min(self.levels[-1].shape) > 1:
+            level = self.levels[-1]
+            # Pad odd sizes with empty bins so that 2x2 blocks tile the grid
+            height, width = -(-level.shape[0] // 2) * 2, -(-level.shape[1] // 2) * 2
+            padded = np.zeros((height, width), dtype=level.dtype)
+            padded[: level.shape[0], : level.shape[1]] = level
+            self.levels.append(
+                padded.reshape(height // 2, 2, width // 2, 2).sum((1, 3))
+            )
+
+    def _bin_size(self, level: int) -> tuple[float, float]:
+        height, width = self.levels[0].shape
+        return (
+            (self.x_range[1] - self.x_range[0]) / width * 2**level,
+            (self.y_range[1] - self.y_range[0]) / height * 2**level,
+        )
+
+    def query(
+        self, x_range: tuple, y_range: tuple, width: int, height: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Counts over the visible range with at least `width` x `height` bins.
+
+        Args:
+            x_range: Visible (min, max) along x
+            y_range: Visible (min, max) along y
+            width: Wanted number of bins along x. Fewer are accepted when x is
+                already resolved down to single time steps.
+            height: Wanted number of bins along y
+
+        Returns:
+            tuple: (counts, x bin centres, y bin centres) with less than twice the
+            wanted bins along each axis, no bins if the visible range misses the
+            data, or None if even the finest level is too coarse for the visible
+            range
+        """
+        for level in reversed(range(len(self.levels))):
+            dx, dy = self._bin_size(level)
+            visible_x, visible_y = x_range[1] - x_range[0], y_range[1] - y_range[0]
+            # x holds integer time steps, so bins narrower than one step add nothing
+            if visible_x / dx < min(width, visible_x) or visible_y / dy < height:
+                continue
+            counts = self.levels[level]
+            x0 = max(0, int((x_range[0] - self.x_range[0]) // dx))
+            x1 = min(counts.shape[1], int(np.ceil((x_range[1] - self.x_range[0]) / dx)))
+            y0 = max(0, int((y_range[0] - self.y_range[0]) // dy))
+            y1 = min(counts.shape[0], int(np.ceil((y_range[1] - self.y_range[0]) / dy)))
+            # A range panned past the data gives an empty tile
+            x1, y1 = max(x0, x1), max(y0, y1)
+            tile = {
+                "counts": counts[y0:y1, x0:x1],
+                "x": self.x_range[0] + (np.arange(x0, x1) + 0.5) * dx,
+                "y": self.y_range[0] + (np.arange(y0, y1) + 0.5) * dy,
+            }
+            if x1 == x0 or y1 == y0:
+                return tile["counts"], tile["x"], tile["y"]
+            # Levels halve both axes at once, so the level fine enough along one axis
+            # can hold many times the wanted bins along the other
+            block_y = max(1, (y1 - y0) // height)
+            block_x = max(1, (x1 - x0) // max(1, width))
+            tile = downsample_grid(
+                tile, -(-(x1 - x0) // block_x), -(-(y1 - y0) // block_y)
+            )
+            return tile["counts"], tile["x"], tile["y"]
+        return None
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Arrays from which `from_arrays` rebuilds the pyramid"""
+        return {
+            "counts": self.levels[0],
+            "x_range": np.array(self.x_range),
+            "y_range": np.array(self.y_range),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> "TilePyramid":
+        return cls(arrays["counts"], arrays["x_range"], arrays["y_range"])
+
+
+class QuantileSketch:
+    """Mergeable approximate quantile sketch over every column of a matrix.
+
+    A KLL style sketch, vectorised across columns: each level holds a block of rows
+    that each stand for `2**level` samples, and full levels are compacted by sorting
+    every column and promoting every other row. Since every chunk adds the same
+    number of samples to every column, all columns share the same level layout.
+    The normalised rank error is roughly 2 / `k`; the min and max are exact.
+    """
+
+    def __init__(self, k: int = 200, seed: int = None):
+        self.k = k
+        self.levels: list[np.ndarray] = []
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _add_to_level(self, level: int, rows: np.ndarray) -> None:
+        if level == len(self.levels):
+            self.levels.append(rows)
+        else:
+            self.levels[level] = np.concatenate([self.levels[level], rows])
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            rows = self.levels[level]
+            if rows.shape[0] <= self._capacity(level):
+                level += 1
+                continue
+            rows = np.sort(rows, axis=0)
+            # An odd row out stays behind so that the total weight is preserved
+            n_even = rows.shape[0] // 2 * 2
+            offset = self._rng.integers(2)
+            self.levels[level] = rows[n_even:]
+            self._add_to_level(level + 1, rows[offset:n_even:2])
+            level = 0  # Capacities shrink as the sketch grows taller
+
+    def update(self, chunk: np.ndarray) -> "QuantileSketch":
+        """Add a chunk of samples of shape (particles, time)"""
+        chunk = np.asarray(chunk)
+        if chunk.shape[0] == 0:
+            return self
+        chunk_min, chunk_max = chunk.min(axis=0), chunk.max(axis=0)
+        if self.count == 0:
+            self.min, self.max = chunk_min, chunk_max
+        else:
+            self.min = np.minimum(self.min, chunk_min)
+            self.max = np.maximum(self.max, chunk_max)
+        self.count += chunk.shape[0]
+        self._add_to_level(0, chunk)
+        self._compress()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Merge another sketch over the same columns into this one"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min = np.minimum(self.min, other.min)
+            self.max = np.maximum(self.max, other.max)
+        self.count += other.count
+        for level, rows in enumerate(other.levels):
+            self._add_to_level(level, rows)
+        self._compress()
+        return self
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """Approximate quantiles of every column.
+
+        Args:
+            qs: Quantiles in [0, 1]
+
+        Returns:
+            np.ndarray: Array of shape (len(qs), time)
+        """
+        if self.count == 0:
+            raise ValueError("Cannot compute quantiles of an empty sketch")
+        qs = np.asarray(qs, dtype=np.float64)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [
+                np.full(rows.shape[0], 2**level)
+                for level, rows in enumerate(self.levels)
+            ]
+        )
+        order = np.argsort(values, axis=0)
+        values = np.take_along_axis(values, order, axis=0)
+        cumulative = np.cumsum(weights[order], axis=0)
+        targets = qs[:, None] * cumulative[-1]
+        ranks = (cumulative[None, :, :] >= targets[:, None, :]).argmax(axis=1)
+        result = np.take_along_axis(values, ranks, axis=0)
+
+        # Extremes are tracked exactly
+        result[qs == 0] = self.min
+        result[qs == 1] = self.max
+        return result
+
+
+class ExactQuantiles:
+    """Exact quantiles of every column. Keeps all samples, so it is only suited to
+    data that fits in memory; merging is exact."""
+
+    def __init__(self, dtype=None):
+        self.dtype = dtype
+        self.chunks: list[np.ndarray] = []
+        # Weight of every particle of every chunk, None for unweighted chunks
+        self.weights: list[Optional[np.ndarray]] = []
+
+    def update(self, chunk: np.ndarray, weights: np.ndarray = None) -> "ExactQuantiles":
+        """Add a chunk of samples of shape (particles, time).
+
+        Args:
+            chunk: Samples
+            weights: Optional weight of every particle of `chunk`, see
+                `weighted_quantiles`
+        """
+        self.chunks.append(chunk)
+        self.weights.append(weights)
+        return self
+
+    def merge(self, other: "ExactQuantiles") -> "ExactQuantiles":
+        """Merge the samples of another state over the same columns into this one"""
+        self.chunks += other.chunks
+        self.weights += other.weights
+        return self
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """Exact quantiles of every column, see `quantiles` and `weighted_quantiles`"""
+        if not self.chunks:
+            raise ValueError("Cannot compute quantiles of an empty state")
+        # A single chunk, such as a memory mapped dataset, is not copied
+        data = self.chunks[0] if len(self.chunks) == 1 else np.concatenate(self.chunks)
+        if all(weights is None for weights in self.weights):
+            return quantiles(data, qs, dtype=self.dtype)
+        weights = np.concatenate(
+            [
+                np.ones(len(chunk)) if weights is None else weights
+                for chunk, weights in zip(self.chunks, self.weights)
+            ]
+        )
+        return weighted_quantiles(data, weights, qs, dtype=self.dtype)
+
+
+class ColumnQuantiles:
+    """Mergeable quantiles of every column of a (particles, time) matrix.
+
+    Chunks may split both particles and time steps, e.g. blocks from
+    `hdf_ops.iter_blocks`. Every band of time steps gets its own state, either
+    `ExactQuantiles`, which is exact, or `QuantileSketch`, which stays within a
+    normalised rank error of roughly 2 / `k`.
+    """
+
+    def __init__(self, method: str = "exact", k: int = 200, dtype=None):
+        """
+        Args:
+            method: "exact" or "sketch"
+            k: Accuracy parameter of the sketches
+            dtype: Numeric type to compute in
+        """
+        if method not in ("exact", "sketch"):
+            raise NotImplementedError(f"Quantile method {method} not implemented")
+        self.method = method
+        self.k = k
+        self.dtype = dtype
+        # First time step of every band -> state of the band
+        self.bands: dict[int, Union[ExactQuantiles, QuantileSketch]] = {}
+
+    def _new_state(self) -> Union[ExactQuantiles, QuantileSketch]:
+        if self.method == "exact":
+            return ExactQuantiles(dtype=self.dtype)
+        return QuantileSketch(k=self.k)
+
+    def update(
+        self, chunk: np.ndarray, column: int = 0, weights: np.ndarray = None
+    ) -> "ColumnQuantiles":
+        """Add a chunk of samples of shape (particles, time).
+
+        Args:
+            chunk: Samples, column `i` holding time step `column + i`. Chunks of a
+                band must always span the same time steps.
+            column: Time step of the first column of `chunk`
+            weights: Optional weight of every particle of `chunk`. Exact quantiles
+                only; sketches take equally weighted samples, which weighted samples
+                are turned into by `systematic_counts`.
+        """
+        state = self.bands.setdefault(column, self._new_state())
+        if self.method == "exact":
+            state.update(chunk, weights)
+            return self
+        if weights is not None:
+            raise ValueError("Quantile sketches do not take weighted samples")
+        if self.dtype is not None:
+            chunk = np.asarray(chunk).astype(self.dtype)
+        state.update(chunk)
+        return self
+
+    def merge(self, other: "ColumnQuantiles") -> "ColumnQuantiles":
+        """Merge a state of the same method and bands of time steps into this one"""
+        if other.method != self.method:
+            raise ValueError("Cannot merge quantile states of different methods")
+        for column, state in other.bands.items():
+            if column in self.bands:
+                self.bands[column].merge(state)
+            else:
+                self.bands[column] = state
+        return self
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """Quantiles of every column.
+
+        Returns:
+            np.ndarray: Array of shape (len(qs), time)
+        """
+        return np.concatenate(
+            [self.bands[column].quantiles(qs) for column in sorted(self.bands)],
+            axis=1,
+        )
@@ -0,0 +1,382 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import model_viz.config as config
+import model_viz.aggregation as aggregation
+import model_viz.hdf_ops as hdf_ops
+import model_viz.metrics as metrics
+from collections import OrderedDict
+from plotly.utils import PlotlyJSONEncoder
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional, Union
+
+# Bump whenever the layout of cached entries changes so stale entries are ignored
+CACHE_VERSION = 1
+
+
+def _writer_id() -> str:
+    """Unique name of the current thread across processes, for temporary files"""
+    return f"{os.getpid()}-{threading.get_ident()}"
+
+
+def _remove(path: str) -> None:
+    """Remove a cache entry, tolerating another process having removed it first"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _touch(path: str) -> None:
+    """Mark a cache entry as most recently used, tolerating another process having
+    evicted it since it was read"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _stat_entries(entries: list[os.DirEntry]) -> list[tuple[str, os.stat_result]]:
+    """Path and stat of every cache entry still there, other processes may have
+    evicted some since they were listed"""
+    stats = []
+    for entry in entries:
+        try:
+            stats.append((entry.path, entry.stat()))
+        except FileNotFoundError:
+            continue
+    return stats
+
+
+def evict_lru(entries: list[os.DirEntry], budget: int) -> int:
+    """Remove the least recently used files until their total size fits in `budget`
+
+    Returns:
+        int: Number of removed files
+    """
+    stats = sorted(_stat_entries(entries), key=lambda item: item[1].st_mtime)
+    total = sum(stat.st_size for _, stat in stats)
+    removed = 0
+    for path, stat in stats:
+        if total <= budget:
+            break
+        total -= stat.st_size
+        _remove(path)
+        removed += 1
+    return removed
+
+
+@dataclass
+class StatsCache:
+    """Sidecar `.npz` cache of summary statistics computed from HDF5 datasets.
+
+    Entries are keyed by source file path, its mtime and size, the dataset name and
+    the parameters of the computation, so any change to the source file results in
+    a miss. Entries are evicted least recently used first once the cache directory
+    grows beyond `max_size_mb`.
+    """
+
+    cache_dir: str = field(default_factory=lambda: config.Cache.cache_dir)
+    max_size_mb: int = field(default_factory=lambda: config.Cache.max_size_mb)
+    enabled: bool = field(default_factory=lambda: config.Cache.enabled)
+
+    def _entry_path(self, dataset, kind: str, params: dict) -> str:
+        path = dataset.file.filename
+        stat = os.stat(path)
+        identity = json.dumps(
+            [
+                CACHE_VERSION,
+                stat.st_mtime_ns,
+                stat.st_size,
+                dataset.name,
+                kind,
+                params,
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha256(identity.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{hdf_ops.source_key(path)}_{digest}.npz")
+
+    def get(self, dataset, kind: str, params: dict) -> Optional[Dict[str, np.ndarray]]:
+        """Return cached arrays for `dataset` or None on a miss"""
+        if not self.enabled:
+            return None
+        entry = self._entry_path(dataset, kind, params)
+        try:
+            with np.load(entry) as npz:
+                arrays = {key: npz[key] for key in npz.files}
+        except (OSError, ValueError):
+            return None
+        _touch(entry)
+        return arrays
+
+    def contains(self, dataset, kind: str, params: dict) -> bool:
+        """Whether arrays for `dataset` are cached, without loading them"""
+        return self.enabled and os.path.exists(self._entry_path(dataset, kind, params))
+
+    def put(self, dataset, kind: str, params: dict, arrays: Dict[str, np.ndarray]):
+        """Store `arrays` for `dataset` and evict old entries if over the size cap"""
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self._entry_path(dataset, kind, params)
+        tmp = f"{entry}.{_writer_id()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, entry)  # Atomic, so concurrent readers never see partial files
+        self.evict()
+
+    def get_or_compute(
+        self,
+        dataset,
+        kind: str,
+        params: dict,
+        compute: Callable[[], Dict[str, np.ndarray]],
+    ) -> Dict[str, np.ndarray]:
+        """Return cached arrays for `dataset`, computing and storing them on a miss.
+
+        Args:
+            dataset: Source `h5py.Dataset`. Anything else bypasses the cache.
+            kind: Name of the computation, e.g. the plotter name
+            params: Parameters the result depends on
+            compute: Callable producing the arrays on a miss
+        """
+        if not hasattr(dataset, "file"):
+            with metrics.span(f"aggregate.{kind}"):
+                return compute()
+        arrays = self.get(dataset, kind, params)
+        if arrays is None:
+            with metrics.span(f"aggregate.{kind}"):
+                arrays = compute()
+            self.put(dataset, kind, params, arrays)
+        return arrays
+
+    def _entries(self) -> list[os.DirEntry]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [
+            e
+            for e in os.scandir(self.cache_dir)
+            if e.name.endswith((".npz", ".json"))  # Stats and group indexes
+        ]
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in `max_size_mb`"""
+        evict_lru(self._entries(), self.max_size_mb * 1024**2)
+
+    def invalidate(self, path: str = None) -> None:
+        """Remove cached entries of source file `path`, or all entries if not given"""
+        prefix = f"{hdf_ops.source_key(path)}_" if path is not None else ""
+        for entry in self._entries():
+            if entry.name.startswith(prefix):
+                _remove(entry.path)
+
+
+class LRUCache:
+    """Thread-safe in-memory mapping holding at most `maxsize` entries"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FigureCache:
+    """Cache of serialised figures bounded by their total size in bytes.
+
+    With the "memory" backend figures are kept per process. With the "shared"
+    backend they are stored as files in `shared_dir`, e.g. on /dev/shm, so every
+    worker process on the host shares them. Figures are evicted least recently used
+    first, and keys should include the identity of the source file (see
+    `figure_key`) so that changed files are never served stale figures.
+    """
+
+    def __init__(self, max_size_mb: int, backend: str = "memory", shared_dir=None):
+        if backend not in ("memory", "shared"):
+            raise NotImplementedError(f"Figure cache backend {backend} not implemented")
+        self.budget = max_size_mb * 1024**2
+        self.backend = backend
+        self.shared_dir = shared_dir
+        self.enabled = True
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _count(self, metric: str, n: int = 1) -> None:
+        with self._lock:
+            self._metrics[metric] += n
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.shared_dir, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[bytes]:
+        if self.backend == "memory":
+            with self._lock:
+                if key not in self._entries:
+                    return None
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        try:
+            with open(self._path(key), "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        _touch(self._path(key))
+        return blob
+
+    def _store(self, key: str, blob: bytes) -> None:
+        if self.backend == "memory":
+            with self._lock:
+                if key in self._entries:
+                    self._size -= len(self._entries.pop(key))
+                self._entries[key] = blob
+                self._size += len(blob)
+                while self._size > self.budget and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+                    self._metrics["evictions"] += 1
+            return
+        os.makedirs(self.shared_dir, exist_ok=True)
+        tmp = f"{self._path(key)}.{_writer_id()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, self._path(key))
+        entries = [e for e in os.scandir(self.shared_dir) if e.name.endswith(".json")]
+        self._count("evictions", evict_lru(entries, self.budget))
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached figure of `key` or None on a miss"""
+        blob = self._load(key) if self.enabled else None
+        self._count("misses" if blob is None else "hits")
+        return json.loads(blob) if blob is not None else None
+
+    def put(self, key: str, figure: dict) -> None:
+        """Serialise and store `figure` under `key`, evicting old figures if needed"""
+        if self.enabled:
+            blob = json.dumps(figure, cls=PlotlyJSONEncoder).encode()
+            if len(blob) <= self.budget:
+                self._store(key, blob)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.backend == "shared" and os.path.isdir(self.shared_dir):
+            for entry in os.scandir(self.shared_dir):
+                _remove(entry.path)
+
+    def metrics(self) -> dict[str, int]:
+        """Hit, miss and eviction counts of this process along with the cache size"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["entries"], metrics["bytes"] = len(self._entries), self._size
+        if self.backend == "shared" and os.path.isdir(self.shared_dir):
+            stats = _stat_entries(
+                [e for e in os.scandir(self.shared_dir) if e.name.endswith(".json")]
+            )
+            metrics["entries"] = len(stats)
+            metrics["bytes"] = sum(stat.st_size for _, stat in stats)
+        return metrics
+
+
+def figure_key(paths: Union[str, list[str]], group_name: str, graph_type: str) -> str:
+    """Figure cache key of a plotting group rendered as `graph_type`.
+
+    The key covers the identity of the file, or of every file of a comparison, and
+    the configuration, so figures are rendered again once either changes.
+    """
+    files = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        stat = os.stat(path)
+        files.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+    settings = {
+        section: dict(config.configuration[section])
+        for section in config.configuration.sections()
+    }
+    identity = json.dumps(
+        [files, group_name, graph_type, settings],
+        sort_keys=True,
+    )
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+# Caches shared by the whole process, created on first access by `__getattr__`
+_SHARED_CACHES: dict[str, Callable[[], Any]] = {
+    "stats_cache": StatsCache,
+    "drilldown_cache": lambda: LRUCache(config.Cache.drilldown_entries),
+    "figure_cache": lambda: FigureCache(
+        config.Cache.figure_cache_mb,
+        config.Cache.figure_backend,
+        config.Cache.figure_shared_dir,
+    ),
+}
+_shared_caches_lock = threading.Lock()
+
+
+def _shared_cache(name: str) -> Any:
+    with _shared_caches_lock:
+        if name not in globals():
+            globals()[name] = _SHARED_CACHES[name]()
+    return globals()[name]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _SHARED_CACHES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _shared_cache(name)
+
+
+def column_histogram(
+    dataset, column: int, bins: int, weights: np.ndarray = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Histogram of one column of `dataset`, served from `drilldown_cache`.
+
+    On a miss the whole chunk-aligned band around `column` is read and binned, so
+    sweeping along the time axis mostly hits the cache.
+
+    Args:
+        dataset: `h5py.Dataset` of shape (particles, time)
+        column: Column (time) index
+        bins: Number of bins
+        weights: Optional importance weight of every particle, see
+            `hdf_ops.group_weights`
+
+    Returns:
+        tuple: Counts of shape (bins,) and bin edges of shape (bins + 1,)
+    """
+    path = dataset.file.filename
+    key = (path, os.stat(path).st_mtime_ns, dataset.name, bins, weights is not None)
+    drilldown_cache = _shared_cache("drilldown_cache")
+    histogram = drilldown_cache.get((*key, column))
+    if histogram is None:
+        start, band = hdf_ops.column_band(dataset, column)
+        counts, edges = aggregation.column_histograms(band, bins, weights)
+        for offset in range(band.shape[1]):
+            drilldown_cache.put((*key, start + offset), (counts[offset], edges[offset]))
+        histogram = counts[column - start], edges[column - start]
+    return histogram
@@ -1,67 +1,360 @@
+"""Settings read from `config.ini`.
+
+Nothing is read at import: the configuration file is read, and every option parsed
+and validated, on first access to a setting. Invalid options thus fail at once rather
+than when first used. The file defaults to the `config.ini` of the repository and is
+replaced, for the current process and the worker processes it starts, by setting the
+`MODEL_VIZ_CONFIG` environment variable or by calling `load`, which sets it. A single
+setting is overridden by assigning to it, e.g. `config.Histogram2D.plot_width = 200`,
+but in the current process only: worker processes read the file again.
+"""
 import configparser
 import os
+import threading
 from datetime import datetime
+from typing import Any, Callable, Optional, Sequence
 
 # APP Settings
 MODEL_VIZ_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 runtime_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-config_file = os.path.join(MODEL_VIZ_BASE_DIR, "config.ini")
-
-configuration = configparser.ConfigParser()
-configuration.read(config_file)
-output_dir = configuration.get("APP", "output_dir")
-output_filename: str = os.path.join(
-    output_dir, f'{runtime_str}_{configuration.get("APP", "output_filename")}.pdf'
+config_file = os.environ.get(
+    "MODEL_VIZ_CONFIG", os.path.join(MODEL_VIZ_BASE_DIR, "config.ini")
 )
 
+# Configuration read by `load`, None until the first setting is accessed
+_configuration: Optional[configparser.ConfigParser] = None
+_load_lock = threading.Lock()
+# Settings declared by the classes below, in declaration order
+_options: list["Option"] = []
+
+
+class Option:
+    """Setting of a settings class, read from an option of the configuration file"""
+
+    def __init__(
+        self,
+        section: str,
+        option: str,
+        kind: type = str,
+        choices: Sequence = None,
+        optional: bool = False,
+    ):
+        """
+        Args:
+            section: Section of the configuration file
+            option: Option of the section
+            kind: Type of the setting: str, int, float or bool
+            choices: Values the setting may take, any if None
+            optional: Whether the option may be left empty, the setting is None then
+        """
+        self.section = section
+        self.option = option
+        self.kind = kind
+        self.choices = choices
+        self.optional = optional
+        self.value = None
+        _options.append(self)
+
+    def _read(self, configuration: configparser.ConfigParser) -> Any:
+        if (
+            self.optional
+            and not configuration.get(self.section, self.option, fallback="").strip()
+        ):
+            return None
+        getters = {
+            str: configuration.get,
+            int: configuration.getint,
+            float: configuration.getfloat,
+            bool: configuration.getboolean,
+        }
+        return getters[self.kind](self.section, self.option)
+
+    def parse(self, configuration: configparser.ConfigParser) -> None:
+        """Read and validate the setting
+
+        Raises:
+            ValueError: If the option is missing or invalid
+        """
+        try:
+            value = self._read(configuration)
+        except (configparser.Error, ValueError) as error:
+            raise ValueError(
+                f"Invalid option {self.option} of [{self.section}] in {config_file}: "
+                f"{error}"
+            ) from error
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(
+                f"Option {self.option} of [{self.section}] in {config_file} must be "
+                f"one of {tuple(self.choices)}, not {value!r}"
+            )
+        self.value = value
+
+    def __get__(self, instance, owner) -> Any:
+        if _configuration is None:
+            _load_once()
+        return self.value
+
+
+class Derived(Option):
+    """Setting computed from one or more options of the configuration file"""
+
+    def __init__(self, compute: Callable[[configparser.ConfigParser], Any]):
+        """
+        Args:
+            compute: Computes the setting from the configuration
+        """
+        super().__init__(section=None, option=None)
+        self.compute = compute
+
+    def _read(self, configuration: configparser.ConfigParser) -> Any:
+        return self.compute(configuration)
+
+
+def load(path: str = None) -> configparser.ConfigParser:
+    """Read the configuration file and validate all settings, replacing the
+    configuration read before.
+
+    Settings overridden by assignment stay overridden. A `path` is also set as the
+    `MODEL_VIZ_CONFIG` environment variable, so that the worker processes started
+    afterwards read the same file.
+
+    Args:
+        path: Configuration file. Defaults to `config_file`.
+
+    Returns:
+        configparser.ConfigParser: The configuration
+
+    Raises:
+        FileNotFoundError: If the configuration file does not exist
+        ValueError: If an option is missing or invalid
+    """
+    global _configuration, config_file
+    with _load_lock:
+        config_file = os.path.abspath(path) if path else config_file
+        configuration = configparser.ConfigParser()
+        if not configuration.read(config_file):
+            raise FileNotFoundError(f"Configuration file {config_file} not found")
+        for option in _options:
+            option.parse(configuration)
+        _configuration = configuration
+        if path:
+            os.environ["MODEL_VIZ_CONFIG"] = config_file
+    return configuration
+
+
+def _load_once() -> configparser.ConfigParser:
+    """Load the configuration unless another thread already did"""
+    with _load_lock:
+        if _configuration is not None:
+            return _configuration
+    return load()
+
+
+def __getattr__(name: str) -> Any:
+    """Module-level settings, read on first access like those of the classes"""
+    if name == "configuration":
+        return _configuration or _load_once()
+    if name == "output_dir":
+        return App.output_dir
+    if name == "output_filename":
+        return App.output_filename
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _output_filename(configuration: configparser.ConfigParser) -> str:
+    # Exports are a single PDF, or a zip archive of pages in other formats
+    output_format = configuration.get("PLOTTER", "output_format")
+    return os.path.join(
+        configuration.get("APP", "output_dir"),
+        f'{runtime_str}_{configuration.get("APP", "output_filename")}.'
+        f'{"pdf" if output_format == "pdf" else "zip"}',
+    )
+
+
+class App:
+    output_dir: str = Option("APP", "output_dir")
+    output_filename: str = Derived(_output_filename)
+
+
+# HDF Settings
+class HDF:
+    chunk_budget_mb: int = Option("HDF", "chunk_budget_mb", int)
+    memory_map: bool = Option("HDF", "memory_map", bool)
+    prefer_optimized: bool = Option("HDF", "prefer_optimized", bool)
+    optimized_suffix: str = Option("HDF", "optimized_suffix")
+
+
+# Conversion Settings
+class Convert:
+    chunk_columns: int = Option("CONVERT", "chunk_columns", int)
+    chunk_kb: int = Option("CONVERT", "chunk_kb", int)
+    compression: str = Option(
+        "CONVERT", "compression", choices=("none", "lzf", "gzip", "blosc")
+    )
+    pyramid_levels: int = Option("CONVERT", "pyramid_levels", int)
+
+
+# Cache Settings
+class Cache:
+    enabled: bool = Option("CACHE", "enabled", bool)
+    cache_dir: str = Option("CACHE", "cache_dir")
+    max_size_mb: int = Option("CACHE", "max_size_mb", int)
+    drilldown_entries: int = Option("CACHE", "drilldown_entries", int)
+    figure_cache_mb: int = Option("CACHE", "figure_cache_mb", int)
+    figure_backend: str = Option(
+        "CACHE", "figure_backend", choices=("memory", "shared")
+    )
+    figure_shared_dir: str = Option("CACHE", "figure_shared_dir")
+
+
+# Parallel Aggregation Settings
+class Aggregate:
+    backend: str = Option("AGGREGATE", "backend", choices=("thread", "process"))
+    workers: int = Option("AGGREGATE", "workers", int)
+    memory_budget_mb: int = Option("AGGREGATE", "memory_budget_mb", int)
+
+
+# Export Settings
+class Export:
+    workers: int = Option("EXPORT", "workers", int)
+    batch_size: int = Option("EXPORT", "batch_size", int)
+    raster_max_width: int = Option("EXPORT", "raster_max_width", int)
+    raster_max_height: int = Option("EXPORT", "raster_max_height", int)
+
+
+# Batch Report Settings
+class Report:
+    page_dir: str = Derived(
+        lambda configuration: os.path.join(
+            configuration.get("APP", "output_dir"),
+            configuration.get("REPORT", "page_dir"),
+        )
+    )
+    max_size_mb: int = Option("REPORT", "max_size_mb", int)
+
+
+# Background Job Settings
+class Jobs:
+    workers: int = Option("JOBS", "workers", int)
+    database: str = Derived(
+        lambda configuration: os.path.join(
+            configuration.get("APP", "output_dir"),
+            configuration.get("JOBS", "database"),
+        )
+    )
+
+
+# Live Mode Settings
+class Live:
+    poll_ms: int = Option("LIVE", "poll_ms", int)
+    y_margin: float = Option("LIVE", "y_margin", float)
+
+
+# Instrumentation Settings
+class Metrics:
+    enabled: bool = Option("METRICS", "enabled", bool)
+    endpoint: str = Option("METRICS", "endpoint")
+    profiling: bool = Option("METRICS", "profiling", bool)
+    profile_dir: str = Derived(
+        lambda configuration: os.path.join(
+            configuration.get("APP", "output_dir"),
+            configuration.get("METRICS", "profile_dir"),
+        )
+    )
+
+
+# Payload Settings
+class Payload:
+    binary_arrays: bool = Option("PAYLOAD", "binary_arrays", bool)
+    float32: bool = Option("PAYLOAD", "float32", bool)
+    max_overlay_points: int = Option("PAYLOAD", "max_overlay_points", int)
+    compress: bool = Option("PAYLOAD", "compress", bool)
+
+
+# Progressive Preview Settings
+class Preview:
+    enabled: bool = Option("PREVIEW", "enabled", bool)
+    target_ms: int = Option("PREVIEW", "target_ms", int)
+    initial_rows: int = Option("PREVIEW", "initial_rows", int)
+    min_rows: int = Option("PREVIEW", "min_rows", int)
+    poll_ms: int = Option("PREVIEW", "poll_ms", int)
+
 
 # Plotter Settings
 class Plotter:
-    output_dir: str = os.path.join(output_dir, runtime_str)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    output_file_format: str = configuration.get("PLOTTER", "output_format")
-    export_engine: str = configuration.get("PLOTTER", "export_engine")
-    width: int = configuration.getint("PLOTTER", "width")
-    height: int = configuration.getint("PLOTTER", "height")
-    is_xlabel_date: bool = configuration.getboolean("PLOTTER", "is_xlabel_date")
-    day_zero: str = configuration.get("PLOTTER", "day_zero")
-    graph_div_style: dict = {
-        "height": configuration.get("PLOTTER", "graph_div_height"),
-        "width": "100%",
-    }
-    theme: str = configuration.get("PLOTTER", "theme")
-    desired_tick_labels: int = configuration.getint("PLOTTER", "desired_tick_labels")
+    output_file_format: str = Option("PLOTTER", "output_format")
+    export_engine: str = Option("PLOTTER", "export_engine")
+    width: int = Option("PLOTTER", "width", int)
+    height: int = Option("PLOTTER", "height", int)
+    is_xlabel_date: bool = Option("PLOTTER", "is_xlabel_date", bool)
+    day_zero: str = Option("PLOTTER", "day_zero")
+    graph_div_style: dict = Derived(
+        lambda configuration: {
+            "height": configuration.get("PLOTTER", "graph_div_height"),
+            "width": "100%",
+        }
+    )
+    theme: str = Option("PLOTTER", "theme")
+    desired_tick_labels: int = Option("PLOTTER", "desired_tick_labels", int)
+    eager_plots: int = Option("PLOTTER", "eager_plots", int)
+    viewport_margin: float = Option("PLOTTER", "viewport_margin", float)
+    viewport_poll_ms: int = Option("PLOTTER", "viewport_poll_ms", int)
 
 
 class Histogram2D(Plotter):
-    title: str = configuration.get("HISTOGRAM2D", "title")
-    x_title: str = configuration.get("HISTOGRAM2D", "x_title")
-    y_title: str = configuration.get("HISTOGRAM2D", "y_title")
-    colorbar_title: str = configuration.get("HISTOGRAM2D", "colorbar_title")
-    colorbar_titleside: str = configuration.get("HISTOGRAM2D", "colorbar_titleside")
-    histfunc: str = configuration.get("HISTOGRAM2D", "histfunc")
-    scatter_mode: str = configuration.get("HISTOGRAM2D", "scatter_mode")
-    scatter_color: str = configuration.get("HISTOGRAM2D", "scatter_color")
-    colorscale: str = configuration.get("HISTOGRAM2D", "colorscale")
-    scatter_name: str = configuration.get("HISTOGRAM2D", "scatter_name")
+    title: str = Option("HISTOGRAM2D", "title")
+    x_title: str = Option("HISTOGRAM2D", "x_title")
+    y_title: str = Option("HISTOGRAM2D", "y_title")
+    colorbar_title: str = Option("HISTOGRAM2D", "colorbar_title")
+    colorbar_titleside: str = Option("HISTOGRAM2D", "colorbar_titleside")
+    histfunc: str = Option(
+        "HISTOGRAM2D", "histfunc", choices=("count", "sum", "avg", "min", "max")
+    )
+    scatter_mode: str = Option("HISTOGRAM2D", "scatter_mode")
+    scatter_color: str = Option("HISTOGRAM2D", "scatter_color")
+    colorscale: str = Option("HISTOGRAM2D", "colorscale")
+    plot_height: int = Option("HISTOGRAM2D", "plot_height", int)
+    plot_width: int = Option("HISTOGRAM2D", "plot_width", int)
+    pyramid_base_height: int = Option("HISTOGRAM2D", "pyramid_base_height", int)
+    pyramid_base_width: int = Option("HISTOGRAM2D", "pyramid_base_width", int)
+    zoom_plot_height: int = Option("HISTOGRAM2D", "zoom_plot_height", int)
+    zoom_plot_width: int = Option("HISTOGRAM2D", "zoom_plot_width", int)
+    streaming: bool = Option("HISTOGRAM2D", "streaming", bool)
+    binning: str = Option("HISTOGRAM2D", "binning", choices=("numpy", "datashader"))
+    y_scale: str = Option("HISTOGRAM2D", "y_scale", choices=("linear", "log"))
+    y_min: float = Option("HISTOGRAM2D", "y_min", float, optional=True)
+    y_max: float = Option("HISTOGRAM2D", "y_max", float, optional=True)
+    scatter_name: str = Option("HISTOGRAM2D", "scatter_name")
 
 
 class BoxPlotOverTime(Plotter):
-    title: str = configuration.get("BOXPLOTOVERTIME", "title")
-    x_title: str = configuration.get("BOXPLOTOVERTIME", "x_title")
-    y_title: str = configuration.get("BOXPLOTOVERTIME", "y_title")
-    boxpoints: bool = configuration.getboolean("BOXPLOTOVERTIME", "boxpoints")
-    showlegend: bool = configuration.getboolean("BOXPLOTOVERTIME", "showlegend")
-    scatter_mode: str = configuration.get("BOXPLOTOVERTIME", "scatter_mode")
-    scatter_color: str = configuration.get("BOXPLOTOVERTIME", "scatter_color")
-    plot_fences: bool = configuration.getboolean("BOXPLOTOVERTIME", "plot_fences")
-    scatter_name: str = configuration.get("BOXPLOTOVERTIME", "scatter_name")
+    title: str = Option("BOXPLOTOVERTIME", "title")
+    x_title: str = Option("BOXPLOTOVERTIME", "x_title")
+    y_title: str = Option("BOXPLOTOVERTIME", "y_title")
+    boxpoints: bool = Option("BOXPLOTOVERTIME", "boxpoints", bool)
+    showlegend: bool = Option("BOXPLOTOVERTIME", "showlegend", bool)
+    scatter_mode: str = Option("BOXPLOTOVERTIME", "scatter_mode")
+    scatter_color: str = Option("BOXPLOTOVERTIME", "scatter_color")
+    plot_fences: bool = Option("BOXPLOTOVERTIME", "plot_fences", bool)
+    scatter_name: str = Option("BOXPLOTOVERTIME", "scatter_name")
+    quantile_method: str = Option(
+        "BOXPLOTOVERTIME", "quantile_method", choices=("exact", "sketch")
+    )
+    sketch_k: int = Option("BOXPLOTOVERTIME", "sketch_k", int)
+    stats_dtype: str = Option(
+        "BOXPLOTOVERTIME", "stats_dtype", choices=("float64", "float32")
+    )
+
+
+class Comparison(Plotter):
+    title: str = Option("COMPARISON", "title")
+    layout: str = Option("COMPARISON", "layout", choices=("overlay", "facet"))
 
 
 class Histogram(Plotter):
-    x_title: str = configuration.get("HISTOGRAM", "x_title")
-    y_title: str = configuration.get("HISTOGRAM", "y_title")
-    line_color: str = configuration.get("HISTOGRAM", "line_color")
-    line_dash: str = configuration.get("HISTOGRAM", "line_dash")
-    line_width: int = configuration.getint("HISTOGRAM", "line_width")
+    bins: int = Option("HISTOGRAM", "bins", int)
+    x_title: str = Option("HISTOGRAM", "x_title")
+    y_title: str = Option("HISTOGRAM", "y_title")
+    line_color: str = Option("HISTOGRAM", "line_color")
+    line_dash: str = Option("HISTOGRAM", "line_dash")
+    line_width: int = Option("HISTOGRAM", "line_width", int)
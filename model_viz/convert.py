@@ -0,0 +1,160 @@
+"""Rewrite a model output file into a copy optimized for model-viz.
+
+Usage:
+    python -m model_viz.convert /path/to/hdf5/file [-o OUTPUT] [--compression lzf]
+
+The copy keeps the group layout of the source, but the `data` datasets are chunked
+in narrow bands of time steps so that reading a single time step is cheap, are
+optionally compressed and come with time-decimated pyramid levels. `HDFReader`
+opens the copy instead of the source as long as the source has not changed.
+"""
+import argparse
+import os
+import sys
+import h5py
+import model_viz.config as config
+import model_viz.hdf_ops as hdf_ops
+
+COMPRESSIONS = ("none", "lzf", "gzip", "blosc")
+
+
+def _compression_options(compression: str) -> dict:
+    """Keyword arguments of `create_dataset` for the given compression filter"""
+    if compression == "none":
+        return {}
+    if compression in ("lzf", "gzip"):
+        return {"compression": compression, "shuffle": True}
+    if compression == "blosc":
+        try:
+            import hdf5plugin
+        except ImportError as e:
+            raise ImportError(
+                "Blosc compression requires the hdf5plugin package"
+            ) from e
+        return dict(hdf5plugin.Blosc(cname="lz4", shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise NotImplementedError(f"Compression {compression} not implemented")
+
+
+def column_chunks(shape: tuple, itemsize: int, chunk_columns: int, chunk_kb: int):
+    """Chunk shape spanning few columns and as many rows as fit in `chunk_kb`"""
+    n_rows, n_cols = shape
+    cols = max(1, min(n_cols, chunk_columns))
+    rows = max(1, min(n_rows, chunk_kb * 1024 // (itemsize * cols)))
+    return rows, cols
+
+
+def _convert_data(source: h5py.Dataset, parent: h5py.Group, options: dict, args):
+    """Copy a (particles, time) dataset with column-friendly chunks and its pyramid"""
+    chunks = column_chunks(
+        source.shape, source.dtype.itemsize, args.chunk_columns, args.chunk_kb
+    )
+    target = parent.create_dataset(
+        source.name.split("/")[-1],
+        shape=source.shape,
+        dtype=source.dtype,
+        chunks=chunks,
+        **options,
+    )
+    target.attrs.update(source.attrs)
+
+    n_rows, n_cols = source.shape
+    levels = {}
+    for level in range(1, args.pyramid_levels + 1):
+        factor = 2**level
+        if n_cols // factor < 1:
+            break
+        width = -(-n_cols // factor)
+        levels[factor] = parent.require_group(hdf_ops.PYRAMID_GROUP).create_dataset(
+            str(factor),
+            shape=(n_rows, width),
+            dtype=source.dtype,
+            chunks=column_chunks(
+                (n_rows, width),
+                source.dtype.itemsize,
+                args.chunk_columns,
+                args.chunk_kb,
+            ),
+            **options,
+        )
+
+    for (row, col), block in hdf_ops.iter_blocks(source):
+        rows = slice(row, row + block.shape[0])
+        target[rows, col : col + block.shape[1]] = block
+        for factor, level in levels.items():
+            first = -col % factor  # First column of the block kept at this level
+            kept = block[:, first::factor]
+            if kept.shape[1]:
+                start = (col + first) // factor
+                level[rows, start : start + kept.shape[1]] = kept
+
+
+def convert(path: str, output: str = None, args=None) -> str:
+    """Write the optimized copy of `path`.
+
+    Args:
+        path: Source HDF5 file
+        output: Path of the copy. Defaults to `hdf_ops.optimized_path(path)`
+        args: Parsed command line options, defaults taken from `config.Convert`
+
+    Returns:
+        str: Path of the copy
+    """
+    args = args or parse_args([path])
+    output = output or hdf_ops.optimized_path(path)
+    options = _compression_options(args.compression)
+    stat = os.stat(path)
+    tmp = f"{output}.{os.getpid()}.tmp"
+
+    with h5py.File(path, "r") as source, h5py.File(tmp, "w") as target:
+
+        def visit(name, item):
+            if isinstance(item, h5py.Group):
+                target.require_group(name).attrs.update(item.attrs)
+            elif item.ndim == 2 and name.split("/")[-1] == "data":
+                parent = target.require_group(item.parent.name)
+                _convert_data(item, parent, options, args)
+            else:
+                source.copy(item, target.require_group(item.parent.name))
+
+        source.visititems(visit)
+        target.attrs.update(source.attrs)
+        target.attrs[hdf_ops.SOURCE_MTIME_ATTR] = stat.st_mtime_ns
+        target.attrs[hdf_ops.SOURCE_SIZE_ATTR] = stat.st_size
+        target.attrs[hdf_ops.OPTIMIZED_ATTR] = True
+
+    os.replace(tmp, output)  # Readers never pick up a half written copy
+    return output
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m model_viz.convert",
+        description="Rewrite a model output file into a copy optimized for model-viz",
+    )
+    parser.add_argument("path", help="HDF5 file to convert")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help=f"Output path, defaults to the input path with a "
+        f"{config.HDF.optimized_suffix} suffix",
+    )
+    parser.add_argument(
+        "--compression", choices=COMPRESSIONS, default=config.Convert.compression
+    )
+    parser.add_argument(
+        "--chunk-columns", type=int, default=config.Convert.chunk_columns
+    )
+    parser.add_argument("--chunk-kb", type=int, default=config.Convert.chunk_kb)
+    parser.add_argument(
+        "--pyramid-levels", type=int, default=config.Convert.pyramid_levels
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    print(convert(args.path, args.output, args))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,239 @@
+import io
+import multiprocessing
+import os
+import zipfile
+import h5py
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+import model_viz.aggregation as aggregation
+import model_viz.config as config
+import model_viz.metrics as metrics
+import model_viz.parallel as parallel
+import model_viz.plotting as plotting
+import model_viz.utils as utils
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+# Worker processes are kept alive between exports so their Kaleido instances stay warm
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _n_workers() -> int:
+    return config.Export.workers or os.cpu_count() or 1
+
+
+def _init_worker() -> None:
+    """Start Kaleido up front by rendering a blank figure"""
+    render_figure(go.Figure())
+
+
+def downsample_heatmaps(fig: go.Figure) -> go.Figure:
+    """Sum blocks of heatmap cells so that every heatmap of the figure is at most
+    `config.Export.raster_max_width` x `raster_max_height` cells.
+
+    Heatmaps are embedded in exported pages as one image of their cells, which
+    gets costly to render and store far beyond the resolution of the page.
+
+    Args:
+        fig: Figure whose heatmaps hold log10 counts, e.g. of `plotting.Histogram2D`
+
+    Returns:
+        go.Figure: `fig`, updated in place
+    """
+    max_width = config.Export.raster_max_width
+    max_height = config.Export.raster_max_height
+    if not max_width or not max_height:
+        return fig
+    for trace in fig.select_traces({"type": "heatmap"}):
+        if trace.z is None or trace.x is None or trace.y is None:
+            continue
+        z = np.asarray(trace.z, dtype=np.float64)
+        if z.shape[0] <= max_height and z.shape[1] <= max_width:
+            continue
+        grid = aggregation.downsample_grid(
+            {"counts": np.nan_to_num(10**z), "x": trace.x, "y": trace.y},
+            max_width,
+            max_height,
+            y_scale=config.Histogram2D.y_scale,
+        )
+        log_counts = np.full(grid["counts"].shape, np.nan)
+        np.log10(grid["counts"], out=log_counts, where=grid["counts"] > 0)
+        trace.update(z=log_counts, x=grid["x"], y=grid["y"])
+    return fig
+
+
+def render_figure(fig: go.Figure) -> bytes:
+    """Render a figure in the configured export format without touching disk.
+
+    Figures built by the plotters are valid by construction, so they are sent to
+    the Kaleido instance of the process as they are rather than validated again.
+    """
+    with metrics.span("export.render") as span:
+        page = pio.to_image(
+            downsample_heatmaps(fig),
+            format=config.Plotter.output_file_format,
+            engine=config.Plotter.export_engine,
+            width=config.Plotter.width,
+            height=config.Plotter.height,
+            validate=False,
+        )
+        span.add_bytes(len(page))
+    return page
+
+
+def _render_batch(batch: tuple) -> tuple[list[bytes], dict]:
+    """Build and render the plots of a batch of groups, run inside a worker process.
+
+    Returns:
+        tuple: Rendered pages, and the spans recorded while rendering them when
+        metrics are enabled in the app
+    """
+    tasks, record_metrics = batch
+    config.Metrics.enabled = record_metrics
+    metrics.registry.reset()
+    pages = []
+    for group, plotter in tasks:
+        if isinstance(group, dict):
+            runs = {label: parallel.open_group(*ref) for label, ref in group.items()}
+            plot = plotting.create_comparison_plot(runs, plotter)
+        else:
+            plot = plotting.create_group_plot(parallel.open_group(*group), plotter)
+        pages.append(render_figure(plot.fig))
+    return pages, metrics.registry.snapshot()
+
+
+def create_plot(group: Union[h5py.Group, dict], plotter: type):
+    """Create the plot of a group, or the comparison plot of a dict of run groups"""
+    if isinstance(group, dict):
+        return plotting.create_comparison_plot(group, plotter)
+    return plotting.create_group_plot(group, plotter)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the shared pool of rendering processes, starting it on first use"""
+    global _executor
+    if _executor is None:
+        # Forking a process holding open HDF5 handles is unsafe, hence spawn
+        _executor = ProcessPoolExecutor(
+            max_workers=_n_workers(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def shutdown() -> None:
+    """Stop the rendering processes, they are started again on next use"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def render_groups(groups: list, plotter: type) -> Iterator[bytes]:
+    """Render the plots of `groups` in parallel, yielding pages in group order.
+
+    Workers are sent batches of `config.Export.batch_size` groups, which they
+    render one after the other through their own Kaleido instance. Batches are held
+    back while the groups being rendered add up to
+    `config.Aggregate.memory_budget_mb`. The spans recorded by the workers are
+    merged into the metrics of this process.
+
+    Args:
+        groups: HDF5 plotting groups, or dicts of the groups of several runs by run
+            label to render comparison plots
+        plotter: Plotter class to use
+
+    Yields:
+        bytes: Rendered page of every group
+    """
+    if _n_workers() == 1:
+        for group in groups:
+            yield render_figure(create_plot(group, plotter).fig)
+        return
+
+    batch_size = max(1, config.Export.batch_size)
+    tasks = [(parallel.group_ref(group), plotter) for group in groups]
+    sizes = [parallel.group_size_mb(group) for group in groups]
+    batches = [
+        (tasks[i : i + batch_size], config.Metrics.enabled)
+        for i in range(0, len(tasks), batch_size)
+    ]
+    batch_sizes = [
+        sum(sizes[i : i + batch_size]) for i in range(0, len(sizes), batch_size)
+    ]
+    for pages, spans in parallel.map_bounded(
+        _render_batch, batches, batch_sizes, get_executor()
+    ):
+        metrics.registry.merge(spans)
+        yield from pages
+
+
+def page_name(index: int, group: Union[h5py.Group, dict]) -> str:
+    """File name of the page of a group within an archive of image pages"""
+    if isinstance(group, dict):
+        group = next(iter(group.values()))
+    name = group.name.strip("/").replace("/", "_")
+    return f"{index:04d}_{name}.{config.Plotter.output_file_format}"
+
+
+def write_pages(pages: Iterable[tuple[str, bytes]], output_file: str) -> str:
+    """Write rendered pages into a single file, as they come.
+
+    PDF pages are merged into a single PDF. Pages in other formats, such as PNG or
+    SVG (see `config.Plotter.output_file_format`), are stored in a zip archive.
+
+    Args:
+        pages: File name of every page within a zip archive, and the page
+        output_file: Path of the merged PDF or of the zip archive
+
+    Returns:
+        str: Path of the merged PDF or of the zip archive
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    if config.Plotter.output_file_format == "pdf":
+        utils.merge_pdf_files((io.BytesIO(page) for _, page in pages), output_file)
+        return output_file
+
+    # Images are mostly compressed already, text formats such as SVG are not
+    compression = (
+        zipfile.ZIP_DEFLATED
+        if config.Plotter.output_file_format in ("svg", "eps")
+        else zipfile.ZIP_STORED
+    )
+    with zipfile.ZipFile(output_file, "w", compression=compression) as archive:
+        for name, page in pages:
+            archive.writestr(name, page)
+    return output_file
+
+
+def export_groups(
+    groups: list,
+    plotter: type,
+    output_file: str,
+    progress: Callable[[int, int], None] = None,
+) -> str:
+    """Render the plots of `groups` into a single file.
+
+    Pages are appended to the output as soon as they are rendered, in order (see
+    `write_pages`).
+
+    Args:
+        groups: HDF5 plotting groups, or dicts of run groups (see `render_groups`)
+        plotter: Plotter class to use
+        output_file: Path of the merged PDF or of the zip archive
+        progress: Optional callback called with (pages done, total pages)
+
+    Returns:
+        str: Path of the merged PDF or of the zip archive
+    """
+
+    def pages():
+        rendered = render_groups(groups, plotter)
+        for index, (group, page) in enumerate(zip(groups, rendered)):
+            yield page_name(index, group), page
+            if progress is not None:
+                progress(index + 1, len(groups))
+
+    return write_pages(pages(), output_file)
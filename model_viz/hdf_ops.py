@@ -1,17 +1,90 @@
+import hashlib
+import json
+import os
 import h5py
-from dataclasses import dataclass
+import numpy as np
+import model_viz.config as config
+import model_viz.metrics as metrics
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, Optional, Tuple
+
+
+# Root attributes written by `model_viz.convert` to tie an optimized copy to its source
+OPTIMIZED_ATTR = "model_viz_optimized"
+SOURCE_MTIME_ATTR = "model_viz_source_mtime_ns"
+SOURCE_SIZE_ATTR = "model_viz_source_size"
+# Subgroup of a plotting group holding time-decimated copies of `data`
+PYRAMID_GROUP = "data_pyramid"
+# Optional dataset of a plotting group holding the importance weight of every particle
+WEIGHTS_DATASET = "weights"
+
+
+def source_key(path: str) -> str:
+    """Stable key prefix shared by all cache entries of one source file"""
+    return hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+
+
+@dataclass
+class GroupInfo:
+    """Metadata of a plotting group, available without keeping the group open"""
+
+    name: str
+    # Dataset name -> {"shape": [...], "dtype": "..."}
+    datasets: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def title(self) -> str:
+        return self.name.split("/")[-1]
+
+
+def optimized_path(path: str) -> str:
+    """Path of the viz-optimized copy of `path` written by `model_viz.convert`"""
+    return os.path.splitext(path)[0] + config.HDF.optimized_suffix
+
+
+def is_optimized_copy(copy_path: str, source_path: str) -> bool:
+    """Whether `copy_path` is an up-to-date optimized copy of `source_path`"""
+    if not os.path.exists(copy_path):
+        return False
+    stat = os.stat(source_path)
+    try:
+        with h5py.File(copy_path, "r") as copy:
+            attrs = copy.attrs
+            return (
+                bool(attrs.get(OPTIMIZED_ATTR, False))
+                and attrs.get(SOURCE_MTIME_ATTR) == stat.st_mtime_ns
+                and attrs.get(SOURCE_SIZE_ATTR) == stat.st_size
+            )
+    except OSError:
+        return False
 
 
 @dataclass
 class HDFReader:
-    """Class for creating HDF5 reader"""
+    """Class for creating HDF5 reader
+
+    When reading, an up-to-date optimized copy of `path` (see `model_viz.convert`)
+    is opened instead of `path` itself if one exists. With `swmr` the file is opened
+    SWMR-read so that data appended by a running model shows up after `refresh`.
+    """
 
     name: str
     path: str
     mode: str = "r"
+    prefer_optimized: bool = field(default_factory=lambda: config.HDF.prefer_optimized)
+    swmr: bool = False
 
     def __post_init__(self):
-        self.hdf = h5py.File(self.path, self.mode)
+        self.data_path = self.path
+        if self.swmr:
+            self.hdf = h5py.File(self.path, "r", libver="latest", swmr=True)
+            self.__data = self.hdf
+            return
+        if self.mode == "r" and self.prefer_optimized:
+            copy_path = optimized_path(self.path)
+            if is_optimized_copy(copy_path, self.path):
+                self.data_path = copy_path
+        self.hdf = h5py.File(self.data_path, self.mode)
         self.__data = self.hdf
 
     def __getitem__(self, key):
@@ -23,6 +96,74 @@ class HDFReader:
     def __del__(self):
         self.hdf.close()
 
+    def _index_path(self) -> str:
+        return os.path.join(
+            config.Cache.cache_dir, f"{source_key(self.data_path)}_index.json"
+        )
+
+    def _scan_group_index(self) -> dict[str, list[GroupInfo]]:
+        """Record names, shapes and dtypes of all plotting groups, closing handles"""
+        index = {}
+        for root in self.__data:
+            index[root] = []
+            for item in self.__data[root]:
+                group = self.__data[f"{root}/{item}"]
+                info = GroupInfo(name=group.name)
+                for name, obj in group.items():
+                    if isinstance(obj, h5py.Dataset):
+                        info.datasets[name] = {
+                            "shape": list(obj.shape),
+                            "dtype": obj.dtype.str,
+                        }
+                index[root].append(info)
+        return index
+
+    def get_group_index(self) -> dict[str, list[GroupInfo]]:
+        """
+        Return metadata of the "plotting_groups" of all groups without opening them.
+
+        The index is cached on disk next to the statistics cache, so it is only
+        scanned again once the file changes. Files opened with `swmr` change all the
+        time and are always scanned.
+        """
+        if self.swmr:
+            return self._scan_group_index()
+        stat = os.stat(self.data_path)
+        identity = [stat.st_mtime_ns, stat.st_size]
+        index_path = self._index_path()
+        try:
+            with open(index_path) as f:
+                cached = json.load(f)
+            if cached["identity"] == identity:
+                return {
+                    root: [GroupInfo(**info) for info in infos]
+                    for root, infos in cached["index"].items()
+                }
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = self._scan_group_index()
+        if config.Cache.enabled:
+            os.makedirs(config.Cache.cache_dir, exist_ok=True)
+            tmp = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(
+                    {
+                        "identity": identity,
+                        "index": {
+                            root: [asdict(info) for info in infos]
+                            for root, infos in index.items()
+                        },
+                    },
+                    f,
+                )
+            os.replace(tmp, index_path)
+        return index
+
+    def get_groups(self, root_group: str) -> list[h5py.Group]:
+        """Open and return the "plotting_groups" of `root_group`"""
+        return self._get_group_items(root_group)
+
     def _get_group_items(self, group) -> list[h5py.Group]:
         """Iterates over items in a group"""
         return [self.__data[f"{group}/{item}"] for item in self.__data[group]]
@@ -45,8 +186,314 @@ class HDFReader:
             root_group: Root group to start searching from
             sub_group: List of groups to traverse
         """
-        group = self.__data[root_group]
-        sub_group = group.get("/".join(sub_group), None)
-        if sub_group is None:
-            raise ValueError(f"Group {sub_group} not found in {root_group}")
-        return sub_group
+        group = self.find_group(root_group, sub_group)
+        if group is None:
+            raise ValueError(f"Group {'/'.join(sub_group)} not found in {root_group}")
+        return group
+
+    def find_group(self, root_group: str, sub_group: list[str]) -> Optional[h5py.Group]:
+        """Like `get_group`, but return None if the file has no such group.
+
+        Groups are looked up in the file rather than in the group index, so that
+        the index is not read again.
+        """
+        group = self.__data.get(root_group, None)
+        if group is None:
+            return None
+        return group.get("/".join(sub_group), None)
+
+
+def refresh(group: h5py.Group) -> h5py.Group:
+    """Update the shapes of the datasets of a group opened SWMR-read to the data
+    appended since they were opened. Other groups are returned unchanged."""
+    if group.file.swmr_mode:
+        for item in group.values():
+            if isinstance(item, h5py.Dataset):
+                item.refresh()
+    return group
+
+
+def run_labels(paths: list[str]) -> list[str]:
+    """Short, unique labels of model runs named after their files"""
+    labels = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(set(labels)) < len(labels):
+        labels = [f"{i}: {label}" for i, label in enumerate(labels)]
+    return labels
+
+
+def align_group_indexes(
+    indexes: list[dict[str, list[GroupInfo]]]
+) -> dict[str, list[GroupInfo]]:
+    """Align the group indexes of several files by group name.
+
+    Args:
+        indexes: Group index of every file, see `HDFReader.get_group_index`
+
+    Returns:
+        dict: Every plotting group present in any of the files, by root group, in
+        order of first appearance
+    """
+    aligned = {}
+    for index in indexes:
+        for root, infos in index.items():
+            titles = {info.title for info in aligned.setdefault(root, [])}
+            aligned[root] += [info for info in infos if info.title not in titles]
+    return aligned
+
+
+def run_groups(
+    readers: dict[str, HDFReader], root_group: str, title: str
+) -> dict[str, h5py.Group]:
+    """The plotting group `title` of every run that has it, by run label"""
+    groups = {}
+    for label, reader in readers.items():
+        group = reader.find_group(root_group, [title])
+        if group is not None:
+            groups[label] = group
+    return groups
+
+
+def plotting_groups(
+    readers: dict[str, HDFReader], group_index: dict[str, list[GroupInfo]]
+) -> list:
+    """Every plotting group of `group_index`: the groups of a single file, or the
+    groups of every run by run label to plot comparisons"""
+    if len(readers) == 1:
+        reader = next(iter(readers.values()))
+        return [
+            reader.get_group(root, [info.title])
+            for root, infos in group_index.items()
+            for info in infos
+        ]
+    return [
+        run_groups(readers, root, info.title)
+        for root, infos in group_index.items()
+        for info in infos
+    ]
+
+
+def group_weights(group: h5py.Group) -> Optional[np.ndarray]:
+    """Importance weights of the particles of a plotting group, if it has any.
+
+    Weights are scaled to a mean of one, so that weighted counts are in units of
+    particles like unweighted ones.
+
+    Args:
+        group: Plotting group, optionally holding a `weights` dataset with one
+            weight per row of `data`
+
+    Returns:
+        np.ndarray: Weight of every particle, or None for an unweighted group
+    """
+    if WEIGHTS_DATASET not in group:
+        return None
+    weights = np.asarray(group[WEIGHTS_DATASET][()], dtype=np.float64).ravel()
+    n_rows = group["data"].shape[0]
+    if weights.shape != (n_rows,):
+        raise ValueError(
+            f"{group.name}/{WEIGHTS_DATASET} holds {weights.size} weights "
+            f"for {n_rows} particles"
+        )
+    total = weights.sum()
+    if not np.isfinite(total) or total <= 0 or (weights < 0).any():
+        raise ValueError(
+            f"{group.name}/{WEIGHTS_DATASET} must be non-negative with a positive sum"
+        )
+    return weights * (n_rows / total)
+
+
+def get_pyramid_level(group: h5py.Group, min_columns: int):
+    """Return the coarsest version of `data` in `group` with at least `min_columns`
+    columns.
+
+    Pyramid levels keep every `factor`-th time step of `data` and only exist in
+    optimized copies; `data` itself is returned when there is no suitable level.
+
+    Args:
+        group: Plotting group
+        min_columns: Minimum number of time steps wanted
+
+    Returns:
+        tuple: (dataset, factor) where column `i` of dataset is time step `i * factor`
+    """
+    level, factor = group["data"], 1
+    if PYRAMID_GROUP not in group:
+        return level, factor
+    pyramid = group[PYRAMID_GROUP]
+    for name in sorted(pyramid, key=int):
+        if pyramid[name].shape[1] < min_columns:
+            break
+        level, factor = pyramid[name], int(name)
+    return level, factor
+
+
+def memmap(dataset) -> Optional[np.memmap]:
+    """Zero-copy, read-only view of a dataset mapped straight from its file.
+
+    Only possible for contiguous, unfiltered datasets whose data has been written.
+    Pages are shared through the page cache by every process mapping the file.
+
+    Args:
+        dataset: `h5py.Dataset`
+
+    Returns:
+        np.memmap, or None if the layout of the dataset does not allow mapping
+    """
+    if not config.HDF.memory_map or not isinstance(dataset, h5py.Dataset):
+        return None
+    plist = dataset.id.get_create_plist()
+    if (
+        dataset.chunks is not None
+        or plist.get_nfilters() > 0
+        or plist.get_external_count() > 0
+        or dataset.dtype.hasobject
+        or dataset.size == 0
+    ):
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:  # Storage not allocated yet
+        return None
+    return np.memmap(
+        dataset.file.filename,
+        dtype=dataset.dtype,
+        mode="r",
+        offset=offset,
+        shape=dataset.shape,
+        order="C",
+    )
+
+
+def as_array(dataset) -> np.ndarray:
+    """Return the contents of a dataset as an array, without copying when possible.
+
+    Contiguous, unfiltered datasets are memory mapped (see `memmap`); other datasets
+    are read block by block into a single array.
+
+    Args:
+        dataset: `h5py.Dataset` or `np.ndarray`, which is returned as is
+    """
+    if isinstance(dataset, np.ndarray):
+        return dataset
+    view = memmap(dataset)
+    if view is not None:
+        return view
+    if dataset.ndim != 2:
+        with metrics.span("hdf.read") as span:
+            array = dataset[()]
+            span.add_bytes(array.nbytes)
+        return array
+    array = np.empty(dataset.shape, dtype=dataset.dtype)
+    for (row, col), block in iter_blocks(dataset):
+        array[row : row + block.shape[0], col : col + block.shape[1]] = block
+    return array
+
+
+def _aligned_extent(extent: int, chunk: int, budget: int) -> int:
+    """Largest multiple of `chunk` that fits in `budget`, clamped to [chunk, extent]"""
+    return max(1, min(extent, max(chunk, budget // chunk * chunk)))
+
+
+def iter_blocks(
+    dataset, budget_mb: int = None, columns: Tuple[int, int] = None
+) -> Iterator[Tuple[Tuple[int, int], np.ndarray]]:
+    """Iterate over a 2D dataset in blocks aligned with its on-disk chunk layout.
+
+    Blocks span as many whole chunks as fit in the memory budget. Full rows are
+    preferred; columns are only split when a single band of chunk rows is already
+    over budget. Works for both `h5py.Dataset` and in-memory `np.ndarray` inputs.
+
+    Args:
+        dataset: 2D dataset of shape (particles, time)
+        budget_mb: Maximum size of a block in MB. Defaults to `config.HDF.chunk_budget_mb`
+        columns: Optional (start, stop) range of columns to restrict the blocks to
+
+    Yields:
+        ((row_offset, col_offset), block) for every block of the dataset
+    """
+    if budget_mb is None:
+        budget_mb = config.HDF.chunk_budget_mb
+    n_rows, n_cols = dataset.shape
+    col_start, col_stop = columns if columns is not None else (0, n_cols)
+    chunks = getattr(dataset, "chunks", None)
+    # Blocks of a mapped dataset are views, so nothing is copied
+    view = memmap(dataset)
+    if view is not None:
+        dataset = view
+    span_name = "hdf.read" if isinstance(dataset, h5py.Dataset) else "hdf.map"
+    budget = max(1, budget_mb * 1024**2 // dataset.dtype.itemsize)
+    chunk_rows, chunk_cols = chunks or (1, n_cols)
+
+    block_cols = n_cols
+    if chunk_rows * n_cols > budget:
+        block_cols = _aligned_extent(n_cols, chunk_cols, budget // chunk_rows)
+    block_rows = _aligned_extent(n_rows, chunk_rows, budget // max(1, block_cols))
+
+    for row in range(0, n_rows, block_rows):
+        for col in range(col_start, col_stop, block_cols):
+            col_end = min(col + block_cols, col_stop)
+            with metrics.span(span_name) as span:
+                block = dataset[row : row + block_rows, col:col_end]
+                span.add_bytes(block.nbytes)
+            yield (row, col), block
+
+
+def column_band(dataset, column: int, budget_mb: int = None) -> tuple[int, np.ndarray]:
+    """Read the chunk-aligned band of columns around `column`.
+
+    Reading a single column of a chunked dataset reads every chunk it crosses in
+    full, so the neighbouring columns of those chunks come at little extra cost.
+
+    Args:
+        dataset: 2D dataset of shape (particles, time)
+        column: Column index the band must contain
+        budget_mb: Maximum size of the band in MB. Defaults to `config.HDF.chunk_budget_mb`
+
+    Returns:
+        (col_offset, band) where band holds columns [col_offset, col_offset + width)
+    """
+    if budget_mb is None:
+        budget_mb = config.HDF.chunk_budget_mb
+    n_rows, n_cols = dataset.shape
+    budget = max(1, budget_mb * 1024**2 // dataset.dtype.itemsize)
+    chunk_cols = (getattr(dataset, "chunks", None) or (n_rows, 1))[1]
+    width = min(chunk_cols, max(1, budget // max(1, n_rows)))
+    start = column - column % chunk_cols
+    start += (column - start) // width * width
+    view = memmap(dataset)
+    if view is not None:
+        dataset = view
+    with metrics.span("hdf.read" if view is None else "hdf.map") as span:
+        band = dataset[:, start : min(n_cols, start + width)]
+        span.add_bytes(band.nbytes)
+    return start, band
+
+
+def read_rows(dataset, rows: np.ndarray) -> np.ndarray:
+    """Read a selection of rows of a 2D dataset, such as a sample of particles.
+
+    Rows of a chunked dataset are read band of chunks by band of chunks, so that
+    every chunk is read at most once.
+
+    Args:
+        dataset: 2D dataset of shape (particles, time)
+        rows: Increasing row indexes, without repeats
+
+    Returns:
+        np.ndarray: Array of shape (len(rows), time)
+    """
+    view = memmap(dataset)
+    if view is not None or isinstance(dataset, np.ndarray):
+        with metrics.span("hdf.map") as span:
+            sample = (dataset if view is None else view)[rows]
+            span.add_bytes(sample.nbytes)
+        return sample
+    chunk_rows = (dataset.chunks or (1,))[0]
+    sample = np.empty((len(rows), dataset.shape[1]), dtype=dataset.dtype)
+    bands = np.flatnonzero(np.diff(rows // chunk_rows)) + 1
+    with metrics.span("hdf.read") as span:
+        for start, stop in zip([0, *bands], [*bands, len(rows)]):
+            first, last = rows[start], rows[stop - 1]
+            block = dataset[first : last + 1]
+            sample[start:stop] = block[rows[start:stop] - first]
+            span.add_bytes(block.nbytes)
+    return sample
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+import model_viz.config as config
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    pid INTEGER NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@dataclass
+class JobQueue:
+    """Local background job runner backed by an on-disk SQLite job table.
+
+    Jobs run on a thread pool of the submitting process, while their status lives
+    in the job table so that any process on the host can poll it. Submitting a job
+    whose key matches a queued or running job returns the existing job instead.
+    """
+
+    path: str = field(default_factory=lambda: config.Jobs.database)
+    workers: int = field(default_factory=lambda: config.Jobs.workers)
+    _executor: ThreadPoolExecutor = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False)
+
+    def __post_init__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute(_SCHEMA)
+        self._fail_orphans()
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _update(self, job_id: str, **columns) -> None:
+        columns["updated"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._connect() as db:
+            db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*columns.values(), job_id),
+            )
+
+    def _fail_orphans(self) -> None:
+        """Mark unfinished jobs whose owning process has died as failed"""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, pid FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+        for row in rows:
+            if not _is_alive(row["pid"]):
+                self._update(row["id"], status=FAILED, error="Job was interrupted")
+
+    def _run(self, job_id: str, fn: Callable, args: tuple) -> None:
+        self._update(job_id, status=RUNNING)
+
+        def progress(done: int, total: int):
+            self._update(job_id, done=done, total=total)
+
+        try:
+            result = fn(*args, progress=progress)
+        except Exception:
+            self._update(job_id, status=FAILED, error=traceback.format_exc())
+        else:
+            self._update(job_id, status=DONE, result=result)
+
+    def submit(self, key: str, fn: Callable[..., Optional[str]], *args) -> str:
+        """Submit `fn(*args, progress=callback)` to run in the background.
+
+        Args:
+            key: Deduplication key. While a job with the same key is queued or
+                running, its id is returned and no new job is started.
+            fn: Job function. Its return value is stored as the job result.
+            args: Positional arguments passed to `fn`
+
+        Returns:
+            str: Job id
+        """
+        self._fail_orphans()
+        with self._lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")  # Serialises submissions across processes
+            try:
+                row = db.execute(
+                    "SELECT id FROM jobs WHERE key = ? AND status IN (?, ?)",
+                    (key, QUEUED, RUNNING),
+                ).fetchone()
+                if row is not None:
+                    return row["id"]
+                job_id = uuid.uuid4().hex
+                now = time.time()
+                db.execute(
+                    "INSERT INTO jobs (id, key, status, pid, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, key, QUEUED, os.getpid(), now, now),
+                )
+            finally:
+                db.execute("COMMIT")
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Return the row of job `job_id` as a dict, or None if it does not exist"""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
@@ -0,0 +1,299 @@
+"""Live tail of HDF5 files still being written by a running model.
+
+Files are opened SWMR-read (see `HDFReader.swmr`). The aggregates of every plotted
+group are kept in memory and, on every poll, only the time steps or particles
+appended since the previous poll are read and folded into them.
+"""
+import threading
+import h5py
+import numpy as np
+import model_viz.config as config
+import model_viz.aggregation as aggregation
+import model_viz.hdf_ops as hdf_ops
+import model_viz.plotting as plotting
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Iterable
+
+
+class LiveAggregate(ABC):
+    """Statistics of a growing (particles, time) dataset, updated incrementally"""
+
+    def __init__(self, dataset: h5py.Dataset):
+        self.dataset = dataset
+        self.shape = (0, 0)
+        self.reset()
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Forget all samples seen so far"""
+
+    @abstractmethod
+    def _add_columns(self, blocks: Iterable[tuple[int, np.ndarray]]) -> bool:
+        """Fold in appended time steps, all particles included.
+
+        Args:
+            blocks: (time step of the first column, block) of the appended time
+                steps, as read by `hdf_ops.iter_blocks`. Particles may be split over
+                several blocks of the same time steps.
+
+        Returns:
+            bool: False if the block cannot be folded in and all samples must be
+            aggregated again
+        """
+
+    @abstractmethod
+    def _add_rows(self, block: np.ndarray) -> bool:
+        """Fold in appended particles of the time steps seen so far, see `_add_columns`"""
+
+    @abstractmethod
+    def stats(self) -> dict[str, np.ndarray]:
+        """Statistics in the format of the plotter's precomputed statistics"""
+
+    def update(self) -> bool:
+        """Fold in the samples appended since the last update.
+
+        Returns:
+            bool: Whether the dataset grew
+        """
+        if self.dataset.file.swmr_mode:
+            self.dataset.refresh()
+        shape = self.dataset.shape
+        if shape == self.shape:
+            return False
+
+        n_rows, n_cols = self.shape
+        if shape[0] < n_rows or shape[1] < n_cols:  # Rewritten rather than appended
+            n_rows, n_cols = 0, 0
+            self.reset()
+        folded = True
+        if n_rows < shape[0] and n_cols > 0:
+            folded = self._add_rows(self.dataset[n_rows : shape[0], :n_cols])
+        if folded and n_cols < shape[1]:
+            # Particles appended after `shape` was read are left for the next poll
+            blocks = (
+                (col, block[: shape[0] - row])
+                for (row, col), block in hdf_ops.iter_blocks(
+                    self.dataset, columns=(n_cols, shape[1])
+                )
+                if row < shape[0]
+            )
+            folded = self._add_columns(blocks)
+
+        self.shape = shape
+        if not folded:
+            self.shape = (0, 0)
+            self.reset()
+            return self.update()
+        return True
+
+
+class LiveCountGrid(LiveAggregate):
+    """Count grid of `plotting.Histogram2D` with one column of counts per time step.
+
+    Samples are binned as by `plotting.Histogram2D`, on its y scale and within its
+    `y_min` and `y_max` if set. Unset bounds follow the range of the samples seen
+    so far, padded by `config.Live.y_margin` (in decades on a log scale). Counts are
+    only recomputed from scratch once appended samples fall outside of it.
+    """
+
+    def __init__(self, dataset: h5py.Dataset):
+        self.y_range = None
+        super().__init__(dataset)
+
+    def reset(self) -> None:
+        self.counts = np.zeros((config.Histogram2D.plot_height, 0), dtype=np.int64)
+
+    def _bins_range(self) -> tuple[float, float]:
+        """Range of the y bins, any range before samples have been seen"""
+        if self.y_range is not None:
+            return self.y_range
+        return (1.0, 10.0) if config.Histogram2D.y_scale == "log" else (0.0, 1.0)
+
+    def _fits(self, block: np.ndarray) -> bool:
+        """Whether the block lies within the y range, widening the range if not.
+
+        The first samples to bin set the range, nothing has been counted before them.
+        """
+        log = config.Histogram2D.y_scale == "log"
+        y_min, y_max = config.Histogram2D.y_min, config.Histogram2D.y_max
+        # Samples Histogram2D does not count leave the range as it is
+        binned = np.isfinite(block) & (block > 0) if log else np.isfinite(block)
+        if y_min is not None:
+            binned &= block >= y_min
+        if y_max is not None:
+            binned &= block <= y_max
+        if not binned.any():
+            return True
+        low, high = block[binned].min(), block[binned].max()
+        if self.y_range is None:
+            fits = True
+        elif self.y_range[0] <= low and high <= self.y_range[1]:
+            return True
+        else:
+            fits = False
+            low, high = min(low, self.y_range[0]), max(high, self.y_range[1])
+        if log:
+            low, high = np.log10(low), np.log10(high)
+        margin = max(high - low, 1.0) * config.Live.y_margin
+        low, high = low - margin, high + margin
+        if log:
+            low, high = 10**low, 10**high
+        self.y_range = (
+            low if y_min is None else y_min,
+            high if y_max is None else y_max,
+        )
+        return fits
+
+    def _count(self, block: np.ndarray) -> np.ndarray:
+        return aggregation.binned_column_counts(
+            block,
+            self._bins_range(),
+            self.counts.shape[0],
+            config.Histogram2D.y_scale,
+        )
+
+    def _add_columns(self, blocks: Iterable[tuple[int, np.ndarray]]) -> bool:
+        # Time step of the first column of every band -> counts of the band
+        bands: dict[int, np.ndarray] = {}
+        for col, block in blocks:
+            if not self._fits(block):
+                return False
+            counts = self._count(block)
+            if col in bands:
+                bands[col] += counts
+            else:
+                bands[col] = counts
+        self.counts = np.concatenate(
+            [self.counts, *(bands[col] for col in sorted(bands))], axis=1
+        )
+        return True
+
+    def _add_rows(self, block: np.ndarray) -> bool:
+        if not self._fits(block):
+            return False
+        self.counts += self._count(block)
+        return True
+
+    def stats(self) -> dict[str, np.ndarray]:
+        """Count grid reduced to at most `config.Histogram2D.plot_width` columns"""
+        height, n_cols = self.counts.shape
+        # Bin centres, geometric ones on a log scale
+        y = aggregation.CountGrid(
+            (0, 1), self._bins_range(), 1, height, config.Histogram2D.y_scale
+        ).y
+        if n_cols <= config.Histogram2D.plot_width:
+            return {"counts": self.counts, "x": np.arange(n_cols), "y": y}
+        edges = np.linspace(0, n_cols, config.Histogram2D.plot_width + 1).astype(int)
+        return {
+            "counts": np.add.reduceat(self.counts, edges[:-1], axis=1),
+            "x": (edges[:-1] + edges[1:] - 1) / 2,
+            "y": y,
+        }
+
+
+class LiveBoxplotStats(LiveAggregate):
+    """Quantiles of `plotting.BoxPlotOverTime`, sketched per band of time steps.
+
+    Exact quantiles of a time step change with every new particle, so the samples
+    are kept in quantile sketches instead (see `aggregation.QuantileSketch`), into
+    which appended particles are merged like appended time steps. Quantiles stay
+    within the rank error of the sketches of the exact ones, roughly 2 / `sketch_k`
+    (see `config.BoxPlotOverTime`); the fences, the min and max, are exact.
+    """
+
+    def reset(self) -> None:
+        self.state = aggregation.ColumnQuantiles(
+            "sketch",
+            k=config.BoxPlotOverTime.sketch_k,
+            dtype=config.BoxPlotOverTime.stats_dtype,
+        )
+        # Time step of the first column of every band -> number of columns
+        self.band_widths: dict[int, int] = {}
+
+    def _add_columns(self, blocks: Iterable[tuple[int, np.ndarray]]) -> bool:
+        for col, block in blocks:
+            self.state.update(block, column=col)
+            self.band_widths[col] = block.shape[1]
+        return True
+
+    def _add_rows(self, block: np.ndarray) -> bool:
+        # Sketches of a band take chunks spanning all of its time steps
+        for col, width in self.band_widths.items():
+            self.state.update(block[:, col : col + width], column=col)
+        return True
+
+    @property
+    def quantiles(self) -> np.ndarray:
+        """Quantiles of every time step, of shape (len(quantiles), time)"""
+        if not self.state.bands:
+            return np.empty((len(plotting.BoxPlotOverTime.quantiles), 0))
+        return self.state.quantiles(plotting.BoxPlotOverTime.quantiles)
+
+    def stats(self) -> dict[str, np.ndarray]:
+        lower_fence, q1, median, q3, upper_fence = self.quantiles
+        return {
+            "lower_fence": lower_fence,
+            "q1": q1,
+            "median": median,
+            "q3": q3,
+            "upper_fence": upper_fence,
+        }
+
+
+AGGREGATES: dict[type, type[LiveAggregate]] = {
+    plotting.Histogram2D: LiveCountGrid,
+    plotting.BoxPlotOverTime: LiveBoxplotStats,
+}
+
+
+@dataclass
+class LiveSession:
+    """Live aggregates of the groups plotted so far, by group and plotter"""
+
+    aggregates: dict[tuple, LiveAggregate] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def update(self, group: h5py.Group, plotter: type) -> bool:
+        """Fold the samples appended to a group into its aggregate.
+
+        Args:
+            group: Plotting group of a file opened SWMR-read
+            plotter: Plotter class the group is shown with
+
+        Returns:
+            bool: Whether the group grew since its last update
+        """
+        if plotter not in AGGREGATES:
+            raise NotImplementedError(f"Live {plotter.name} not implemented")
+        key = (group.file.filename, group.name, plotter)
+        with self._lock:
+            if key not in self.aggregates:
+                self.aggregates[key] = AGGREGATES[plotter](group["data"])
+            return self.aggregates[key].update()
+
+    def create_plot(self, group: h5py.Group, plotter: type) -> plotting.BasePlotter:
+        """Create the plot of a group from its up-to-date live aggregate.
+
+        Args:
+            group: Plotting group of a file opened SWMR-read
+            plotter: Plotter class to use
+
+        Returns:
+            BasePlotter: Plotter whose figure has been created
+        """
+        self.update(group, plotter)
+        hdf_ops.refresh(group)
+        with self._lock:
+            aggregate = self.aggregates[(group.file.filename, group.name, plotter)]
+            stats = aggregate.stats()
+            # Time steps appended after the update are left for the next poll
+            data = group["data"]
+            overlay_data = (
+                hdf_ops.as_array(group["overlay_data"]).ravel()
+                if "overlay_data" in group
+                else None
+            )
+        plot = plotter(data=data, overlay_data=overlay_data, stats=stats)
+        plot.create_plot(title=group.name.split("/")[-1])
+        return plot
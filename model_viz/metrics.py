@@ -0,0 +1,270 @@
+"""Timings of the hot paths of the app, served in the Prometheus text format.
+
+Hot paths are wrapped in named spans (see `span`) that record how long they took
+and how many bytes they handled: HDF5 reads, aggregation, figure construction,
+serialization and export. Dash callbacks are timed as a whole by the app server
+(see `install`). Nothing is recorded unless `config.Metrics.enabled` is set;
+until then `span` returns a shared no-op context manager.
+
+Spans of export workers are sent back along with the pages they rendered and
+merged into the registry of the app (see `Registry.snapshot`). Spans of aggregation
+worker processes are recorded in the registry of the worker and are not served.
+"""
+import bisect
+import copy
+import os
+import threading
+import time
+import model_viz.config as config
+from typing import Optional
+
+# Upper bounds of the latency histogram buckets in seconds, as Prometheus clients use
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Dash sends the inputs of every server-side callback to this route
+CALLBACK_ROUTE = "/_dash-update-component"
+PROFILE_HEADER = "X-Model-Viz-Profile"
+PROFILE_COOKIE = "model_viz_profile"
+
+
+class Histogram:
+    """Latency histogram along with the total bytes handled by the timed code"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.bytes = 0
+
+    def observe(self, seconds: float, nbytes: int = 0) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.bytes += nbytes
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the observations of `other`, recorded with the same buckets"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.bytes += other.bytes
+
+
+class Registry:
+    """Histograms of every metric by the value of its label"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+
+    def observe(self, metric: str, label: str, seconds: float, nbytes: int = 0):
+        """Record one observation of `metric` for the label value `label`"""
+        with self._lock:
+            histogram = self._histograms.get((metric, label))
+            if histogram is None:
+                histogram = self._histograms[metric, label] = Histogram()
+            histogram.observe(seconds, nbytes)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self) -> dict[tuple[str, str], Histogram]:
+        """Copy of every histogram by (metric, label), e.g. to send to another process"""
+        with self._lock:
+            return copy.deepcopy(self._histograms)
+
+    def merge(self, snapshot: dict[tuple[str, str], Histogram]) -> None:
+        """Add the observations of a snapshot taken from another registry"""
+        with self._lock:
+            for key, other in snapshot.items():
+                histogram = self._histograms.setdefault(key, Histogram(other.buckets))
+                histogram.merge(other)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for metric, label_name, help_text in (
+            ("span", "span", "Time spent in instrumented hot paths"),
+            ("callback", "callback", "Latency of Dash callbacks, by output"),
+        ):
+            name = f"model_viz_{metric}_seconds"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (kind, label), histogram in histograms:
+                if kind != metric:
+                    continue
+                labels = f'{label_name}="{_escape(label)}"'
+                cumulative = 0
+                bounds = [*map(repr, histogram.buckets), "+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            name = f"model_viz_{metric}_bytes_total"
+            lines += [
+                f"# HELP {name} Bytes handled by the code timed by {name[:-12]}_seconds",
+                f"# TYPE {name} counter",
+            ]
+            for (kind, label), histogram in histograms:
+                if kind == metric:
+                    labels = f'{label_name}="{_escape(label)}"'
+                    lines.append(f"{name}{{{labels}}} {histogram.bytes}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _escape(label: str) -> str:
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_gauges(name: str, help_text: str, label: str, values: dict) -> str:
+    """Gauge metric with one sample per label value in the Prometheus text format"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for value_label, value in values.items():
+        lines.append(f'{name}{{{label}="{_escape(str(value_label))}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class Span:
+    """Times a block of code and counts the bytes it handled"""
+
+    __slots__ = ("name", "nbytes", "_start")
+
+    def __init__(self, name: str, nbytes: int = 0):
+        self.name = name
+        self.nbytes = nbytes
+
+    def add_bytes(self, nbytes: int) -> None:
+        self.nbytes += nbytes
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        registry.observe(
+            "span", self.name, time.perf_counter() - self._start, self.nbytes
+        )
+
+
+class _DisabledSpan:
+    """Stand-in for `Span` while metrics are disabled, recording nothing"""
+
+    __slots__ = ()
+
+    def add_bytes(self, nbytes: int) -> None:
+        pass
+
+    def __enter__(self) -> "_DisabledSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+def span(name: str, nbytes: int = 0):
+    """Time the enclosed block as the span `name`.
+
+    Args:
+        name: Name of the span, e.g. "hdf.read"
+        nbytes: Bytes handled, more may be added with `add_bytes` of the span
+
+    Returns:
+        Context manager returning the span
+    """
+    if not config.Metrics.enabled:
+        return _DISABLED_SPAN
+    return Span(name, nbytes)
+
+
+def _profile_path(label: str) -> str:
+    name = "".join(c if c.isalnum() or c in "-_." else "_" for c in label)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(
+        config.Metrics.profile_dir, f"{stamp}_{time.perf_counter_ns()}_{name}.prof"
+    )
+
+
+def _callback_label(request) -> Optional[str]:
+    """Output of the Dash callback a request is for, None for other requests"""
+    if request.path != CALLBACK_ROUTE:
+        return None
+    body = request.get_json(silent=True) or {}
+    return str(body.get("output", "unknown"))
+
+
+def install(server, extra_metrics=None) -> None:
+    """Time the Dash callbacks served by `server` and serve the metrics.
+
+    The metrics are served at `config.Metrics.endpoint`. With
+    `config.Metrics.profiling` set, requests carrying the `X-Model-Viz-Profile`
+    header or the `model_viz_profile` cookie are run under cProfile and their
+    profile written to `config.Metrics.profile_dir`. The cookie is set and cleared
+    with `<endpoint>/profile?enable=1` and `?enable=0`, e.g. from the browser.
+
+    Args:
+        server: Flask server of the Dash app
+        extra_metrics: Optional callable returning more metrics in the text format
+    """
+    if not config.Metrics.enabled:
+        return
+    import cProfile
+    import flask
+
+    @server.before_request
+    def _start_timer():
+        flask.g.model_viz_start = time.perf_counter()
+        if config.Metrics.profiling and (
+            flask.request.headers.get(PROFILE_HEADER)
+            or flask.request.cookies.get(PROFILE_COOKIE)
+        ):
+            flask.g.model_viz_profile = cProfile.Profile()
+            flask.g.model_viz_profile.enable()
+
+    @server.after_request
+    def _record(response):
+        profile = flask.g.pop("model_viz_profile", None)
+        label = _callback_label(flask.request)
+        if profile is not None:
+            profile.disable()
+            path = _profile_path(label or flask.request.path)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            profile.dump_stats(path)
+            response.headers["X-Model-Viz-Profile-File"] = path
+        start = flask.g.pop("model_viz_start", None)
+        if label is not None and start is not None:
+            nbytes = response.calculate_content_length() or 0
+            registry.observe("callback", label, time.perf_counter() - start, nbytes)
+        return response
+
+    def serve_metrics():
+        text = registry.render()
+        if extra_metrics is not None:
+            text += extra_metrics()
+        return flask.Response(text, mimetype="text/plain; version=0.0.4")
+
+    def toggle_profiling():
+        enable = flask.request.args.get("enable", "1") not in ("0", "false")
+        response = flask.Response(
+            f"Profiling {'enabled' if enable else 'disabled'}\n", mimetype="text/plain"
+        )
+        if enable:
+            response.set_cookie(PROFILE_COOKIE, "1", samesite="Strict")
+        else:
+            response.delete_cookie(PROFILE_COOKIE)
+        return response
+
+    endpoint = config.Metrics.endpoint.rstrip("/")
+    server.add_url_rule(endpoint, "model_viz_metrics", serve_metrics)
+    if config.Metrics.profiling:
+        server.add_url_rule(
+            f"{endpoint}/profile", "model_viz_profile", toggle_profiling
+        )
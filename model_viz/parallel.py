@@ -0,0 +1,168 @@
+"""Per-group work dispatched to a pool of workers.
+
+Groups are sent to workers as picklable references (see `group_ref`) and every
+worker, thread or process, keeps its own handles of the files it opened. At most
+`config.Aggregate.memory_budget_mb` of group data is in flight at a time, so that
+big groups are not all loaded at once, and results come back in group order.
+"""
+import multiprocessing
+import os
+import threading
+import h5py
+import model_viz.config as config
+import model_viz.hdf_ops as hdf_ops
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Callable, Iterator, Optional, Sequence, Union
+
+# Aggregation workers are kept alive between tabs
+_executor: Optional[Executor] = None
+# HDF5 files opened by the current worker thread and their mtimes, keyed by path, in
+# `_local.files`. Closing a file invalidates everything read from it, so no thread
+# ever closes a handle another thread may be reading from.
+_local = threading.local()
+
+BACKENDS = ("thread", "process")
+
+
+def open_group(path: str, group_name: str, swmr: bool = False) -> h5py.Group:
+    """Open a group, reopening its file once it changed since it was last opened.
+
+    Files being written by a running model are opened SWMR-read and refreshed.
+    """
+    if not hasattr(_local, "files"):
+        _local.files = {}
+    files: dict[str, tuple[h5py.File, int]] = _local.files
+    mtime = os.stat(path).st_mtime_ns
+    file, opened_mtime = files.get(path, (None, None))
+    if file is not None and file.swmr_mode:
+        return hdf_ops.refresh(file[group_name])
+    if file is not None and opened_mtime != mtime:
+        file.close()
+        file = None
+    if file is None:
+        file = (
+            h5py.File(path, "r", libver="latest", swmr=True)
+            if swmr
+            else h5py.File(path, "r")
+        )
+        files[path] = file, mtime
+    return file[group_name]
+
+
+def group_ref(group: Union[h5py.Group, dict]) -> Union[tuple, dict]:
+    """Picklable reference to a group, or to the groups of a comparison"""
+    if isinstance(group, dict):
+        return {label: group_ref(run) for label, run in group.items()}
+    return group.file.filename, group.name, group.file.swmr_mode
+
+
+def group_size_mb(group: Union[h5py.Group, dict]) -> float:
+    """Size of the samples of a group, or of all groups of a comparison, in MB"""
+    if isinstance(group, dict):
+        return sum(group_size_mb(run) for run in group.values())
+    return group["data"].nbytes / 1024**2 if "data" in group else 0.0
+
+
+def n_workers() -> int:
+    return config.Aggregate.workers or os.cpu_count() or 1
+
+
+def get_executor() -> Executor:
+    """Return the shared pool of aggregation workers, starting it on first use"""
+    global _executor
+    if _executor is None:
+        if config.Aggregate.backend == "thread":
+            _executor = ThreadPoolExecutor(max_workers=n_workers())
+        elif config.Aggregate.backend == "process":
+            # Forking a process holding open HDF5 handles is unsafe, hence spawn
+            _executor = ProcessPoolExecutor(
+                max_workers=n_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            raise NotImplementedError(
+                f"Aggregation backend {config.Aggregate.backend} not implemented"
+            )
+    return _executor
+
+
+def map_bounded(
+    fn: Callable,
+    tasks: Sequence,
+    sizes_mb: Sequence[float],
+    executor: Executor,
+    budget_mb: float = None,
+) -> Iterator:
+    """Like `executor.map`, but holding back tasks while those in flight already add
+    up to `budget_mb`.
+
+    A task larger than the budget still runs, on its own. Results are yielded in the
+    order of `tasks`.
+
+    Args:
+        fn: Function to call on every task
+        tasks: Arguments of `fn`
+        sizes_mb: Memory needed by every task in MB
+        executor: Pool to run the tasks on
+        budget_mb: Memory budget in MB. Defaults to `config.Aggregate.memory_budget_mb`
+
+    Yields:
+        Result of every task
+    """
+    if budget_mb is None:
+        budget_mb = config.Aggregate.memory_budget_mb
+    in_flight = deque()
+    used_mb = 0.0
+    for task, size_mb in zip(tasks, sizes_mb):
+        # Waiting on the oldest task keeps the results in order
+        while in_flight and used_mb + size_mb > budget_mb:
+            future, done_mb = in_flight.popleft()
+            used_mb -= done_mb
+            yield future.result()
+        in_flight.append((executor.submit(fn, task), size_mb))
+        used_mb += size_mb
+    while in_flight:
+        yield in_flight.popleft()[0].result()
+
+
+def _plotter(group: h5py.Group, plotter: type):
+    """Plotter of the samples of a group, weighted by its importance weights if any"""
+    return plotter(data=group["data"], weights=hdf_ops.group_weights(group))
+
+
+def _compute_stats(task: tuple) -> dict:
+    """Compute the statistics of one group, run inside a worker"""
+    ref, plotter = task
+    return _plotter(open_group(*ref), plotter).compute_stats()
+
+
+def compute_stats(groups: list[h5py.Group], plotter: type) -> list[dict]:
+    """Compute the statistics `plotter` shows of every group, in parallel.
+
+    Args:
+        groups: HDF5 plotting groups
+        plotter: Plotter class with a `compute_stats` method
+
+    Returns:
+        list: Statistics of every group, in group order
+    """
+    if n_workers() == 1 or len(groups) <= 1:
+        return [_plotter(group, plotter).compute_stats() for group in groups]
+    tasks = [(group_ref(group), plotter) for group in groups]
+    sizes = [group_size_mb(group) for group in groups]
+    return list(map_bounded(_compute_stats, tasks, sizes, get_executor()))
+
+
+def submit_stats(group: h5py.Group, plotter: type) -> Future:
+    """Compute the statistics `plotter` shows of a group in the background.
+
+    Returns:
+        Future: Future of the statistics, which also end up in the statistics cache
+    """
+    return get_executor().submit(_compute_stats, (group_ref(group), plotter))
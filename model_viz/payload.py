@@ -0,0 +1,146 @@
+import base64
+import numpy as np
+import plotly.graph_objects as go
+import model_viz.config as config
+import model_viz.metrics as metrics
+from typing import Union
+
+# Trace attributes holding the bulk of the data of our figures
+ARRAY_KEYS = ("x", "y", "z", "q1", "median", "q3", "lowerfence", "upperfence")
+# Significant digits of a float32, used when floats are sent as JSON text
+FLOAT32_DIGITS = 7
+
+
+def decimate(x: np.ndarray, y: np.ndarray, max_points: int):
+    """Reduce a line to at most `max_points` points, keeping every bucket's extremes.
+
+    The line is split into `max_points // 2` buckets and the minimum and maximum of
+    each are kept in their original order, so peaks survive the reduction.
+
+    Args:
+        x: x values
+        y: y values of the same length
+
+    Returns:
+        tuple: Decimated x and y
+    """
+    n_buckets = max(1, max_points // 2)
+    if len(y) <= max_points:
+        return x, y
+    keep = []
+    for bucket in np.array_split(np.arange(len(y)), n_buckets):
+        values = y[bucket]
+        if np.isnan(values).all():
+            keep.append(bucket[0])
+            continue
+        keep.extend(
+            sorted({bucket[np.nanargmin(values)], bucket[np.nanargmax(values)]})
+        )
+    return x[keep], y[keep]
+
+
+def encode_array(array) -> Union[dict, list, np.ndarray]:
+    """Encode a numeric array compactly for plotly.js.
+
+    With `config.Payload.binary_arrays` arrays are sent as base64 typed arrays,
+    otherwise as JSON numbers. Floats are reduced to float32 precision if
+    `config.Payload.float32` is set. 64 bit integers are sent as 32 bit integers,
+    or as a list of JSON numbers if they do not fit.
+
+    Args:
+        array: Array-like trace attribute
+
+    Returns:
+        Typed array spec, or the array rounded for JSON. Non-numeric input is
+        returned unchanged.
+    """
+    array = np.asarray(array)
+    if array.dtype.kind not in "biuf" or array.size == 0:
+        return array
+    if array.dtype.kind == "b":
+        array = array.astype(np.uint8)
+    if array.dtype.kind == "f" and config.Payload.float32:
+        array = array.astype(np.float32)
+    if array.dtype.kind in "iu" and array.dtype.itemsize == 8:
+        # plotly.js typed arrays have no 64 bit integers, values that do not fit in
+        # 32 bits are sent as JSON numbers
+        for dtype in (np.int32, np.uint32):
+            if (
+                np.iinfo(dtype).min <= array.min()
+                and array.max() <= np.iinfo(dtype).max
+            ):
+                array = array.astype(dtype)
+                break
+        else:
+            return array.tolist()
+
+    if config.Payload.binary_arrays:
+        array = np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<"))
+        spec = {
+            "dtype": f"{array.dtype.kind}{array.dtype.itemsize}",
+            "bdata": base64.b64encode(array.tobytes()).decode("ascii"),
+        }
+        if array.ndim > 1:
+            spec["shape"] = ",".join(str(n) for n in array.shape)
+        return spec
+
+    if array.dtype.kind == "f" and config.Payload.float32:
+        # Shorter decimal representations of the same float32 values
+        array = round_significant(array.astype(np.float64), FLOAT32_DIGITS)
+    return array
+
+
+def round_significant(array: np.ndarray, digits: int) -> np.ndarray:
+    """Round every value to `digits` significant digits of its own magnitude.
+
+    Values are scaled by powers of ten rather than rounded to a number of decimals
+    shared by the whole array, so that values far below its largest keep their
+    precision.
+
+    Args:
+        array: Float array
+        digits: Significant digits to keep
+
+    Returns:
+        np.ndarray: Rounded copy of `array`
+    """
+    magnitude = np.abs(array)
+    exponent = np.zeros(array.shape)
+    finite = np.isfinite(magnitude) & (magnitude > 0)
+    np.floor(np.log10(magnitude, where=finite, out=exponent), out=exponent)
+    # Negative shifts for values of more than `digits` integer digits
+    shift = np.clip(digits - 1 - exponent, -300, 300).astype(np.int64)
+    power = 10.0 ** np.abs(shift)
+    with np.errstate(invalid="ignore", over="ignore"):
+        return np.where(
+            shift >= 0,
+            np.round(array * power) / power,
+            np.round(array / power) * power,
+        )
+
+
+def compact_figure(fig: go.Figure) -> dict:
+    """Return a compact representation of `fig` to send to a `dcc.Graph`.
+
+    Overlay lines are decimated to `config.Payload.max_overlay_points` and the data
+    arrays of every trace are encoded with `encode_array`.
+
+    Args:
+        fig: Plotly figure
+
+    Returns:
+        dict: Figure dict accepted by `dcc.Graph`
+    """
+    with metrics.span("figure.serialize"):
+        fig_dict = fig.to_dict()
+        for trace in fig_dict["data"]:
+            if trace.get("type") == "scatter" and "y" in trace:
+                y = np.asarray(trace["y"], dtype=np.float64)
+                x = np.asarray(trace["x"]) if "x" in trace else np.arange(len(y))
+                trace["x"], trace["y"] = decimate(
+                    x, y, config.Payload.max_overlay_points
+                )
+            for key in ARRAY_KEYS:
+                if key in trace:
+                    trace[key] = encode_array(trace[key])
+    return fig_dict
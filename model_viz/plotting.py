@@ -1,41 +1,91 @@
 import plotly.graph_objects as go
 import numpy as np
-import os
 import model_viz.config as config
-import datashader as ds
-import pandas as pd
-import plotly.express as px
+import model_viz.hdf_ops as hdf_ops
+import model_viz.cache as cache
+import model_viz.aggregation as aggregation
+import model_viz.metrics as metrics
+import model_viz.parallel as parallel
 from abc import ABC, abstractmethod
 
+# pandas and plotly.express take most of the start-up time of the package,
+# they are imported by the plotters once they first need them
+
 
 class BasePlotter(ABC):
     name: str = "BasePlotter"
     fig = None
     title = None
 
-    def __init__(self, data=None, overlay_data=None):
+    def __init__(self, data=None, overlay_data=None, stats: dict = None, weights=None):
+        """
+        Args:
+            data: Samples as an `np.ndarray` or an on-disk `h5py.Dataset`. Passing
+                the dataset lets plotters stream it and reuse cached statistics.
+            overlay_data: Empirical data to overlay on the plot
+            stats: Precomputed statistics of `data` to plot instead of computing or
+                looking them up in the statistics cache, e.g. from `model_viz.live`
+            weights: Importance weight of every particle (row of `data`), see
+                `hdf_ops.group_weights`. Particles are equally weighted if None.
+        """
         self.data = data
         self.overlay_data = overlay_data
+        self.stats = stats
+        self.weights = weights
 
     @abstractmethod
     def create_plot(self, **kwargs):
         raise NotImplementedError
 
-    def export_plot(self) -> str:
-        path = os.path.join(
-            config.Plotter.output_dir,
-            f"{self.title}.{config.Plotter.output_file_format}",
-        )
-        self.fig.write_image(
-            path,
-            engine=config.Plotter.export_engine,
-            width=config.Plotter.width,
-            height=config.Plotter.height,
+    def _row_weights(self, row: int, n_rows: int):
+        """Weights of the `n_rows` particles from `row` on, None if unweighted"""
+        return None if self.weights is None else self.weights[row : row + n_rows]
+
+    def _cache_params(self, params: dict) -> dict:
+        """Parameters keying cached statistics, telling weighted statistics apart"""
+        return params if self.weights is None else {**params, "weighted": True}
+
+    def stats_params(self) -> dict:
+        """Parameters the statistics of `compute_stats` depend on"""
+        raise NotImplementedError
+
+    def cached_stats(self):
+        """Statistics of `data` from the statistics cache, None if not computed yet"""
+        return cache.stats_cache.get(self.data, self.name, self.stats_params())
+
+    @staticmethod
+    def preview_columns():
+        """Fewest time steps previews are drawn from, see `hdf_ops.get_pyramid_level`.
+        None if previews need every time step."""
+        return None
+
+    def compute_preview_stats(self, rows: int, factor: int = 1) -> dict:
+        """Statistics of `data`, an equally weighted sample of the particles, as an
+        estimate of the statistics of all `rows` particles, see `model_viz.preview`.
+        `data` holds every `factor`-th time step, see `preview_columns`."""
+        return self.compute_stats()
+
+    def _mark_preview(self, stats: dict) -> None:
+        """Flag the figure as a preview if `stats` were estimated from a sample"""
+        if "sample_rows" not in stats:
+            return
+        self.fig.update_layout(title=f"{self.title} (preview)")
+        self.fig.add_annotation(
+            text=f"Preview from {int(stats['sample_rows'])} of {int(stats['rows'])} "
+            "particles, refining",
+            xref="paper",
+            yref="paper",
+            x=1,
+            y=1,
+            xanchor="right",
+            yanchor="bottom",
+            showarrow=False,
         )
-        return path
 
     def update_x_ticks(self, x_tick_vals):
         if config.Plotter.is_xlabel_date:
+            import pandas as pd
+
             tick_interval = max(
                 1, x_tick_vals.shape[0] // config.Plotter.desired_tick_labels
             )
@@ -54,8 +104,269 @@ class BasePlotter(ABC):
 class Histogram2D(BasePlotter):
     name = "Histogram2D"
 
-    def __init__(self, data: np.ndarray, overlay_data=None):
-        super().__init__(data, overlay_data)
+    def __init__(
+        self, data: np.ndarray, overlay_data=None, stats: dict = None, weights=None
+    ):
+        super().__init__(data, overlay_data, stats, weights)
+
+    @staticmethod
+    def _new_grid(x_range: tuple, y_range: tuple, width: int, height: int):
+        return aggregation.CountGrid(
+            x_range,
+            y_range,
+            width,
+            height,
+            y_scale=config.Histogram2D.y_scale,
+            backend=config.Histogram2D.binning,
+        )
+
+    def _full_grids(self, y_range: tuple, pyramid: bool) -> list[aggregation.CountGrid]:
+        """Empty count grid of the plot, followed by the finest level of the zoom
+        pyramid if `pyramid`, both spanning every time step"""
+        x_range = (0, self.data.shape[1] - 1)
+        grids = [
+            self._new_grid(
+                x_range,
+                y_range,
+                config.Histogram2D.plot_width,
+                config.Histogram2D.plot_height,
+            )
+        ]
+        if pyramid:
+            grids.append(
+                self._new_grid(
+                    x_range,
+                    y_range,
+                    min(self.data.shape[1], config.Histogram2D.pyramid_base_width),
+                    config.Histogram2D.pyramid_base_height,
+                )
+            )
+        return grids
+
+    def _aggregate(self, pyramid: bool = False) -> list[aggregation.CountGrid]:
+        """Aggregate all samples into count grids in a single pass over memory.
+
+        Returns:
+            list: Count grids of `_full_grids`
+        """
+        data = hdf_ops.as_array(self.data)
+        grids = self._full_grids(self._y_extent(data), pyramid)
+        for grid in grids:
+            grid.update(data, weights=self.weights)
+        return grids
+
+    def _y_extent(self, data=None) -> tuple[float, float]:
+        """Range of the value bins, found in one pass over the blocks of the dataset.
+
+        `config.Histogram2D.y_min` and `y_max` take precedence over the range of the
+        samples, of which only positive ones count on a log scale.
+        """
+        y_min, y_max = config.Histogram2D.y_min, config.Histogram2D.y_max
+        if y_min is not None and y_max is not None:
+            return y_min, y_max
+
+        low, high = np.inf, -np.inf
+        log = config.Histogram2D.y_scale == "log"
+        for _, block in hdf_ops.iter_blocks(self.data if data is None else data):
+            block = block[np.isfinite(block) & (block > 0)] if log else block
+            if block.size:
+                low = min(low, np.nanmin(block))
+                high = max(high, np.nanmax(block))
+        if low > high:  # No samples to bin
+            low, high = (1.0, 10.0) if log else (0.0, 1.0)
+        low = low if y_min is None else y_min
+        high = high if y_max is None else y_max
+        if low == high:  # Same convention as np.histogram
+            low, high = (low / 2, high * 2) if log else (low - 0.5, high + 0.5)
+        return low, high
+
+    def _rasterize(
+        self, width: int, height: int, x_range: tuple, y_range: tuple
+    ) -> aggregation.CountGrid:
+        """Aggregate samples within a range block by block onto a fixed grid.
+
+        Only the columns inside `x_range` are read and peak memory is bounded by
+        one block.
+
+        Returns:
+            aggregation.CountGrid: Count grid of the range
+        """
+        grid = self._new_grid(x_range, y_range, width, height)
+        self._bin_blocks([grid])
+        return grid
+
+    def _bin_blocks(self, grids: list[aggregation.CountGrid]) -> None:
+        """Bin the samples within the x range of the grids block by block, reading
+        every block once whatever the number of grids"""
+        x_range = grids[0].x_range
+        columns = (
+            max(0, int(np.floor(x_range[0]))),
+            min(self.data.shape[1], int(np.floor(x_range[1])) + 1),
+        )
+        for (row, col), block in hdf_ops.iter_blocks(self.data, columns=columns):
+            weights = self._row_weights(row, block.shape[0])
+            for grid in grids:
+                grid.update(block, col, weights)
+
+    def _aggregate_streaming(
+        self, pyramid: bool = False
+    ) -> list[aggregation.CountGrid]:
+        """Aggregate samples block by block so that peak memory is bounded by one block.
+
+        The y range is found in a first pass so that every block is binned onto the
+        same grids, making the merged grids identical to `_aggregate`.
+
+        Returns:
+            list: Count grids of `_full_grids`
+        """
+        grids = self._full_grids(self._y_extent(), pyramid)
+        self._bin_blocks(grids)
+        return grids
+
+    @staticmethod
+    def _pyramid_arrays(grid: aggregation.CountGrid) -> dict[str, np.ndarray]:
+        """Tile pyramid over the finest zoom level `grid`, as cached"""
+        y_range = grid.y_range
+        if config.Histogram2D.y_scale == "log":
+            # Log bins are equally wide in log10 space, where plotly keeps log ranges
+            y_range = np.log10(y_range)
+        return aggregation.TilePyramid(grid.counts, grid.x_range, y_range).to_arrays()
+
+    def _compute_pyramid(self) -> dict[str, np.ndarray]:
+        """Rasterise the full range at the finest zoom level of the tile pyramid"""
+        grid = self._new_grid(
+            (0, self.data.shape[1] - 1),
+            self._y_extent(),
+            min(self.data.shape[1], config.Histogram2D.pyramid_base_width),
+            config.Histogram2D.pyramid_base_height,
+        )
+        self._bin_blocks([grid])
+        return self._pyramid_arrays(grid)
+
+    def pyramid_params(self) -> dict:
+        """Parameters the tile pyramid of `zoom` depends on"""
+        return self._cache_params(
+            {
+                "pyramid_base_height": config.Histogram2D.pyramid_base_height,
+                "pyramid_base_width": config.Histogram2D.pyramid_base_width,
+                "y_scale": config.Histogram2D.y_scale,
+                "y_min": config.Histogram2D.y_min,
+                "y_max": config.Histogram2D.y_max,
+            }
+        )
+
+    @staticmethod
+    def _log_counts(counts: np.ndarray) -> np.ndarray:
+        """Log10 of the counts with empty bins masked out as NaN"""
+        log_counts = np.full(np.shape(counts), np.nan)
+        np.log10(counts, out=log_counts, where=np.asarray(counts) > 0)
+        return log_counts
+
+    def zoom(self, x_range: tuple = None, y_range: tuple = None):
+        """Log10 count grid of the visible range at the zoom resolution.
+
+        The grid is cut from the tile pyramid, precomputed along with the statistics
+        of the plot (see `compute_stats`), when one of its levels is fine enough, and
+        otherwise re-aggregated from the visible columns only.
+
+        Args:
+            x_range: Visible (min, max) along x. Defaults to the full range.
+            y_range: Visible (min, max) along y. Defaults to the full range. On a
+                log scale, in log10 units like the ranges of plotly log axes.
+
+        Returns:
+            dict: Log10 counts ("z") of shape (height, width), and the "x" and "y"
+            bin centres
+        """
+        pyramid = aggregation.TilePyramid.from_arrays(
+            cache.stats_cache.get_or_compute(
+                self.data,
+                f"{self.name}Pyramid",
+                self.pyramid_params(),
+                self._compute_pyramid,
+            )
+        )
+        x_range = x_range or pyramid.x_range
+        y_range = y_range or pyramid.y_range
+        width = config.Histogram2D.zoom_plot_width
+        height = config.Histogram2D.zoom_plot_height
+        log = config.Histogram2D.y_scale == "log"
+        tile = pyramid.query(x_range, y_range, width, height)
+        if tile is None:
+            linear_y_range = tuple(10 ** np.asarray(y_range)) if log else y_range
+            grid = self._rasterize(width, height, x_range, linear_y_range)
+            counts, x, y = grid.counts, grid.x, grid.y
+        else:
+            counts, x, y = tile
+            y = 10**y if log else y
+        return {"z": self._log_counts(counts), "x": x, "y": y}
+
+    def _compute_count_grid(self) -> dict[str, np.ndarray]:
+        """Compute the count grid along with its bin centres.
+
+        The finest level of the tile pyramid of `zoom` is binned from the same pass
+        over the samples and stored in the statistics cache, so that zooming in
+        does not read the dataset again.
+
+        Returns:
+            dict: Counts of shape (height, width) and the "x" and "y" bin centres
+        """
+        pyramid = (
+            hasattr(self.data, "file")
+            and cache.stats_cache.enabled
+            and not cache.stats_cache.contains(
+                self.data, f"{self.name}Pyramid", self.pyramid_params()
+            )
+        )
+        if config.Histogram2D.streaming and not isinstance(self.data, np.ndarray):
+            grids = self._aggregate_streaming(pyramid)
+        else:
+            grids = self._aggregate(pyramid)
+        if pyramid:
+            cache.stats_cache.put(
+                self.data,
+                f"{self.name}Pyramid",
+                self.pyramid_params(),
+                self._pyramid_arrays(grids[1]),
+            )
+        return grids[0].to_arrays()
+
+    def stats_params(self) -> dict:
+        return self._cache_params(
+            {
+                "plot_height": config.Histogram2D.plot_height,
+                "plot_width": config.Histogram2D.plot_width,
+                "y_scale": config.Histogram2D.y_scale,
+                "y_min": config.Histogram2D.y_min,
+                "y_max": config.Histogram2D.y_max,
+            }
+        )
+
+    def compute_stats(self) -> dict[str, np.ndarray]:
+        """Count grid of the plot, reused from the statistics cache when possible"""
+        return cache.stats_cache.get_or_compute(
+            self.data, self.name, self.stats_params(), self._compute_count_grid
+        )
+
+    @staticmethod
+    def preview_columns() -> int:
+        # Every column of the grid still gets a time step
+        return config.Histogram2D.plot_width
+
+    def compute_preview_stats(
+        self, rows: int, factor: int = 1
+    ) -> dict[str, np.ndarray]:
+        """Count grid of the sample in `data`, scaled up to `rows` particles and to
+        every time step"""
+        grid = self.compute_stats()
+        counts = grid["counts"] * (rows / self.data.shape[0])
+        if factor > 1:
+            # Grid columns get uneven numbers of the kept time steps, so every column
+            # is scaled to the mean number of time steps of a column
+            n_cols, width = self.data.shape[1], counts.shape[1]
+            steps = np.histogram(np.arange(n_cols), bins=width, range=(0, n_cols - 1))
+            counts = counts * (n_cols * factor / width / np.maximum(steps[0], 1))
+        return {**grid, "counts": counts, "x": grid["x"] * factor}
 
     def create_plot(self, **kwargs) -> go.Figure:
         """Create 2D histogram plot from samples and overlay empirical data if provided.
@@ -66,19 +377,13 @@ class Histogram2D(BasePlotter):
         self.title = kwargs.get("title", config.Histogram2D.title)
         x_title = kwargs.get("x_title", config.Histogram2D.x_title)
         y_title = kwargs.get("y_title", config.Histogram2D.y_title)
-        x = np.tile(np.arange(self.data.shape[1]), self.data.shape[0])
-        y = self.data.flatten()
-        df = pd.DataFrame({"x": x, "y": y})
-
-        # Rasterising Hist2D for faster rendering. See https://plotly.com/python/datashader/
-        cvs = ds.Canvas(plot_height=100, plot_width=100)
-        agg = cvs.points(df, "x", "y", ds.count())
-        zero_mask = agg.values == 0
-        agg.values = np.log10(agg.values, where=np.logical_not(zero_mask))
-        agg.values[zero_mask] = np.nan
+        import plotly.express as px
 
+        grid = self.stats or self.compute_stats()
         fig = px.imshow(
-            agg,
+            self._log_counts(grid["counts"]),
+            x=grid["x"],
+            y=grid["y"],
             origin="lower",
             labels={"color": f"Log10({config.Histogram2D.colorbar_title})"},
             color_continuous_scale=config.Histogram2D.colorscale,
@@ -91,7 +396,10 @@ class Histogram2D(BasePlotter):
             title=self.title,
             xaxis_title=x_title,
             yaxis_title=y_title,
+            uirevision=self.title,  # Keep the zoom when re-aggregated grids arrive
         )
+        if config.Histogram2D.y_scale == "log":
+            fig.update_yaxes(type="log")
 
         if self.overlay_data is not None:
             fig.add_trace(
@@ -105,30 +413,55 @@ class Histogram2D(BasePlotter):
             )
         self.fig = fig
         self.update_x_ticks(np.arange(self.data.shape[1]))
+        self._mark_preview(grid)
         return fig
 
 
 class BoxPlotOverTime(BasePlotter):
     name = "BoxPlotOverTime"
+    quantiles = (0.0, 0.25, 0.5, 0.75, 1.0)
 
-    def __init__(self, data: np.ndarray, overlay_data=None):
-        super().__init__(data, overlay_data)
+    def __init__(
+        self, data: np.ndarray, overlay_data=None, stats: dict = None, weights=None
+    ):
+        super().__init__(data, overlay_data, stats, weights)
+
+    def _quantile_state(self) -> aggregation.ColumnQuantiles:
+        """Aggregate the samples into a mergeable quantile state.
+
+        Exact quantiles are computed over the whole dataset at once, mapped from
+        disk when possible, while sketches are streamed over its blocks (see
+        `config.BoxPlotOverTime`). Sketches take equally weighted samples, so weighted
+        particles are repeated as many times as systematic resampling draws them.
+        """
+        state = aggregation.ColumnQuantiles(
+            config.BoxPlotOverTime.quantile_method,
+            k=config.BoxPlotOverTime.sketch_k,
+            dtype=config.BoxPlotOverTime.stats_dtype,
+        )
+        if state.method == "sketch":
+            draws = (
+                None
+                if self.weights is None
+                else aggregation.systematic_counts(self.weights)
+            )
+            for (row, col), block in hdf_ops.iter_blocks(self.data):
+                if draws is not None:
+                    block = np.repeat(block, draws[row : row + len(block)], axis=0)
+                state.update(block, col)
+        else:
+            state.update(hdf_ops.as_array(self.data), weights=self.weights)
+        return state
 
     def _pre_compute_boxplot_stats(self) -> dict[str, np.ndarray]:
         """Compute boxplot aggregation statistics over time.
 
+        All quantiles are computed in a single pass, see `_quantile_state`.
+
         Returns:
-            np.array: array of computed stats
-        """
-        stats = np.array(
-            [
-                np.min(self.data, axis=0),
-                np.percentile(self.data, 25, axis=0),
-                np.median(self.data, axis=0),
-                np.percentile(self.data, 75, axis=0),
-                np.max(self.data, axis=0),
-            ]
-        ).T
+            dict: Lower fence, q1, median, q3 and upper fence over time
+        """
+        stats = self._quantile_state().quantiles(self.quantiles).T
         return {
             "lower_fence": stats[:, 0],
             "q1": stats[:, 1],
@@ -137,6 +470,21 @@ class BoxPlotOverTime(BasePlotter):
             "upper_fence": stats[:, 4],
         }
 
+    def stats_params(self) -> dict:
+        return self._cache_params(
+            {
+                "quantile_method": config.BoxPlotOverTime.quantile_method,
+                "sketch_k": config.BoxPlotOverTime.sketch_k,
+                "stats_dtype": config.BoxPlotOverTime.stats_dtype,
+            }
+        )
+
+    def compute_stats(self) -> dict[str, np.ndarray]:
+        """Boxplot statistics over time, reused from the statistics cache when possible"""
+        return cache.stats_cache.get_or_compute(
+            self.data, self.name, self.stats_params(), self._pre_compute_boxplot_stats
+        )
+
     def create_plot(self, **kwargs) -> go.Figure:
         """Create a box plot over time overlayed with empirical data if provided.
 
@@ -148,8 +496,8 @@ class BoxPlotOverTime(BasePlotter):
         x_title = kwargs.get("x_title", config.Histogram2D.x_title)
         y_title = kwargs.get("y_title", config.Histogram2D.y_title)
 
-        # Pre-compute all stats for faster rendering.
-        stats = self._pre_compute_boxplot_stats()
+        # Pre-compute all stats for faster rendering, reusing cached stats if any.
+        stats = self.stats or self.compute_stats()
 
         fig = go.Figure(
             go.Box(
@@ -159,7 +507,12 @@ class BoxPlotOverTime(BasePlotter):
                 boxpoints=config.BoxPlotOverTime.boxpoints,
                 showlegend=config.BoxPlotOverTime.showlegend,
             )
-        ).update_layout(title=self.title, xaxis_title=x_title, yaxis_title=y_title)
+        ).update_layout(
+            title=self.title,
+            xaxis_title=x_title,
+            yaxis_title=y_title,
+            uirevision=self.title,  # Keep the zoom when live updates arrive
+        )
 
         if config.BoxPlotOverTime.plot_fences:
             fig.update_traces(
@@ -179,16 +532,25 @@ class BoxPlotOverTime(BasePlotter):
             )
         self.fig = fig
         self.update_x_ticks(np.arange(self.data.shape[1]))
+        self._mark_preview(stats)
         return fig
 
 
 class Histogram(BasePlotter):
     """
-    Simple histogram plotter.
+    Simple histogram plotter. Samples are binned server-side so that only bin
+    counts are sent to the browser.
     """
 
-    def __init__(self, data: np.ndarray, overlay_data=None):
+    def __init__(self, data: np.ndarray, overlay_data=None, bin_edges=None):
+        """
+        Args:
+            data: Samples, or bin counts if `bin_edges` is given
+            overlay_data: Empirical value to mark on the plot
+            bin_edges: Edges of the bins counted in `data`
+        """
         super().__init__(data, overlay_data)
+        self.bin_edges = bin_edges
 
     def create_plot(self, **kwargs) -> go.Figure:
         """Create a histogram plot.
@@ -198,11 +560,19 @@ class Histogram(BasePlotter):
         """
         x_title = kwargs.get("x_title", config.Histogram.x_title)
         y_title = kwargs.get("y_title", config.Histogram.y_title)
+        if self.bin_edges is None:
+            counts, edges = np.histogram(self.data, bins=config.Histogram.bins)
+        else:
+            counts, edges = self.data, self.bin_edges
         fig = go.Figure(
-            go.Histogram(y=self.data, opacity=0.9)
-        ).update_layout(  # Flipping axes
-            xaxis_title=x_title, yaxis_title=y_title
-        )
+            go.Bar(  # Flipping axes
+                x=counts,
+                y=(edges[:-1] + edges[1:]) / 2,
+                width=np.diff(edges),
+                orientation="h",
+                opacity=0.9,
+            )
+        ).update_layout(xaxis_title=x_title, yaxis_title=y_title)
         if self.overlay_data is not None:
             fig.add_hline(
                 y=self.overlay_data,
@@ -212,3 +582,132 @@ class Histogram(BasePlotter):
             )
         self.fig = fig
         return fig
+
+
+# Plotters of the plots of whole groups, by the name the app and reports show
+GRAPH_TYPES = {
+    "Histogram 2D": Histogram2D,
+    "Boxplot over Time": BoxPlotOverTime,
+}
+
+
+def create_group_plot(
+    group, plotter: type[BasePlotter], stats: dict = None
+) -> BasePlotter:
+    """Create the plot of a single plotting group.
+
+    Args:
+        group: HDF5 group holding a `data` dataset and optional `overlay_data` and
+            `weights` datasets
+        plotter: Plotter class to use
+        stats: Statistics of `data` computed beforehand, e.g. by a pool of workers
+
+    Returns:
+        BasePlotter: Plotter whose figure has been created
+    """
+    title = group.name.split("/")[-1]
+    # Plotters read the on-disk dataset lazily so cached stats skip the read
+    data = group["data"]
+    overlay_data = (
+        hdf_ops.as_array(group["overlay_data"]).ravel()
+        if "overlay_data" in group
+        else None
+    )
+    plot = plotter(
+        data=data,
+        overlay_data=overlay_data,
+        stats=stats,
+        weights=hdf_ops.group_weights(group),
+    )
+    with metrics.span("figure.build"):
+        plot.create_plot(title=title)
+    return plot
+
+
+class Comparison(BasePlotter):
+    """
+    Compares the same plotting group across several runs. Boxplots are overlaid or
+    faceted (see `config.Comparison.layout`); 2D histograms are always faceted.
+    """
+
+    name = "Comparison"
+
+    def __init__(self, data: dict, plotter: type[BasePlotter]):
+        """
+        Args:
+            data: HDF5 plotting group of every run, by run label
+            plotter: Plotter class used for every run
+        """
+        super().__init__(data, None)
+        self.plotter = plotter
+
+    def _create_run_plots(self) -> list[BasePlotter]:
+        """Create the plot of every run, aggregating runs in parallel.
+
+        Runs are aggregated by the pool of `model_viz.parallel`, within its memory
+        budget, and every run is plotted with its own cached statistics, so
+        comparing runs costs the same as looking at each of them.
+        """
+        groups = list(self.data.values())
+        stats = parallel.compute_stats(groups, self.plotter)
+        return [
+            create_group_plot(group, self.plotter, run_stats)
+            for group, run_stats in zip(groups, stats)
+        ]
+
+    def create_plot(self, **kwargs) -> go.Figure:
+        """Create a comparison plot of all runs.
+
+        Returns:
+            go.Figure: Plotly figure
+        """
+        self.title = kwargs.get("title", config.Comparison.title)
+        labels = list(self.data.keys())
+        plots = self._create_run_plots()
+        layout = plots[0].fig.layout
+
+        if self.plotter is BoxPlotOverTime and config.Comparison.layout == "overlay":
+            fig = go.Figure()
+            for label, plot in zip(labels, plots):
+                fig.add_trace(
+                    plot.fig.data[0].update(name=label, showlegend=True),
+                )
+            # Empirical data is shared by all runs
+            fig.add_traces(plots[0].fig.data[1:])
+            fig.update_layout(boxmode="group")
+        else:
+            from plotly.subplots import make_subplots
+
+            fig = make_subplots(
+                rows=len(plots), cols=1, shared_xaxes=True, subplot_titles=labels
+            )
+            for row, plot in enumerate(plots, 1):
+                for trace in plot.fig.data:
+                    fig.add_trace(trace.update(showlegend=row == 1), row=row, col=1)
+            # Heatmaps of all runs share one color scale
+            fig.update_layout(coloraxis=layout.coloraxis)
+        fig.update_layout(
+            title=self.title,
+            xaxis_title=layout.xaxis.title.text,
+            yaxis_title=layout.yaxis.title.text,
+        )
+        self.fig = fig
+        self.update_x_ticks(np.arange(plots[0].data.shape[1]))
+        return fig
+
+
+def create_comparison_plot(groups: dict, plotter: type[BasePlotter]) -> Comparison:
+    """Create the comparison plot of the same plotting group across runs.
+
+    Args:
+        groups: HDF5 plotting group of every run, by run label
+        plotter: Plotter class to use for every run
+
+    Returns:
+        Comparison: Plotter whose figure has been created
+    """
+    title = next(iter(groups.values())).name.split("/")[-1]
+    plot = Comparison(data=groups, plotter=plotter)
+    with metrics.span("figure.build"):
+        plot.create_plot(title=title)
+    return plot
@@ -0,0 +1,146 @@
+"""Progressive previews of plots whose statistics are not cached yet.
+
+A preview is drawn from a stratified sample of the particles of a group: the rows
+of `data` are split into equal strata and one particle is drawn from each, or, if
+the group holds importance weights, the strata split the cumulative weight so that
+particles are drawn in proportion to their weight (see
+`aggregation.stratified_rows`). Plots that do not need every time step, such as 2D
+histograms, are sampled from the pyramid levels of optimized copies (see
+`hdf_ops.get_pyramid_level`). The sample is sized so that reading and
+aggregating it takes about `config.Preview.target_ms`, from the throughput of the
+previews drawn so far.
+
+The exact statistics are meanwhile aggregated by the pool of `model_viz.parallel`
+and stored in the statistics cache, from which the exact figure is drawn once ready.
+"""
+import threading
+import time
+import h5py
+import numpy as np
+import model_viz.aggregation as aggregation
+import model_viz.config as config
+import model_viz.hdf_ops as hdf_ops
+import model_viz.parallel as parallel
+import model_viz.plotting as plotting
+from concurrent.futures import Future
+from typing import Optional
+
+# Seconds it took previews to read and aggregate one sampled value, None until the
+# first preview
+_seconds_per_value: Optional[float] = None
+# Exact statistics being aggregated, by (file, group, plotter)
+_refinements: dict[tuple, Future] = {}
+_lock = threading.Lock()
+
+
+def sample_size(shape: tuple) -> int:
+    """Number of particles to sample from a dataset of shape (particles, time) to
+    meet the latency target"""
+    if _seconds_per_value is None:
+        rows = config.Preview.initial_rows
+    else:
+        budget = config.Preview.target_ms / 1000 / _seconds_per_value
+        rows = int(budget / max(1, shape[1]))
+    return max(config.Preview.min_rows, rows)
+
+
+def _record_throughput(values: int, seconds: float) -> None:
+    global _seconds_per_value
+    rate = seconds / max(1, values)
+    # Smoothed, so that a single slow read does not shrink the next sample too much
+    _seconds_per_value = (
+        rate if _seconds_per_value is None else (_seconds_per_value + rate) / 2
+    )
+
+
+def preview_stats(group: h5py.Group, plotter: type) -> Optional[dict]:
+    """Statistics of a group estimated from a stratified sample of its particles.
+
+    Args:
+        group: Plotting group
+        plotter: Plotter class whose statistics to estimate
+
+    Returns:
+        dict: Statistics in the format of `plotter.compute_stats`, along with the
+        number of particles sampled ("sample_rows") and in the group ("rows"), or
+        None if the sample would hold every particle anyway
+    """
+    data, factor = group["data"], 1
+    if plotter.preview_columns() is not None:
+        data, factor = hdf_ops.get_pyramid_level(group, plotter.preview_columns())
+    n_rows = data.shape[0]
+    n_samples = sample_size(data.shape)
+    if n_samples >= n_rows:
+        return None
+    start = time.perf_counter()
+    rows = aggregation.stratified_rows(n_rows, n_samples, hdf_ops.group_weights(group))
+    # Heavy particles drawn several times are read once
+    unique, draws = np.unique(rows, return_counts=True)
+    sample = np.repeat(hdf_ops.read_rows(data, unique), draws, axis=0)
+    stats = plotter(data=sample).compute_preview_stats(n_rows, factor)
+    _record_throughput(sample.size, time.perf_counter() - start)
+    return {**stats, "sample_rows": np.array(n_samples), "rows": np.array(n_rows)}
+
+
+def _refinement_key(group: h5py.Group, plotter: type) -> tuple:
+    return group.file.filename, group.name, plotter
+
+
+def refine(group: h5py.Group, plotter: type) -> None:
+    """Aggregate the exact statistics of a group in the background, unless already
+    under way"""
+    key = _refinement_key(group, plotter)
+    with _lock:
+        if key in _refinements:
+            return
+        future = parallel.submit_stats(group, plotter)
+        _refinements[key] = future
+
+    def forget(future: Future) -> None:
+        # Failures are kept for `is_refined` to report
+        if future.exception() is None:
+            with _lock:
+                _refinements.pop(key, None)
+
+    future.add_done_callback(forget)
+
+
+def is_refined(group: h5py.Group, plotter: type) -> bool:
+    """Whether the exact statistics of a group are ready to be plotted.
+
+    They are ready once in the statistics cache, which is shared by all server
+    processes, or once their aggregation failed, so that plotting the group raises
+    the error.
+    """
+    with _lock:
+        future = _refinements.get(_refinement_key(group, plotter))
+        if future is not None and future.done():
+            del _refinements[_refinement_key(group, plotter)]
+            return True
+    weights = hdf_ops.group_weights(group)
+    return plotter(data=group["data"], weights=weights).cached_stats() is not None
+
+
+def preview_plot(group: h5py.Group, plotter: type) -> Optional[plotting.BasePlotter]:
+    """Preview plot of a group whose exact statistics are not cached yet, which are
+    aggregated in the background meanwhile (see `refine`).
+
+    Args:
+        group: Plotting group
+        plotter: Plotter class to use
+
+    Returns:
+        BasePlotter: Plotter whose preview figure has been created, or None if the
+        group is better plotted exactly: its statistics are cached or it has too
+        few particles to sample from
+    """
+    if not config.Preview.enabled or not config.Cache.enabled:
+        return None
+    weights = hdf_ops.group_weights(group)
+    if plotter(data=group["data"], weights=weights).cached_stats() is not None:
+        return None
+    stats = preview_stats(group, plotter)
+    if stats is None:
+        return None
+    refine(group, plotter)
+    return plotting.create_group_plot(group, plotter, stats)
@@ -0,0 +1,228 @@
+"""Render the plots of every group of model output files into reports, without the app.
+
+Usage:
+    python -m model_viz.report FILE [FILE ...] [-g GRAPH_TYPE ...] [-o OUTPUT_DIR]
+        [--compare] [--force]
+
+Every file gets a report with the plots of all of its groups, graph type after
+graph type, merged into one PDF or zipped as images like the exports of the app.
+With `--compare` the files are compared run by run in a single report instead.
+
+Groups are rendered in parallel by the export workers, within
+`config.Aggregate.memory_budget_mb`. The page of every group is kept in
+`config.Report.page_dir` and reused by later reports for as long as the file of the
+group and the configuration are unchanged, so only the groups of changed files are
+rendered again. The run ends with a summary of the time spent in every stage.
+"""
+import argparse
+import os
+import sys
+import time
+import h5py
+import model_viz.cache as cache
+import model_viz.config as config
+import model_viz.export as export
+import model_viz.hdf_ops as hdf_ops
+import model_viz.metrics as metrics
+import model_viz.plotting as plotting
+from typing import Union
+
+# Spans timing the stages of a report, in the order they run
+STAGES = ("report.index", "report.lookup", "report.render", "report.write")
+
+
+def page_path(group: Union[h5py.Group, dict], graph_type: str) -> str:
+    """Path of the page of a group, or of a comparison, in the page directory"""
+    runs = list(group.values()) if isinstance(group, dict) else [group]
+    key = cache.figure_key(
+        [run.file.filename for run in runs], runs[0].name, graph_type
+    )
+    return os.path.join(
+        config.Report.page_dir, f"{key}.{config.Plotter.output_file_format}"
+    )
+
+
+def _write_page(path: str, page: bytes) -> None:
+    """Write a page so that concurrent reports never read it half-written"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(page)
+    os.replace(temp_path, path)
+
+
+def _is_rendered(path: str) -> bool:
+    """Whether the page exists, marking it as most recently used if so"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def render_pages(groups: list, graph_type: str, force: bool = False) -> list[str]:
+    """Render the pages of the groups that have none in the page directory yet.
+
+    Args:
+        groups: HDF5 plotting groups, or dicts of run groups by run label
+        graph_type: Graph type to render, see `plotting.GRAPH_TYPES`
+        force: Render every group, even those whose page is up to date
+
+    Returns:
+        list: Path of the page of every group, in group order
+    """
+    os.makedirs(config.Report.page_dir, exist_ok=True)
+    with metrics.span("report.lookup"):
+        paths = [page_path(group, graph_type) for group in groups]
+        missing = [
+            (group, path)
+            for group, path in zip(groups, paths)
+            if force or not _is_rendered(path)
+        ]
+    print(
+        f"{graph_type}: rendering {len(missing)} of {len(groups)} groups, "
+        f"{len(groups) - len(missing)} unchanged"
+    )
+    with metrics.span("report.render") as span:
+        rendered = export.render_groups(
+            [group for group, _ in missing], plotting.GRAPH_TYPES[graph_type]
+        )
+        for (_, path), page in zip(missing, rendered):
+            _write_page(path, page)
+            span.add_bytes(len(page))
+    return paths
+
+
+def build_report(
+    paths: list[str], graph_types: list[str], output_file: str, force: bool = False
+) -> str:
+    """Render the plots of all groups of `paths` into one report.
+
+    Args:
+        paths: HDF5 file, or several files to compare run by run
+        graph_types: Graph types to render, one after the other
+        output_file: Path of the merged PDF or of the zip archive
+        force: Render every group, even those whose page is up to date
+
+    Returns:
+        str: Path of the merged PDF or of the zip archive
+    """
+    with metrics.span("report.index"):
+        readers = {
+            label: hdf_ops.HDFReader(label, path)
+            for label, path in zip(hdf_ops.run_labels(paths), paths)
+        }
+        group_index = hdf_ops.align_group_indexes(
+            [reader.get_group_index() for reader in readers.values()]
+        )
+        groups = hdf_ops.plotting_groups(readers, group_index)
+
+    pages = []
+    for graph_type in graph_types:
+        folder = graph_type.lower().replace(" ", "_")
+        pages += [
+            (f"{folder}/{export.page_name(index, group)}", path)
+            for index, (group, path) in enumerate(
+                zip(groups, render_pages(groups, graph_type, force))
+            )
+        ]
+
+    def read_pages():
+        for name, path in pages:
+            with open(path, "rb") as file:
+                page = file.read()
+            span.add_bytes(len(page))
+            yield name, page
+
+    with metrics.span("report.write") as span:
+        return export.write_pages(read_pages(), output_file)
+
+
+def timing_summary(seconds: float) -> str:
+    """Time spent in every stage of the reports, and in the hot paths of rendering.
+
+    Hot paths run inside the rendering workers, so their times add up over workers.
+    """
+    spans = {
+        label: histogram
+        for (metric, label), histogram in metrics.registry.snapshot().items()
+        if metric == "span"
+    }
+    lines = [f"{'stage':<28}{'calls':>8}{'seconds':>10}{'MB':>10}"]
+    hot_paths = sorted(label for label in spans if label not in STAGES)
+    for label in [*STAGES, *hot_paths]:
+        histogram = spans.get(label, metrics.Histogram())
+        name = label if label in STAGES else f"  {label}"
+        lines.append(
+            f"{name:<28}{histogram.count:>8}{histogram.sum:>10.2f}"
+            f"{histogram.bytes / 1024**2:>10.1f}"
+        )
+        if label == STAGES[-1] and hot_paths:
+            lines.append("rendering, summed over workers:")
+    lines.append(f"{'total':<28}{'':>8}{seconds:>10.2f}")
+    return "\n".join(lines)
+
+
+def report_file(paths: list[str], output_dir: str) -> str:
+    """Path of the report of `paths`, named after the files"""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    extension = "pdf" if config.Plotter.output_file_format == "pdf" else "zip"
+    return os.path.join(output_dir, f"{'_vs_'.join(stems)}_report.{extension}")
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m model_viz.report",
+        description="Render the plots of every group of model output files",
+    )
+    parser.add_argument("paths", nargs="+", help="HDF5 files, one report each")
+    parser.add_argument(
+        "-g",
+        "--graph-types",
+        nargs="+",
+        choices=list(plotting.GRAPH_TYPES),
+        default=list(plotting.GRAPH_TYPES),
+        metavar="GRAPH_TYPE",
+        help=f"Graph types to render, of {', '.join(plotting.GRAPH_TYPES)}. "
+        "Defaults to all",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help=f"Directory of the reports, defaults to {config.App.output_dir}",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare the files run by run in a single report",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render every group again, even if unchanged since the last report",
+    )
+    args = parser.parse_args(argv)
+    if args.compare and len(args.paths) < 2:
+        parser.error("--compare takes several files")
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    config.Metrics.enabled = True
+    output_dir = args.output_dir or config.App.output_dir
+    runs = [args.paths] if args.compare else [[path] for path in args.paths]
+    for paths in runs:
+        output_file = report_file(paths, output_dir)
+        print(build_report(paths, args.graph_types, output_file, args.force))
+    pages = [
+        entry
+        for entry in os.scandir(config.Report.page_dir)
+        if not entry.name.endswith(".tmp")  # Pages still being written
+    ]
+    cache.evict_lru(pages, config.Report.max_size_mb * 1024**2)
+    print(timing_summary(time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,13 @@
 from PyPDF2 import PdfMerger
-from typing import List
-import os
+from typing import IO, Iterable, Union
 
 
-def merge_pdf_files(files: List[str], output_file: str) -> None:
+def merge_pdf_files(files: Iterable[Union[str, IO]], output_file: str) -> None:
     """Merge multiple PDF files into one PDF file
 
     Args:
-        files (list): List of PDF files to merge
+        files (iterable): PDF files to merge, as paths or binary file objects.
+            Files are appended as they are yielded, so this may be a generator.
         output_file (str): Output file name
     """
 
@@ -16,15 +16,3 @@ def merge_pdf_files(files: List[str], output_file: str) -> None:
         merger.append(file)
     merger.write(output_file)
     merger.close()
-
-
-def delete_files(files: List[str], delete_dir=False) -> None:
-    """Delete files
-
-    Args:
-        files (list): List of files to delete
-    """
-    for file in files:
-        os.remove(file)
-    if delete_dir:
-        os.rmdir(os.path.dirname(files[0]))
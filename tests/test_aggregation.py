@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+import model_viz.aggregation as aggregation
+
+
+def test_pyramid_query_downsamples_to_the_wanted_bins():
+    counts = np.random.default_rng(0).integers(0, 10, size=(1024, 64))
+    pyramid = aggregation.TilePyramid(counts, (0, 64), (0, 1))
+
+    # Only the finest level resolves 32 time steps, at 16 times the wanted height
+    tile, x, y = pyramid.query((0, 32), (0, 1), 32, 64)
+    assert tile.shape == (64, 32) == (len(y), len(x))
+    assert tile.sum() == counts[:, :32].sum()
+
+
+@pytest.fixture
+def samples():
+    return np.random.default_rng(0).lognormal(size=(5000, 12))
+
+
+def test_exact_quantiles_match_numpy(samples):
+    qs = (0.0, 0.25, 0.5, 0.75, 1.0)
+    state = aggregation.ColumnQuantiles("exact")
+    for rows in (slice(0, 3000), slice(3000, None)):
+        state.merge(
+            aggregation.ColumnQuantiles("exact")
+            .update(samples[rows, :6])
+            .update(samples[rows, 6:], column=6)
+        )
+
+    expected = np.percentile(samples, np.multiply(qs, 100), axis=0)
+    np.testing.assert_allclose(state.quantiles(qs), expected)
+    np.testing.assert_allclose(aggregation.quantiles(samples, qs), expected)
+
+
+def test_quantiles_of_integers_are_interpolated():
+    qs = (0.1, 0.25, 0.5, 0.75)
+    data = np.array([[1, 10], [2, 20], [4, 40], [7, 70]], dtype=np.int64)
+
+    expected = np.percentile(data, np.multiply(qs, 100), axis=0)
+    np.testing.assert_allclose(aggregation.quantiles(data, qs), expected)
+    np.testing.assert_allclose(
+        aggregation.ColumnQuantiles("exact").update(data).quantiles(qs), expected
+    )
+    hazen = np.percentile(data, np.multiply(qs, 100), axis=0, method="hazen")
+    np.testing.assert_allclose(
+        aggregation.weighted_quantiles(data, np.ones(4), qs), hazen
+    )
+
+
+def test_pyramid_query_off_the_data_is_empty():
+    counts = np.random.default_rng(0).integers(0, 10, size=(64, 64))
+    pyramid = aggregation.TilePyramid(counts, (0, 64), (0, 1))
+
+    for x_range, y_range in [((-500, -100), (0, 1)), ((0, 64), (2, 3))]:
+        tile, x, y = pyramid.query(x_range, y_range, 60, 40)
+        assert tile.size == len(x) * len(y) == 0
+
+
+def _rank_error(data: np.ndarray, estimates: np.ndarray, qs) -> float:
+    """Largest distance between the wanted quantiles and the ranks of the estimates"""
+    ranks = (data[None, :, :] <= estimates[:, None, :]).mean(axis=1)
+    return np.abs(ranks - np.asarray(qs)[:, None]).max()
+
+
+@pytest.mark.parametrize("y_scale", ["linear", "log"])
+def test_count_grids_of_splits_add_up_to_the_whole(samples, y_scale):
+    def grid():
+        return aggregation.CountGrid((0, 11), (0.1, 10), 6, 50, y_scale=y_scale)
+
+    whole = grid().update(samples)
+    split = grid().update(samples[:2000, :5]).update(samples[:2000, 5:], column=5)
+    split.merge(grid().update(samples[2000:, :5]))
+    split.merge(grid().update(samples[2000:, 5:], column=5))
+
+    np.testing.assert_array_equal(split.counts, whole.counts)
+
+
+def test_merged_sketches_stay_within_their_rank_error(samples):
+    qs = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+    sketch = aggregation.QuantileSketch(k=200, seed=0)
+    for start in range(0, len(samples), 500):
+        sketch.merge(
+            aggregation.QuantileSketch(k=200, seed=start).update(
+                samples[start : start + 500]
+            )
+        )
+
+    estimates = sketch.quantiles(qs)
+    assert _rank_error(samples, estimates, qs) <= 2 / sketch.k
+    np.testing.assert_array_equal(estimates[0], samples.min(axis=0))
+    np.testing.assert_array_equal(estimates[-1], samples.max(axis=0))
+
+
+@pytest.mark.parametrize("y_scale", ["linear", "log"])
+def test_numpy_binning_matches_datashader(samples, y_scale):
+    pytest.importorskip("datashader")
+    # Bin edges fall on sample values, which both backends must put in the same bin
+    samples[:10] = np.linspace(0.5, 4.5, 10)[:, None]
+
+    def grid(backend):
+        return aggregation.CountGrid(
+            (0, 11), (0.5, 4.5), 12, 40, y_scale=y_scale, backend=backend
+        ).update(samples)
+
+    np.testing.assert_array_equal(grid("numpy").counts, grid("datashader").counts)
+
+
+def test_weighted_quantiles_match_repeated_samples():
+    rng = np.random.default_rng(0)
+    data = rng.lognormal(size=(50, 4))
+    weights = rng.integers(1, 6, size=50)
+
+    for column in range(data.shape[1]):
+        order = np.argsort(data[:, column])
+        cumulative = np.cumsum(weights[order])
+        # Every sample sits at the middle of its share of the cumulative weight
+        qs = (cumulative - weights[order] / 2) / cumulative[-1]
+        repeated = np.repeat(data[:, column], weights)
+        expected = np.percentile(repeated, 100 * qs, method="hazen")
+        result = aggregation.weighted_quantiles(data, weights, qs)[:, column]
+        np.testing.assert_allclose(result, expected)
+        np.testing.assert_allclose(result, data[order, column])
+
+
+def test_stratified_rows_allocate_draws_to_strata():
+    rows = aggregation.stratified_rows(1000, 100, seed=1)
+    np.testing.assert_array_equal(rows // 10, np.arange(100))
+
+    # A row only meets the strata its share of the weight overlaps, which draw in
+    # it at most once each and surely if the share covers them
+    weights = np.random.default_rng(0).integers(0, 5, size=200)
+    rows = aggregation.stratified_rows(200, 300, weights, seed=1)
+    expected = 300 * weights / weights.sum()
+    draws = np.bincount(rows, minlength=200)
+    assert np.all(np.abs(draws - expected) < 2)
+    assert not draws[weights == 0].any()
+    assert np.all(np.diff(rows) >= 0)
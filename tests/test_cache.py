@@ -0,0 +1,62 @@
+import os
+import h5py
+import numpy as np
+import pytest
+import model_viz.cache as cache
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    with h5py.File(tmp_path / "run.h5", "w") as file:
+        file["data"] = np.arange(12.0).reshape(3, 4)
+    file = h5py.File(tmp_path / "run.h5", "r")
+    yield file["data"]
+    file.close()
+
+
+@pytest.fixture
+def evicted_meanwhile(monkeypatch):
+    """Make every entry look evicted by another process right after it was read"""
+
+    def utime(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(cache.os, "utime", utime)
+
+
+def test_stats_cache_hit_survives_concurrent_eviction(
+    tmp_path, dataset, evicted_meanwhile
+):
+    stats_cache = cache.StatsCache(str(tmp_path / "cache"), 10, True)
+    stats_cache.put(dataset, "kind", {}, {"counts": np.ones(3)})
+    np.testing.assert_array_equal(
+        stats_cache.get(dataset, "kind", {})["counts"], np.ones(3)
+    )
+
+
+def test_shared_figure_hit_survives_concurrent_eviction(tmp_path, evicted_meanwhile):
+    figure_cache = cache.FigureCache(10, "shared", str(tmp_path / "figures"))
+    figure_cache.put("key", {"data": []})
+    assert figure_cache.get("key") == {"data": []}
+
+
+def test_evict_lru_skips_entries_removed_meanwhile(tmp_path):
+    for name, size in [("old", 300), ("gone", 300), ("new", 300)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+        os.utime(tmp_path / name, (0, {"old": 1, "gone": 2, "new": 3}[name]))
+    entries = list(os.scandir(tmp_path))
+    os.remove(tmp_path / "gone")
+
+    assert cache.evict_lru(entries, 400) == 1
+    assert sorted(os.listdir(tmp_path)) == ["new"]
+
+
+def test_stats_cache_misses_once_the_file_changes(tmp_path, dataset):
+    stats_cache = cache.StatsCache(str(tmp_path / "cache"), 10, True)
+    stats_cache.put(dataset, "kind", {"bins": 3}, {"counts": np.ones(3)})
+    assert stats_cache.get(dataset, "kind", {"bins": 3}) is not None
+    assert stats_cache.get(dataset, "kind", {"bins": 4}) is None
+
+    stat = os.stat(dataset.file.filename)
+    os.utime(dataset.file.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert stats_cache.get(dataset, "kind", {"bins": 3}) is None
@@ -0,0 +1,39 @@
+import configparser
+import os
+import subprocess
+import sys
+import pytest
+import model_viz.config as config
+
+
+@pytest.fixture
+def restore_config(monkeypatch):
+    monkeypatch.delenv("MODEL_VIZ_CONFIG", raising=False)
+    default = config.config_file
+    yield
+    config.load(default)
+
+
+def test_loaded_file_reaches_worker_processes(tmp_path, restore_config):
+    configuration = configparser.ConfigParser()
+    configuration.read(config.config_file)
+    configuration["CACHE"]["cache_dir"] = str(tmp_path / "cache")
+    with open(tmp_path / "config.ini", "w") as f:
+        configuration.write(f)
+
+    config.load(str(tmp_path / "config.ini"))
+
+    assert config.Cache.cache_dir == str(tmp_path / "cache")
+    worker = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import model_viz.config as c; print(c.Cache.cache_dir)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=config.MODEL_VIZ_BASE_DIR,
+        env=os.environ,
+    )
+    assert worker.stdout.strip() == str(tmp_path / "cache")
@@ -0,0 +1,57 @@
+import os
+import h5py
+import numpy as np
+import pytest
+import model_viz.config as config
+import model_viz.convert as convert
+import model_viz.hdf_ops as hdf_ops
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    # 1 MB blocks split the dataset into both row and column bands
+    monkeypatch.setattr(config.HDF, "chunk_budget_mb", 1)
+    data = np.random.default_rng(0).lognormal(size=(20000, 37))
+    path = str(tmp_path / "run.h5")
+    with h5py.File(path, "w") as file:
+        file.create_dataset("root/g0/data", data=data, chunks=(20000, 5))
+        file["root/g0/overlay_data"] = np.arange(37.0)
+        file["root/g0"].attrs["units"] = "cases"
+    return path, data
+
+
+def test_copy_holds_the_source_and_its_pyramid(source):
+    path, data = source
+    args = convert.parse_args([path, "--compression", "lzf", "--pyramid-levels", "3"])
+    output = convert.convert(path, args=args)
+
+    assert output == hdf_ops.optimized_path(path)
+    assert hdf_ops.is_optimized_copy(output, path)
+    with h5py.File(output, "r") as copy:
+        group = copy["root/g0"]
+        np.testing.assert_array_equal(group["data"][()], data)
+        np.testing.assert_array_equal(group["overlay_data"][()], np.arange(37.0))
+        assert group.attrs["units"] == "cases"
+        assert group["data"].compression == "lzf"
+
+        pyramid = group[hdf_ops.PYRAMID_GROUP]
+        assert sorted(pyramid, key=int) == ["2", "4", "8"]
+        for name in pyramid:
+            np.testing.assert_array_equal(pyramid[name][()], data[:, :: int(name)])
+
+        level, factor = hdf_ops.get_pyramid_level(group, 9)
+        assert factor == 4 and level.shape[1] == 10
+        level, factor = hdf_ops.get_pyramid_level(group, 37)
+        assert factor == 1 and level == group["data"]
+
+
+def test_reader_prefers_an_up_to_date_copy(source):
+    path, _ = source
+    copy_path = convert.convert(path)
+
+    assert hdf_ops.HDFReader("run", path).data_path == copy_path
+    assert hdf_ops.HDFReader("run", path, prefer_optimized=False).data_path == path
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert hdf_ops.HDFReader("run", path).data_path == path
@@ -0,0 +1,77 @@
+import os
+import zipfile
+import h5py
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+from PyPDF2 import PdfReader
+import model_viz.cache as cache
+import model_viz.config as config
+import model_viz.export as export
+import model_viz.plotting as plotting
+
+
+def test_heatmaps_are_downsampled_keeping_their_counts(monkeypatch):
+    monkeypatch.setattr(config.Export, "raster_max_width", 50)
+    monkeypatch.setattr(config.Export, "raster_max_height", 40)
+    monkeypatch.setattr(config.Histogram2D, "y_scale", "linear")
+    counts = np.random.default_rng(0).integers(0, 100, size=(100, 300))
+    log_counts = np.where(counts > 0, np.log10(np.maximum(counts, 1)), np.nan)
+    fig = go.Figure(
+        [
+            go.Heatmap(z=log_counts, x=np.arange(300), y=np.linspace(0, 1, 100)),
+            go.Scatter(x=np.arange(300), y=np.arange(300)),
+        ]
+    )
+
+    export.downsample_heatmaps(fig)
+
+    z = np.asarray(fig.data[0].z)
+    assert z.shape[0] <= 40 and z.shape[1] <= 50
+    assert z.shape == (len(fig.data[0].y), len(fig.data[0].x))
+    np.testing.assert_allclose(np.nansum(10**z), counts.sum())
+    assert len(fig.data[1].x) == 300
+
+
+@pytest.fixture
+def groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache.stats_cache, "enabled", False)
+    monkeypatch.setattr(config.Export, "workers", 1)
+    monkeypatch.setattr(config.Plotter, "width", 400)
+    monkeypatch.setattr(config.Plotter, "height", 300)
+    with h5py.File(tmp_path / "run.h5", "w") as file:
+        for name in ("cases", "deaths", "r0"):
+            file[f"root/{name}/data"] = np.random.default_rng(0).normal(size=(200, 20))
+    file = h5py.File(tmp_path / "run.h5", "r")
+    yield [file[f"root/{name}"] for name in ("cases", "deaths", "r0")]
+    file.close()
+
+
+def test_pages_are_merged_in_memory(tmp_path, groups):
+    progress = []
+    output = export.export_groups(
+        groups,
+        plotting.BoxPlotOverTime,
+        str(tmp_path / "out" / "plots.pdf"),
+        progress=lambda done, total: progress.append((done, total)),
+    )
+
+    assert len(PdfReader(output).pages) == 3
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    # No page was written to disk on the way
+    assert os.listdir(tmp_path / "out") == ["plots.pdf"]
+
+
+def test_image_pages_are_archived(tmp_path, groups, monkeypatch):
+    monkeypatch.setattr(config.Plotter, "output_file_format", "png")
+    output = export.export_groups(
+        groups, plotting.BoxPlotOverTime, str(tmp_path / "plots.zip")
+    )
+
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == [
+            "0000_root_cases.png",
+            "0001_root_deaths.png",
+            "0002_root_r0.png",
+        ]
+        assert archive.read("0000_root_cases.png").startswith(b"\x89PNG")
@@ -0,0 +1,78 @@
+import os
+import h5py
+import numpy as np
+import pytest
+import model_viz.config as config
+import model_viz.hdf_ops as hdf_ops
+
+
+@pytest.fixture
+def reader(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.Cache, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(config.Cache, "enabled", True)
+    path = str(tmp_path / "run.h5")
+    with h5py.File(path, "w") as file:
+        for root in ("posterior", "prior"):
+            for name in ("cases", "deaths", "r0"):
+                file[f"{root}/{name}/data"] = np.ones((4, 3), dtype=np.float32)
+        file["posterior/cases/overlay_data"] = np.arange(3)
+    reader = hdf_ops.HDFReader("run", path, prefer_optimized=False)
+    yield reader
+    reader.hdf.close()
+
+
+def test_group_index_lists_the_groups_of_the_file(reader):
+    groups = reader.get_all_groups()
+
+    # The second index is read back from the cache written by the first
+    for index in (reader.get_group_index(), reader.get_group_index()):
+        assert {
+            root: [info.name for info in infos] for root, infos in index.items()
+        } == {root: [group.name for group in items] for root, items in groups.items()}
+    assert len(os.listdir(config.Cache.cache_dir)) == 1
+    assert index["posterior"][0].datasets == {
+        "data": {"shape": [4, 3], "dtype": "<f4"},
+        "overlay_data": {"shape": [3], "dtype": "<i8"},
+    }
+
+
+@pytest.fixture
+def datasets(tmp_path):
+    data = np.random.default_rng(0).normal(size=(300, 50))
+    with h5py.File(tmp_path / "layouts.h5", "w") as file:
+        file["contiguous"] = data
+        file.create_dataset("chunked", data=data, chunks=(100, 10))
+        file.create_dataset("compressed", data=data, compression="gzip")
+    file = h5py.File(tmp_path / "layouts.h5", "r")
+    yield file, data
+    file.close()
+
+
+def test_contiguous_datasets_are_mapped_with_their_contents(datasets, monkeypatch):
+    file, data = datasets
+    view = hdf_ops.memmap(file["contiguous"])
+    assert isinstance(view, np.memmap)
+    np.testing.assert_array_equal(view, file["contiguous"][()])
+    assert isinstance(hdf_ops.as_array(file["contiguous"]), np.memmap)
+    start, band = hdf_ops.column_band(file["contiguous"], 17)
+    np.testing.assert_array_equal(band, data[:, start : start + band.shape[1]])
+
+    monkeypatch.setattr(config.HDF, "memory_map", False)
+    assert hdf_ops.memmap(file["contiguous"]) is None
+
+
+@pytest.mark.parametrize("name", ["chunked", "compressed"])
+def test_other_layouts_are_read_instead(datasets, name, monkeypatch):
+    monkeypatch.setattr(config.HDF, "chunk_budget_mb", 0)
+    file, data = datasets
+    assert hdf_ops.memmap(file[name]) is None
+
+    array = hdf_ops.as_array(file[name])
+    assert not isinstance(array, np.memmap)
+    np.testing.assert_array_equal(array, data)
+    blocks = list(hdf_ops.iter_blocks(file[name]))
+    assert len(blocks) > 1
+    for (row, col), block in blocks:
+        np.testing.assert_array_equal(
+            block, data[row : row + block.shape[0], col : col + block.shape[1]]
+        )
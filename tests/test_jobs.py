@@ -0,0 +1,36 @@
+import threading
+import time
+import model_viz.jobs as jobs
+
+
+def _wait(queue: jobs.JobQueue, job_id: str, timeout: float = 10) -> dict:
+    deadline = time.monotonic() + timeout
+    while (status := queue.status(job_id))["status"] not in (jobs.DONE, jobs.FAILED):
+        assert time.monotonic() < deadline, f"Job {job_id} did not finish"
+        time.sleep(0.01)
+    return status
+
+
+def test_jobs_with_the_key_of_an_unfinished_job_are_not_started(tmp_path):
+    queue = jobs.JobQueue(str(tmp_path / "jobs.db"), workers=2)
+    release = threading.Event()
+    runs = []
+
+    def job(name, progress):
+        runs.append(name)
+        release.wait(10)
+        return name
+
+    first = queue.submit("export", job, "first")
+    assert queue.submit("export", job, "second") == first
+    other = queue.submit("report", job, "other")
+    assert other != first
+    release.set()
+
+    assert _wait(queue, first)["result"] == "first"
+    assert _wait(queue, other)["result"] == "other"
+    assert sorted(runs) == ["first", "other"]
+
+    # Finished jobs no longer hold their key
+    again = queue.submit("export", job, "again")
+    assert again != first and _wait(queue, again)["result"] == "again"
@@ -0,0 +1,107 @@
+import h5py
+import numpy as np
+import pytest
+import model_viz.aggregation as aggregation
+import model_viz.config as config
+import model_viz.live as live
+import model_viz.plotting as plotting
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    # 1 MB blocks split the datasets below into both row and column bands
+    monkeypatch.setattr(config.HDF, "chunk_budget_mb", 1)
+
+
+@pytest.fixture
+def growing_file(tmp_path):
+    data = np.random.default_rng(0).lognormal(size=(40000, 10))
+    with h5py.File(tmp_path / "live.h5", "w") as file:
+        file.create_dataset(
+            "data", data=data[:, :3], chunks=(20000, 4), maxshape=(None, None)
+        )
+    file = h5py.File(tmp_path / "live.h5", "a")
+    yield file, data
+    file.close()
+
+
+def _append_columns(file: h5py.File, data: np.ndarray, n_cols: int) -> None:
+    file["data"].resize((data.shape[0], n_cols))
+    file["data"][:, :n_cols] = data[:, :n_cols]
+
+
+def _rank_error(data: np.ndarray, estimates: np.ndarray, qs) -> float:
+    ranks = (data[None, :, :] <= estimates[:, None, :]).mean(axis=1)
+    return np.abs(ranks - np.asarray(qs)[:, None]).max()
+
+
+def test_boxplot_stats_fold_in_appended_particles(
+    small_budget, growing_file, monkeypatch
+):
+    file, data = growing_file
+    file["data"].resize((30000, 3))
+    aggregate = live.LiveBoxplotStats(file["data"])
+    assert aggregate.update()
+    resets = []
+    monkeypatch.setattr(aggregate, "reset", lambda: resets.append(1))
+
+    file["data"].resize((data.shape[0], 3))
+    file["data"][30000:] = data[30000:, :3]
+    assert aggregate.update()
+    _append_columns(file, data, 10)
+    assert aggregate.update()
+    assert not aggregate.update()
+
+    qs = plotting.BoxPlotOverTime.quantiles
+    assert not resets
+    assert aggregate.quantiles.shape == (5, 10)
+    assert _rank_error(data, aggregate.quantiles, qs) <= 2 / aggregate.state.k
+    np.testing.assert_array_equal(aggregate.quantiles[0], data.min(axis=0))
+    np.testing.assert_array_equal(aggregate.quantiles[-1], data.max(axis=0))
+
+
+def test_count_grid_counts_every_particle_once(small_budget, growing_file):
+    file, data = growing_file
+    aggregate = live.LiveCountGrid(file["data"])
+    aggregate.update()
+    _append_columns(file, data, 10)
+    aggregate.update()
+
+    assert aggregate.counts.shape == (config.Histogram2D.plot_height, 10)
+    expected = aggregation.binned_column_counts(
+        data, aggregate.y_range, config.Histogram2D.plot_height
+    )
+    np.testing.assert_array_equal(aggregate.counts, expected)
+
+
+def test_count_grid_folds_in_appended_particles(small_budget, growing_file):
+    file, data = growing_file
+    aggregate = live.LiveCountGrid(file["data"])
+    aggregate.update()
+    file["data"].resize((data.shape[0] + 100, 3))
+    file["data"][data.shape[0] :] = np.median(data[:, :3], axis=0)
+    aggregate.update()
+
+    assert aggregate.counts.sum(axis=0).tolist() == [data.shape[0] + 100] * 3
+
+
+def test_count_grid_bins_as_histogram2d(small_budget, growing_file, monkeypatch):
+    monkeypatch.setattr(config.Histogram2D, "y_scale", "log")
+    monkeypatch.setattr(config.Histogram2D, "y_min", 0.5)
+    file, data = growing_file
+    aggregate = live.LiveCountGrid(file["data"])
+    aggregate.update()
+    _append_columns(file, data, 10)
+    aggregate.update()
+
+    assert aggregate.y_range[0] == 0.5 and aggregate.y_range[1] > data.max()
+    grid = aggregation.CountGrid(
+        (-0.5, 9.5),
+        aggregate.y_range,
+        10,
+        config.Histogram2D.plot_height,
+        y_scale="log",
+    ).update(data)
+    stats = aggregate.stats()
+    np.testing.assert_array_equal(stats["counts"], grid.counts)
+    np.testing.assert_allclose(stats["y"], grid.y)
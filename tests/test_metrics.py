@@ -0,0 +1,57 @@
+import flask
+import pytest
+import model_viz.config as config
+import model_viz.metrics as metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def _server():
+    server = flask.Flask(__name__)
+    server.add_url_rule(
+        metrics.CALLBACK_ROUTE,
+        "callback",
+        lambda: flask.Response("x" * 100),
+        methods=["POST"],
+    )
+    return server
+
+
+def test_nothing_is_recorded_while_disabled(registry, monkeypatch):
+    monkeypatch.setattr(config.Metrics, "enabled", False)
+    with metrics.span("hdf.read") as span:
+        span.add_bytes(10)
+    assert metrics.span("aggregate") is span  # The shared no-op
+    assert registry.snapshot() == {}
+
+    server = _server()
+    metrics.install(server)
+    assert server.test_client().get(config.Metrics.endpoint).status_code == 404
+
+
+def test_metrics_are_served_in_the_prometheus_format(registry, monkeypatch):
+    monkeypatch.setattr(config.Metrics, "enabled", True)
+    monkeypatch.setattr(config.Metrics, "profiling", False)
+    with metrics.span("hdf.read", 1000) as span:
+        span.add_bytes(24)
+    server = _server()
+    metrics.install(
+        server, extra_metrics=lambda: metrics.render_gauges("extra", "Extra", "k", {})
+    )
+    client = server.test_client()
+    client.post(metrics.CALLBACK_ROUTE, json={"output": "graph.figure"})
+
+    text = client.get(config.Metrics.endpoint).get_data(as_text=True)
+    lines = text.splitlines()
+    assert "# TYPE model_viz_span_seconds histogram" in lines
+    assert 'model_viz_span_seconds_bucket{span="hdf.read",le="+Inf"} 1' in lines
+    assert 'model_viz_span_seconds_count{span="hdf.read"} 1' in lines
+    assert 'model_viz_span_bytes_total{span="hdf.read"} 1024' in lines
+    assert 'model_viz_callback_seconds_count{callback="graph.figure"} 1' in lines
+    assert 'model_viz_callback_bytes_total{callback="graph.figure"} 100' in lines
+    assert "# TYPE extra gauge" in lines
@@ -0,0 +1,38 @@
+import os
+import threading
+import h5py
+import numpy as np
+import pytest
+import model_viz.parallel as parallel
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "run.h5")
+    with h5py.File(path, "w") as file:
+        file["root/g0/data"] = np.arange(12.0).reshape(3, 4)
+    return path
+
+
+def _in_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_reopening_a_changed_file_leaves_other_threads_reading(path):
+    group = parallel.open_group(path, "/root/g0")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    reopened = _in_thread(lambda: parallel.open_group(path, "/root/g0"))
+
+    assert reopened.file.id.id != group.file.id.id
+    np.testing.assert_array_equal(group["data"][0], np.arange(4.0))
+
+
+def test_handles_are_reused_within_a_thread(path):
+    first = parallel.open_group(path, "/root/g0")
+    assert parallel.open_group(path, "/root/g0").file.id.id == first.file.id.id
@@ -0,0 +1,57 @@
+import base64
+import json
+import numpy as np
+import plotly.utils
+import pytest
+import model_viz.config as config
+import model_viz.payload as payload
+
+
+@pytest.fixture
+def json_floats(monkeypatch):
+    monkeypatch.setattr(config.Payload, "float32", True)
+    monkeypatch.setattr(config.Payload, "binary_arrays", False)
+
+
+def test_small_values_keep_their_significant_digits(json_floats):
+    encoded = payload.encode_array(np.array([0.4, 3.25, 12.5, 2.5e6, np.nan]))
+    assert json.dumps(encoded, cls=plotly.utils.PlotlyJSONEncoder) == (
+        "[0.4, 3.25, 12.5, 2500000.0, null]"
+    )
+
+
+def test_rounding_stays_within_float32_precision(json_floats):
+    values = np.random.default_rng(0).lognormal(sigma=10, size=1000)
+    encoded = payload.encode_array(values)
+    np.testing.assert_allclose(encoded, values, rtol=1e-6)
+
+
+def test_decimate_keeps_extremes():
+    y = np.sin(np.linspace(0, 20, 10000))
+    y[1234] = 5
+    x, decimated = payload.decimate(np.arange(len(y)), y, 100)
+    assert len(decimated) <= 100
+    assert decimated.max() == 5 and 1234 in x
+
+
+@pytest.mark.parametrize(
+    "values, dtype",
+    [
+        ([-(2**31), 2**31 - 1], "i4"),
+        ([0, 2**32 - 1], "u4"),
+        (np.array([0, 2**32 - 1], dtype=np.uint64), "u4"),
+    ],
+)
+def test_64_bit_integers_are_narrowed_when_they_fit(monkeypatch, values, dtype):
+    monkeypatch.setattr(config.Payload, "binary_arrays", True)
+    encoded = payload.encode_array(np.asarray(values))
+    assert encoded["dtype"] == dtype
+    decoded = np.frombuffer(base64.b64decode(encoded["bdata"]), dtype=f"<{dtype}")
+    assert decoded.tolist() == list(values)
+
+
+@pytest.mark.parametrize("binary_arrays", [True, False])
+def test_64_bit_integers_that_do_not_fit_are_sent_as_json(monkeypatch, binary_arrays):
+    monkeypatch.setattr(config.Payload, "binary_arrays", binary_arrays)
+    for values in ([-1, 2**32], np.array([0, 2**63], dtype=np.uint64)):
+        assert payload.encode_array(np.asarray(values)) == list(values)
@@ -0,0 +1,104 @@
+import h5py
+import numpy as np
+import pytest
+import model_viz.cache as cache
+import model_viz.config as config
+import model_viz.plotting as plotting
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    # 1 MB blocks split the dataset into both row and column bands
+    monkeypatch.setattr(config.HDF, "chunk_budget_mb", 1)
+    monkeypatch.setattr(cache.stats_cache, "enabled", False)
+    data = np.random.default_rng(0).lognormal(size=(40000, 20))
+    with h5py.File(tmp_path / "run.h5", "w") as file:
+        file.create_dataset("data", data=data, chunks=(10000, 4))
+    file = h5py.File(tmp_path / "run.h5", "r")
+    yield file["data"], data
+    file.close()
+
+
+def test_streamed_count_grid_matches_in_memory(dataset):
+    dataset, data = dataset
+    streamed = plotting.Histogram2D(dataset).compute_stats()
+    in_memory = plotting.Histogram2D(data).compute_stats()
+
+    for key in ("counts", "x", "y"):
+        np.testing.assert_array_equal(streamed[key], in_memory[key])
+    assert streamed["counts"].sum() == data.size
+
+
+@pytest.fixture
+def runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache.stats_cache, "enabled", False)
+    files = {}
+    for label, scale in [("run_a", 1.0), ("run_b", 2.0)]:
+        with h5py.File(tmp_path / f"{label}.h5", "w") as file:
+            file["root/cases/data"] = np.random.default_rng(0).lognormal(
+                sigma=scale, size=(500, 30)
+            )
+            file["root/cases/overlay_data"] = np.arange(30.0)[None]
+        files[label] = h5py.File(tmp_path / f"{label}.h5", "r")
+    yield {label: file["root/cases"] for label, file in files.items()}
+    for file in files.values():
+        file.close()
+
+
+@pytest.fixture
+def pooled_stats(monkeypatch):
+    """Record the groups of every call of `parallel.compute_stats`"""
+    calls = []
+    compute_stats = plotting.parallel.compute_stats
+
+    def record(groups, plotter):
+        calls.append([group.file.filename for group in groups])
+        return compute_stats(groups, plotter)
+
+    monkeypatch.setattr(plotting.parallel, "compute_stats", record)
+    return calls
+
+
+def test_boxplot_comparison_overlays_runs(runs, pooled_stats, monkeypatch):
+    monkeypatch.setattr(config.Comparison, "layout", "overlay")
+    fig = plotting.create_comparison_plot(runs, plotting.BoxPlotOverTime).fig
+
+    assert [trace.type for trace in fig.data] == ["box", "box", "scatter"]
+    assert [trace.name for trace in fig.data[:2]] == ["run_a", "run_b"]
+    assert fig.layout.boxmode == "group"
+    # Both runs are aggregated on the shared pool, in a single call
+    assert len(pooled_stats) == 1 and len(pooled_stats[0]) == 2
+
+
+@pytest.mark.parametrize(
+    "plotter, layout",
+    [(plotting.BoxPlotOverTime, "facet"), (plotting.Histogram2D, "overlay")],
+)
+def test_comparison_facets_runs(runs, pooled_stats, monkeypatch, plotter, layout):
+    monkeypatch.setattr(config.Comparison, "layout", layout)
+    fig = plotting.create_comparison_plot(runs, plotter).fig
+
+    assert [annotation.text for annotation in fig.layout.annotations] == [
+        "run_a",
+        "run_b",
+    ]
+    assert {trace.yaxis for trace in fig.data} == {"y", "y2"}
+    if plotter is plotting.Histogram2D:
+        # Heatmaps of both runs share one color scale
+        assert {trace.coloraxis for trace in fig.data if trace.type == "heatmap"} == {
+            "coloraxis"
+        }
+    assert len(pooled_stats) == 1
+
+
+def test_streamed_sketch_boxplot_stays_within_its_rank_error(dataset, monkeypatch):
+    dataset, data = dataset
+    monkeypatch.setattr(config.BoxPlotOverTime, "quantile_method", "sketch")
+    stats = plotting.BoxPlotOverTime(dataset).compute_stats()
+
+    estimates = np.stack([stats[key] for key in ("q1", "median", "q3")])
+    ranks = (data[None, :, :] <= estimates[:, None, :]).mean(axis=1)
+    bound = 2 / config.BoxPlotOverTime.sketch_k
+    assert np.abs(ranks - np.array([0.25, 0.5, 0.75])[:, None]).max() <= bound
+    np.testing.assert_array_equal(stats["lower_fence"], data.min(axis=0))
+    np.testing.assert_array_equal(stats["upper_fence"], data.max(axis=0))
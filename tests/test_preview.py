@@ -0,0 +1,61 @@
+import time
+import h5py
+import numpy as np
+import pytest
+import model_viz.cache as cache
+import model_viz.config as config
+import model_viz.parallel as parallel
+import model_viz.plotting as plotting
+import model_viz.preview as preview
+
+
+@pytest.fixture
+def group(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.Cache, "enabled", True)
+    monkeypatch.setattr(config.Preview, "enabled", True)
+    monkeypatch.setattr(config.Preview, "initial_rows", 200)
+    monkeypatch.setattr(config.Preview, "min_rows", 50)
+    monkeypatch.setattr(cache.stats_cache, "enabled", True)
+    monkeypatch.setattr(cache.stats_cache, "cache_dir", str(tmp_path / "cache"))
+    # Refinements run on threads of this process, which sees the settings above
+    monkeypatch.setattr(config.Aggregate, "backend", "thread")
+    monkeypatch.setattr(parallel, "_executor", None)
+    monkeypatch.setattr(preview, "_seconds_per_value", None)
+    monkeypatch.setattr(preview, "_refinements", {})
+    rng = np.random.default_rng(0)
+    with h5py.File(tmp_path / "run.h5", "w") as file:
+        file["root/cases/data"] = rng.lognormal(size=(5000, 20))
+        file["root/cases/weights"] = rng.integers(1, 4, size=5000).astype(float)
+    file = h5py.File(tmp_path / "run.h5", "r")
+    yield file["root/cases"]
+    file.close()
+    if parallel._executor is not None:
+        parallel._executor.shutdown()
+
+
+def _annotations(plot: plotting.BasePlotter) -> list[str]:
+    return [annotation.text for annotation in plot.fig.layout.annotations]
+
+
+def test_preview_is_replaced_once_refined(group):
+    plotter = plotting.BoxPlotOverTime
+    plot = preview.preview_plot(group, plotter)
+    assert plot is not None
+    assert any(
+        text.startswith("Preview from 200 of 5000") for text in _annotations(plot)
+    )
+
+    deadline = time.monotonic() + 30
+    while not preview.is_refined(group, plotter):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    # The exact statistics are cached, so the group is no longer previewed
+    assert preview.preview_plot(group, plotter) is None
+    weights = group["weights"][()]
+    exact = plotter(data=group["data"], weights=weights / weights.mean())
+    cached = exact.cached_stats()
+    for key, values in exact.compute_stats().items():
+        np.testing.assert_allclose(cached[key], values)
+    plot = plotting.create_group_plot(group, plotter)
+    assert not any(text.startswith("Preview") for text in _annotations(plot))
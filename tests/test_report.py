@@ -0,0 +1,63 @@
+import os
+import h5py
+import numpy as np
+import pytest
+import model_viz.cache as cache
+import model_viz.config as config
+import model_viz.export as export
+import model_viz.report as report
+
+
+@pytest.fixture
+def rendered(tmp_path, monkeypatch):
+    """Number of groups rendered by every call of `export.render_groups`"""
+    monkeypatch.setattr(cache.stats_cache, "enabled", False)
+    monkeypatch.setattr(config.Cache, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(config.Report, "page_dir", str(tmp_path / "pages"))
+    monkeypatch.setattr(config.Export, "workers", 1)
+    monkeypatch.setattr(config.Plotter, "width", 400)
+    monkeypatch.setattr(config.Plotter, "height", 300)
+    counts = []
+    render_groups = export.render_groups
+
+    def counting_render_groups(groups, plotter):
+        counts.append(len(groups))
+        return render_groups(groups, plotter)
+
+    monkeypatch.setattr(export, "render_groups", counting_render_groups)
+    return counts
+
+
+def _write_run(path, seed):
+    with h5py.File(path, "w") as file:
+        for name in ("cases", "deaths"):
+            data = np.random.default_rng(seed).normal(size=(100, 10))
+            file[f"root/{name}/data"] = data
+
+
+def test_second_report_renders_only_changed_files(tmp_path, rendered):
+    paths = [str(tmp_path / "a.h5"), str(tmp_path / "b.h5")]
+    for seed, path in enumerate(paths):
+        _write_run(path, seed)
+
+    def build(path, force=False):
+        output = str(tmp_path / "out" / f"{os.path.basename(path)}.pdf")
+        return report.build_report([path], ["Boxplot over Time"], output, force)
+
+    for path in paths:
+        build(path)
+    assert rendered == [2, 2]
+    assert len(os.listdir(config.Report.page_dir)) == 4
+
+    with open(build(paths[0]), "rb") as file:
+        assert file.read(5) == b"%PDF-"
+    assert rendered[-1] == 0
+
+    stat = os.stat(paths[1])
+    os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    build(paths[0])
+    build(paths[1])
+    assert rendered[-2:] == [0, 2]
+
+    build(paths[0], force=True)
+    assert rendered[-1] == 2